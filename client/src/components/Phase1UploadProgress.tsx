@@ -26,12 +26,16 @@ import type { AxiosError } from 'axios';
 interface ProcessingJob {
   job_id: string;
   layer_id: string;
-  status: 'queued' | 'processing' | 'completed' | 'failed' | 'cancelled';
+  status: 'queued' | 'processing' | 'preview_ready' | 'completed' | 'failed' | 'cancelled';
   progress: number;
   metadata?: {
     original_filename?: string;
     cog_url?: string;
     png_url?: string;
+    // Coarse preview published while the full outputs are still processing
+    quicklook_url?: string;
+    // Smallest first; use these for lists and panels instead of png_url
+    thumbnails?: { size: number; width: number; height: number; url: string }[];
     bounds_wgs84?: [[number, number], [number, number]];
     width?: number;
     height?: number;
@@ -105,6 +109,7 @@ export default function Phase1UploadProgress({
       case 'queued':
         return <Clock className="h-4 w-4" />;
       case 'processing':
+      case 'preview_ready':
         return <Loader2 className="h-4 w-4 animate-spin" />;
       case 'completed':
         return <CheckCircle className="h-4 w-4 text-green-500" />;
@@ -122,6 +127,7 @@ export default function Phase1UploadProgress({
       case 'queued':
         return 'secondary';
       case 'processing':
+      case 'preview_ready':
         return 'default';
       case 'completed':
         return 'default';
@@ -187,6 +193,7 @@ export default function Phase1UploadProgress({
           <Badge variant={getStatusColor(jobData.status)}>
             {jobData.status === 'queued' && 'في الطابور'}
             {jobData.status === 'processing' && 'قيد المعالجة'}
+            {jobData.status === 'preview_ready' && 'معاينة أولية جاهزة'}
             {jobData.status === 'completed' && 'مكتملة'}
             {jobData.status === 'failed' && 'فشلت'}
             {jobData.status === 'cancelled' && 'ملغاة'}
@@ -196,7 +203,7 @@ export default function Phase1UploadProgress({
       
       <CardContent className="space-y-4">
         {/* Progress Bar */}
-        {jobData.status === 'processing' && (
+        {(jobData.status === 'processing' || jobData.status === 'preview_ready') && (
           <div className="space-y-2">
             <div className="flex justify-between text-sm text-muted-foreground">
               <span>التقدم</span>
@@ -206,6 +213,15 @@ export default function Phase1UploadProgress({
           </div>
         )}
 
+        {/* Quick-look until the full-resolution preview replaces it */}
+        {jobData.status === 'preview_ready' && jobData.metadata?.quicklook_url && (
+          <img
+            src={jobData.metadata.quicklook_url}
+            alt={jobData.metadata.original_filename || jobData.layer_id}
+            className="rounded border max-h-48"
+          />
+        )}
+
         {/* Metadata */}
         <div className="grid grid-cols-2 gap-4 text-sm">
           {jobData.metadata?.original_filename && (
@@ -255,10 +271,22 @@ export default function Phase1UploadProgress({
           </Alert>
         )}
 
+        {/* Layer thumbnail (smallest level, not the full preview) */}
+        {jobData.status === 'completed' && jobData.metadata?.thumbnails?.length ? (
+          <img
+            src={jobData.metadata.thumbnails[0].url}
+            width={jobData.metadata.thumbnails[0].width}
+            height={jobData.metadata.thumbnails[0].height}
+            alt={jobData.metadata.original_filename || jobData.layer_id}
+            className="rounded border"
+            loading="lazy"
+          />
+        ) : null}
+
         {/* Action Buttons */}
         {showControls && (
           <div className="flex gap-2 pt-2">
-            {jobData.status === 'processing' && (
+            {(jobData.status === 'processing' || jobData.status === 'preview_ready') && (
               <Button
                 variant="outline"
                 size="sm"
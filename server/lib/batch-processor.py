@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+معالج دفعي لملفات GeoTIFF/ZIP انطلاقاً من ملف بيان (JSON lines)
+يعالج مئات الطبقات في تشغيل واحد عبر مجمع عمليات بدل تشغيل مفسر لكل ملف
+
+الاستخدام:
+    python batch-processor.py <manifest.jsonl> <results.jsonl> [--processes N] [--resume]
+
+كل سطر في البيان: {"input": "...", "output": "...", "options": {...}}
+النتائج: سطر JSON لكل عنصر في results.jsonl فور انتهائه، والملخص سطر JSON واحد على stdout
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# المحرك المشترك مع عامل Celery (worker/raster_engine)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'worker'))
+from raster_engine.batch import PROCESSES, completed_ids, run_batch
+from raster_engine.events import emit_result, get_events, logs_to_stderr
+
+def main():
+    parser = argparse.ArgumentParser(description="معالجة دفعية لطبقات GeoTIFF/ZIP من ملف بيان")
+    parser.add_argument('manifest', help="ملف البيان (JSON lines: input, output, options)")
+    parser.add_argument('results', help="ملف النتائج (سطر JSON لكل عنصر)")
+    parser.add_argument('--processes', type=int, default=PROCESSES, help="عدد العمليات المتوازية")
+    parser.add_argument('--resume', action='store_true', help="تخطي العناصر الناجحة في ملف النتائج السابق")
+    args = parser.parse_args()
+
+    events = get_events()
+    results_path = Path(args.results)
+    skip = set()
+    if args.resume and results_path.exists():
+        with open(results_path, encoding='utf-8') as previous:
+            skip = completed_ids(previous)
+
+    # السجلات إلى stderr والأحداث إلى RASTER_EVENTS_FD والملخص وحده إلى stdout
+    with logs_to_stderr() as stdout:
+        events.start('batch-processor', args.manifest)
+        print(f"🚀 بدء المعالجة الدفعية: {args.manifest} ({args.processes} عملية)")
+        if skip:
+            print(f"⏭️ تخطي {len(skip)} عنصر ناجح من التشغيل السابق")
+
+        done = 0
+        with open(args.manifest, encoding='utf-8') as manifest, \
+                open(results_path, 'a' if args.resume else 'w', encoding='utf-8') as results:
+
+            def on_result(result):
+                nonlocal done
+                done += 1
+                results.write(json.dumps(result, ensure_ascii=False) + '\n')
+                results.flush()
+                if result['success']:
+                    print(f"✅ {result['id']} ({result.get('seconds', 0)}s)")
+                else:
+                    print(f"❌ {result['id']}: {result['error']}")
+                    events.warning(f"{result['id']}: {result['error']}")
+                events.emit('item', done=done, id=result['id'], success=result['success'])
+
+            summary = run_batch(manifest, on_result, processes=args.processes, skip=skip)
+
+        result = summary.as_dict()
+        result['results'] = str(results_path)
+        print(f"📊 الملخص: {result['succeeded']} ناجح، {result['failed']} فاشل، {result['skipped']} متخطى خلال {result['seconds']} ثانية")
+
+    emit_result(result, stdout)
+
+    if not result['success']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -5,27 +5,22 @@
 """
 import os
 import sys
-import json
 import zipfile
-import tempfile
 from pathlib import Path
-try:
-    from PIL import Image
-    import pyproj
-    # محاولة استيراد geotiff كبديل لـ rasterio
-    try:
-        from geotiff import GeoTiff
-        GEOTIFF_AVAILABLE = True
-    except ImportError:
-        GEOTIFF_AVAILABLE = False
-        print("تحذير: geotiff library غير متوفرة، سيتم استخدام معالجة بسيطة", file=sys.stderr)
-except ImportError as e:
-    print(f"خطأ في استيراد المكتبات المطلوبة: {e}", file=sys.stderr)
-    sys.exit(1)
+
+# المحرك المشترك مع عامل Celery (worker/raster_engine)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'worker'))
+from raster_engine.archive import GEOTIFF_EXTENSIONS, extract_geotiff
+from raster_engine.encoders import world_file_suffix
+from raster_engine.engine import ProcessOptions, process_raster
+from raster_engine.events import emit_result, get_events, logs_to_stderr
+from raster_engine.memprofile import attach_report, memory_profile
+from raster_engine.georef import as_crs, crs_label, write_prj
 
 class GeoTIFFPreprocessor:
-    def __init__(self, temp_dir=None):
-        self.temp_dir = temp_dir or tempfile.mkdtemp()
+    def __init__(self):
+        # الصورة تبقى على شبكتها الأصلية دون تمديد، وتحفظ RGB
+        self.options = ProcessOptions(target_crs=None, stretch='clip', color_mode='rgb')
         
     def process_zip_file(self, zip_path, output_dir):
         """
@@ -33,34 +28,18 @@ class GeoTIFFPreprocessor:
         التحويل إلى PNG + .pgw + .prj
         """
         print(f"🔄 بدء معالجة الملف: {zip_path}", file=sys.stderr)
+        events = get_events()
+        events.progress(5, 'inspect')
         
-        # فك ضغط الملف
-        extracted_dir = os.path.join(self.temp_dir, 'extracted')
-        os.makedirs(extracted_dir, exist_ok=True)
-        
+        # فحص شامل لمحتويات الـ ZIP دون فك ضغطها
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extracted_dir)
-            
-        # فحص شامل لمحتويات الـ ZIP
-        all_files = []
-        geotiff_files = []
-        reference_files = []
+            all_files = [name for name in zip_ref.namelist() if not name.endswith('/')]
         
-        for root, dirs, files in os.walk(extracted_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_lower = file.lower()
-                all_files.append(file)
-                
-                # البحث عن ملفات GeoTIFF
-                if file_lower.endswith(('.tif', '.tiff')):
-                    geotiff_files.append(file_path)
-                    
-                # البحث عن ملفات الإسناد الجغرافي
-                if file_lower.endswith(('.tfw', '.tifw', '.prj', '.wld')):
-                    reference_files.append(file_path)
+        # البحث عن ملفات GeoTIFF وملفات الإسناد الجغرافي
+        geotiff_files = [name for name in all_files if name.lower().endswith(GEOTIFF_EXTENSIONS)]
+        reference_files = [name for name in all_files if name.lower().endswith(('.tfw', '.tifw', '.prj', '.wld'))]
         
-        print(f"📋 محتويات الـ ZIP: {', '.join(all_files)}", file=sys.stderr)
+        print(f"📋 محتويات الـ ZIP: {', '.join(os.path.basename(name) for name in all_files)}", file=sys.stderr)
         print(f"📍 ملفات GeoTIFF: {len(geotiff_files)}", file=sys.stderr)
         print(f"🗺️ ملفات الإسناد: {len(reference_files)}", file=sys.stderr)
         
@@ -71,45 +50,36 @@ class GeoTIFFPreprocessor:
         # التحقق من وجود ملفات الإسناد الجغرافي (اختياري للاختبار)
         if not reference_files:
             print("⚠️ تحذير: لم يتم العثور على ملفات الإسناد الجغرافي (.prj/.tfw) - سيتم إنشاء ملف افتراضي", file=sys.stderr)
-                    
-        # اختيار أول ملف GeoTIFF
-        image_files = geotiff_files
+            events.warning("لم يتم العثور على ملفات الإسناد الجغرافي (.prj/.tfw)")
             
-        # معالجة أول ملف صورة
-        image_path = image_files[0]
-        print(f"📂 معالجة الملف: {os.path.basename(image_path)}", file=sys.stderr)
-        
-        return self._convert_image_to_png_with_world_file(image_path, output_dir)
+        # معالجة أول ملف صورة (يستخرج مع ملفات الإسناد المرافقة له فقط)
+        print(f"📂 معالجة الملف: {os.path.basename(geotiff_files[0])}", file=sys.stderr)
+        events.progress(10, 'extract', os.path.basename(geotiff_files[0]))
+        with extract_geotiff(zip_path, member=geotiff_files[0]) as image_path:
+            events.progress(20, 'render')
+            result = self._convert_image_to_png_with_world_file(image_path, output_dir)
+        events.progress(100, 'done')
+        return result
     
     def _convert_image_to_png_with_world_file(self, image_path, output_dir):
         """تحويل صورة إلى PNG + World File"""
         base_name = Path(image_path).stem
         
-        # قراءة الصورة الأساسية
-        with Image.open(image_path) as img:
-            # تحويل إلى RGB إذا كانت RGBA أو grayscale
-            if img.mode in ('RGBA', 'L', 'P'):
-                img = img.convert('RGB')
-                
-            # حفظ كـ PNG
-            png_path = os.path.join(output_dir, f"{base_name}.png")
-            img.save(png_path, 'PNG', optimize=True)
-            
-            width, height = img.size
-            print(f"📐 أبعاد الصورة: {width}x{height}", file=sys.stderr)
+        # القراءة والحفظ عبر المحرك المشترك (PNG افتراضياً، حسب إعدادات RASTER_OUTPUT_*)
+        raster, encoded = process_raster(image_path, output_dir, base_name, self.options)
+        png_path = encoded['path']
+        
+        width, height = raster.width, raster.height
+        print(f"📐 أبعاد الصورة: {width}x{height}", file=sys.stderr)
             
-        # استخراج معلومات جغرافية
-        if GEOTIFF_AVAILABLE and image_path.lower().endswith(('.tif', '.tiff')):
-            try:
-                geo_info = self._extract_geo_info_with_geotiff(image_path)
-            except Exception as e:
-                print(f"تحذير: فشل في استخراج البيانات الجغرافية: {e}", file=sys.stderr)
-                geo_info = self._create_default_geo_info(width, height)
+        # استخراج معلومات جغرافية من الملف نفسه، أو إنشاء معلومات افتراضية
+        if raster.crs is not None and not raster.transform.is_identity:
+            geo_info = self._extract_geo_info(raster)
         else:
             geo_info = self._create_default_geo_info(width, height)
             
         # إنشاء World File (.pgw)
-        pgw_path = os.path.join(output_dir, f"{base_name}.pgw")
+        pgw_path = os.path.join(output_dir, f"{base_name}{world_file_suffix(Path(png_path).suffix)}")
         self._create_world_file(pgw_path, geo_info, width, height)
         
         # إنشاء Projection File (.prj)
@@ -121,6 +91,7 @@ class GeoTIFFPreprocessor:
             'png_path': png_path,
             'pgw_path': pgw_path,
             'prj_path': prj_path,
+            'image_format': encoded['format'],
             'metadata': {
                 'filename': base_name,
                 'width': width,
@@ -131,60 +102,22 @@ class GeoTIFFPreprocessor:
             }
         }
         
-    def _extract_geo_info_with_geotiff(self, tiff_path):
-        """استخراج المعلومات الجغرافية باستخدام geotiff library"""
-        try:
-            from geotiff import GeoTiff
-            geo_tiff = GeoTiff(tiff_path)
-            
-            # استخراج التحويل الجغرافي
-            try:
-                # محاولة استخراج Bounding Box
-                if hasattr(geo_tiff, 'tif_bBox'):
-                    bbox = geo_tiff.tif_bBox
-                    x_min, y_min, x_max, y_max = bbox[0], bbox[1], bbox[2], bbox[3]
-                elif hasattr(geo_tiff, 'tif_bounding_box'):
-                    bbox = geo_tiff.tif_bounding_box
-                    x_min, y_max, x_max, y_min = bbox[0], bbox[1], bbox[2], bbox[3]
-                else:
-                    raise ValueError("لا يمكن استخراج Bounding Box من ملف GeoTIFF")
-                
-                # استخراج نظام الإحداثيات
-                crs_info = getattr(geo_tiff, 'crs_code', None)
-                if not crs_info and hasattr(geo_tiff, 'epsg'):
-                    crs_info = geo_tiff.epsg
-                
-                # حساب حجم البكسل
-                if hasattr(geo_tiff, 'tif_shape'):
-                    height, width = geo_tiff.tif_shape[:2]
-                    pixel_x = (x_max - x_min) / width
-                    pixel_y = (y_max - y_min) / height
-                else:
-                    pixel_x, pixel_y = 10, 10  # قيمة افتراضية
-                
-                return {
-                    'crs': f'EPSG:{crs_info}' if crs_info else 'EPSG:32638',
-                    'bounds': {
-                        'minX': x_min,
-                        'minY': y_min, 
-                        'maxX': x_max,
-                        'maxY': y_max
-                    },
-                    'pixel_size': {
-                        'x': pixel_x,
-                        'y': -pixel_y  # سالب لأن Y ينقص نحو الأسفل
-                    }
-                }
-            except Exception as extract_error:
-                print(f"⚠️ خطأ في استخراج البيانات من GeoTIFF: {extract_error}", file=sys.stderr)
-                raise
-                
-        except ImportError:
-            print("❌ مكتبة geotiff غير متوفرة", file=sys.stderr)
-            raise
-        except Exception as e:
-            print(f"❌ خطأ في قراءة GeoTIFF: {e}", file=sys.stderr)
-            raise
+    def _extract_geo_info(self, raster):
+        """المعلومات الجغرافية من الشبكة التي قرأها المحرك"""
+        x_min, y_min, x_max, y_max = raster.bounds
+        return {
+            'crs': crs_label(raster.crs),
+            'bounds': {
+                'minX': x_min,
+                'minY': y_min,
+                'maxX': x_max,
+                'maxY': y_max
+            },
+            'pixel_size': {
+                'x': raster.transform.a,
+                'y': -abs(raster.transform.e)  # سالب لأن Y ينقص نحو الأسفل
+            }
+        }
             
     def _create_default_geo_info(self, width, height):
         """إنشاء معلومات جغرافية افتراضية لليمن (UTM Zone 38N)"""
@@ -239,22 +172,13 @@ class GeoTIFFPreprocessor:
         
     def _create_projection_file(self, prj_path, crs):
         """إنشاء ملف الإسقاط (.prj)"""
-        # WKT for common CRS in Yemen
-        wkt_definitions = {
-            'EPSG:32638': '''PROJCS["WGS 84 / UTM zone 38N",GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.01745329251994328,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]],UNIT["metre",1,AUTHORITY["EPSG","9001"]],PROJECTION["Transverse_Mercator"],PARAMETER["latitude_of_origin",0],PARAMETER["central_meridian",45],PARAMETER["scale_factor",0.9996],PARAMETER["false_easting",500000],PARAMETER["false_northing",0],AUTHORITY["EPSG","32638"]]''',
-            'EPSG:4326': '''GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.01745329251994328,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]]'''
-        }
-        
-        wkt = wkt_definitions.get(crs, wkt_definitions['EPSG:32638'])
-        
-        with open(prj_path, 'w') as f:
-            f.write(wkt)
+        write_prj(prj_path, as_crs(crs))
             
         print(f"✅ تم إنشاء ملف الإسقاط: {prj_path}", file=sys.stderr)
 
 def main():
     if len(sys.argv) < 3:
-        print("الاستخدام: python geotiff-preprocessor.py <zip_path> <output_dir>")
+        print("الاستخدام: python geotiff-preprocessor.py <zip_path> <output_dir>", file=sys.stderr)
         sys.exit(1)
         
     zip_path = sys.argv[1]
@@ -264,18 +188,22 @@ def main():
     os.makedirs(output_dir, exist_ok=True)
     
     try:
-        processor = GeoTIFFPreprocessor()
-        result = processor.process_zip_file(zip_path, output_dir)
+        # السجلات إلى stderr والأحداث إلى RASTER_EVENTS_FD والنتيجة وحدها إلى stdout
+        with logs_to_stderr() as stdout, memory_profile() as memory:
+            get_events().start('geotiff-preprocessor', zip_path)
+            processor = GeoTIFFPreprocessor()
+            result = processor.process_zip_file(zip_path, output_dir)
         
         # إرجاع النتيجة كـ JSON
-        print(json.dumps(result))
+        emit_result(attach_report(result, memory), stdout)
         
     except Exception as e:
+        get_events().error(str(e))
         error_result = {
             'success': False,
             'error': str(e)
         }
-        print(json.dumps(error_result))
+        emit_result(error_result)
         sys.exit(1)
 
 if __name__ == "__main__":
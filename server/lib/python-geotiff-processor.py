@@ -4,69 +4,51 @@
 يستخرج الحدود الحقيقية والبيانات الوصفية من ملفات GeoTIFF
 """
 import sys
-import json
-import zipfile
-import tempfile
 import os
 from pathlib import Path
-import rasterio
-from rasterio.enums import Resampling
-import numpy as np
-from PIL import Image
+
+# المحرك المشترك مع عامل Celery (worker/raster_engine)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'worker'))
+from raster_engine.encoders import EncoderOptions, encode_pixels, format_for_path
+from raster_engine.engine import ProcessOptions, render_raster
+from raster_engine.events import emit_result, get_events, logs_to_stderr
+from raster_engine.memprofile import attach_report, memory_profile
+from raster_engine.metadata import dataset_path, read_metadata
 
 def extract_geotiff_metadata(zip_path):
     """استخراج البيانات الوصفية من ملف ZIP يحتوي على GeoTIFF"""
     try:
         print(f"🔍 Python - فتح ملف ZIP: {zip_path}", file=sys.stderr)
         
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            # البحث عن ملف TIFF/TIF
-            tiff_files = [f for f in zip_ref.namelist() 
-                         if f.lower().endswith(('.tif', '.tiff'))]
-            
-            if not tiff_files:
-                raise Exception("لا يوجد ملف GeoTIFF في الملف المضغوط")
-            
-            tiff_file = tiff_files[0]
-            print(f"📁 عثر على ملف: {tiff_file}", file=sys.stderr)
-            
-            # استخراج الملف مؤقتاً
-            with tempfile.TemporaryDirectory() as temp_dir:
-                zip_ref.extract(tiff_file, temp_dir)
-                tiff_path = os.path.join(temp_dir, tiff_file)
-                
-                # قراءة البيانات باستخدام rasterio
-                with rasterio.open(tiff_path) as dataset:
-                    print(f"📊 أبعاد الصورة: {dataset.width}x{dataset.height}", file=sys.stderr)
-                    print(f"🗺️ CRS: {dataset.crs}", file=sys.stderr)
-                    
-                    # استخراج الحدود (bounds)
-                    bounds = dataset.bounds
-                    transform = dataset.transform
-                    
-                    print(f"📍 حدود الصورة: {bounds}", file=sys.stderr)
-                    print(f"🔄 Transform: {transform}", file=sys.stderr)
-                    
-                    metadata = {
-                        'filename': os.path.splitext(tiff_file)[0],
-                        'width': dataset.width,
-                        'height': dataset.height,
-                        'crs': str(dataset.crs) if dataset.crs else 'UNKNOWN',
-                        'bounds': {
-                            'minX': float(bounds.left),
-                            'minY': float(bounds.bottom),
-                            'maxX': float(bounds.right),
-                            'maxY': float(bounds.top)
-                        },
-                        'transform': list(transform)[:6],  # أول 6 قيم من التحويل
-                        'pixel_size_x': abs(transform[0]),
-                        'pixel_size_y': abs(transform[4]),
-                        'band_count': dataset.count,
-                        'dtype': str(dataset.dtypes[0])
-                    }
-                    
-                    print(f"✅ تم استخراج البيانات بنجاح", file=sys.stderr)
-                    return metadata
+        # قراءة الترويسة فقط من داخل الأرشيف (بدون استخراج) مع ذاكرة تخزين دائمة
+        info = read_metadata(zip_path)
+        print(f"📁 عثر على ملف: {info['member']}", file=sys.stderr)
+        
+        print(f"📊 أبعاد الصورة: {info['width']}x{info['height']}", file=sys.stderr)
+        print(f"🗺️ CRS: {info['crs']}", file=sys.stderr)
+        print(f"📍 حدود الصورة: {info['bounds']}", file=sys.stderr)
+        
+        min_x, min_y, max_x, max_y = info['bounds']
+        metadata = {
+            'filename': os.path.splitext(os.path.basename(info['member']))[0],
+            'width': info['width'],
+            'height': info['height'],
+            'crs': info['crs'],
+            'bounds': {
+                'minX': min_x,
+                'minY': min_y,
+                'maxX': max_x,
+                'maxY': max_y
+            },
+            'transform': info['transform'],  # أول 6 قيم من التحويل
+            'pixel_size_x': info['pixel_size_x'],
+            'pixel_size_y': info['pixel_size_y'],
+            'band_count': info['band_count'],
+            'dtype': info['dtype']
+        }
+        
+        print(f"✅ تم استخراج البيانات بنجاح", file=sys.stderr)
+        return metadata
                     
     except Exception as e:
         print(f"❌ خطأ في معالجة الملف: {str(e)}", file=sys.stderr)
@@ -75,58 +57,28 @@ def extract_geotiff_metadata(zip_path):
 def create_preview_image(zip_path, output_path, max_size=1024):
     """إنشاء صورة معاينة مصغرة من GeoTIFF"""
     try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            tiff_files = [f for f in zip_ref.namelist() 
-                         if f.lower().endswith(('.tif', '.tiff'))]
-            
-            if not tiff_files:
-                raise Exception("لا يوجد ملف GeoTIFF")
-            
-            tiff_file = tiff_files[0]
-            
-            with tempfile.TemporaryDirectory() as temp_dir:
-                zip_ref.extract(tiff_file, temp_dir)
-                tiff_path = os.path.join(temp_dir, tiff_file)
-                
-                with rasterio.open(tiff_path) as dataset:
-                    # حساب عامل التصغير
-                    scale_factor = min(max_size / dataset.width, max_size / dataset.height)
-                    new_width = int(dataset.width * scale_factor)
-                    new_height = int(dataset.height * scale_factor)
-                    
-                    # قراءة البيانات مع إعادة التحجيم
-                    data = dataset.read(
-                        out_shape=(dataset.count, new_height, new_width),
-                        resampling=Resampling.bilinear
-                    )
-                    
-                    # تحويل إلى صورة
-                    if dataset.count == 1:
-                        # صورة بالأبيض والأسود
-                        img_array = data[0]
-                        img_array = ((img_array - img_array.min()) / (img_array.max() - img_array.min()) * 255).astype(np.uint8)
-                        image = Image.fromarray(img_array, mode='L')
-                    elif dataset.count >= 3:
-                        # صورة ملونة RGB
-                        img_array = np.transpose(data[:3], (1, 2, 0))
-                        # تطبيع القيم
-                        for i in range(3):
-                            band = img_array[:, :, i]
-                            img_array[:, :, i] = ((band - band.min()) / (band.max() - band.min()) * 255).astype(np.uint8)
-                        image = Image.fromarray(img_array.astype(np.uint8), mode='RGB')
-                    else:
-                        raise Exception("تنسيق الصورة غير مدعوم")
-                    
-                    # حفظ الصورة
-                    image.save(output_path, 'PNG', optimize=True)
-                    print(f"✅ تم إنشاء معاينة: {output_path}", file=sys.stderr)
-                    
-                    return {
-                        'preview_width': new_width,
-                        'preview_height': new_height,
-                        'original_width': dataset.width,
-                        'original_height': dataset.height
-                    }
+        # قراءة مصغرة على الشبكة الأصلية مع تمديد min/max
+        options = ProcessOptions(
+            target_crs=None,
+            stretch='minmax',
+            ignore_zero=False,
+            color_mode='auto',
+            max_size=max_size,
+        )
+        # القراءة مباشرة من داخل الأرشيف عبر /vsizip/
+        raster = render_raster(dataset_path(zip_path), options)
+        
+        # حفظ الصورة بالصيغة المطابقة لامتداد مسار الإخراج
+        encoded = encode_pixels(raster.pixels, output_path, EncoderOptions.from_env(format=format_for_path(output_path)))
+        print(f"✅ تم إنشاء معاينة: {output_path}", file=sys.stderr)
+        
+        return {
+            'preview_width': raster.width,
+            'preview_height': raster.height,
+            'original_width': raster.source['width'],
+            'original_height': raster.source['height'],
+            'image_format': encoded['format']
+        }
                     
     except Exception as e:
         print(f"❌ خطأ في إنشاء المعاينة: {str(e)}", file=sys.stderr)
@@ -134,27 +86,31 @@ def create_preview_image(zip_path, output_path, max_size=1024):
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
-        print("الاستخدام: python geotiff_processor.py <zip_path> <command> [args]")
+        print("الاستخدام: python geotiff_processor.py <zip_path> <command> [args]", file=sys.stderr)
         sys.exit(1)
     
     zip_path = sys.argv[1]
     command = sys.argv[2]
     
+    events = get_events()
     try:
-        if command == "metadata":
-            metadata = extract_geotiff_metadata(zip_path)
-            print(json.dumps(metadata, ensure_ascii=False, indent=2))
-        elif command == "preview":
-            if len(sys.argv) < 4:
-                print("الاستخدام: python geotiff_processor.py <zip_path> preview <output_path>")
+        # السجلات إلى stderr والأحداث إلى RASTER_EVENTS_FD والنتيجة وحدها إلى stdout (سطر JSON واحد)
+        with logs_to_stderr() as stdout, memory_profile() as memory:
+            events.start(f'python-geotiff-processor:{command}', zip_path)
+            if command == "metadata":
+                result = extract_geotiff_metadata(zip_path)
+            elif command == "preview":
+                if len(sys.argv) < 4:
+                    print("الاستخدام: python geotiff_processor.py <zip_path> preview <output_path>")
+                    sys.exit(1)
+                output_path = sys.argv[3]
+                result = create_preview_image(zip_path, output_path)
+            else:
+                print(f"أمر غير معروف: {command}")
                 sys.exit(1)
-            output_path = sys.argv[3]
-            preview_info = create_preview_image(zip_path, output_path)
-            print(json.dumps(preview_info, ensure_ascii=False, indent=2))
-        else:
-            print(f"أمر غير معروف: {command}")
-            sys.exit(1)
+        emit_result(attach_report(result, memory), stdout)
             
     except Exception as e:
         print(f"خطأ: {str(e)}", file=sys.stderr)
+        events.error(str(e))
         sys.exit(1)
\ No newline at end of file
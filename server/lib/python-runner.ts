@@ -0,0 +1,124 @@
+import { spawn } from 'child_process';
+
+/**
+ * حدث تقدم من معالجات server/lib (انظر worker/raster_engine/events.py)
+ * سطر JSON واحد لكل حدث على الواصف 3
+ */
+export interface ProcessorEvent {
+  event: 'start' | 'progress' | 'stage' | 'warning' | 'error' | 'result';
+  ts: number;
+  percent?: number;
+  stage?: string | null;
+  status?: 'start' | 'end';
+  seconds?: number;
+  message?: string | null;
+  success?: boolean;
+  data?: any;
+  [key: string]: any;
+}
+
+export interface RunPythonOptions {
+  onEvent?: (event: ProcessorEvent) => void;
+  logPrefix?: string;
+}
+
+// الواصف الذي يكتب عليه المعالج أحداثه (stdin=0, stdout=1, stderr=2)
+const EVENTS_FD = 3;
+
+// آخر جزء من stderr يُرفق برسالة الخطأ
+const STDERR_TAIL_CHARS = 4000;
+
+/**
+ * تقسيم تدفق نصي إلى أسطر كاملة دون تجميع كامل المخرجات
+ */
+function onLines(stream: NodeJS.ReadableStream, handle: (line: string) => void) {
+  let buffered = '';
+  stream.setEncoding('utf8');
+  stream.on('data', (chunk: string) => {
+    buffered += chunk;
+    let newline = buffered.indexOf('\n');
+    while (newline !== -1) {
+      const line = buffered.slice(0, newline).trim();
+      buffered = buffered.slice(newline + 1);
+      if (line) handle(line);
+      newline = buffered.indexOf('\n');
+    }
+  });
+  stream.on('end', () => {
+    const line = buffered.trim();
+    if (line) handle(line);
+  });
+}
+
+/**
+ * تشغيل معالج Python من server/lib وقراءة نتيجته
+ * - stdout: سطر JSON واحد هو النتيجة النهائية
+ * - stderr: سجلات للعرض فقط (تُمرر سطراً بسطر ولا يُحتفظ إلا بآخرها)
+ * - الواصف 3: أحداث NDJSON (تقدم، مراحل، تحذيرات) تُمرر إلى onEvent
+ */
+export function runPythonProcessor<T = any>(scriptPath: string, args: string[], options: RunPythonOptions = {}): Promise<T> {
+  const { onEvent, logPrefix = '🐍 Python' } = options;
+
+  return new Promise<T>((resolve, reject) => {
+    const pythonProcess = spawn('python3', [scriptPath, ...args], {
+      stdio: ['ignore', 'pipe', 'pipe', 'pipe'],
+      env: { ...process.env, PYTHONIOENCODING: 'utf-8', RASTER_EVENTS_FD: String(EVENTS_FD) }
+    });
+
+    let stdout = '';
+    let stderrTail = '';
+    let result: ProcessorEvent | null = null;
+
+    pythonProcess.stdout!.setEncoding('utf8');
+    pythonProcess.stdout!.on('data', (chunk: string) => {
+      stdout += chunk;
+    });
+
+    onLines(pythonProcess.stderr!, (line) => {
+      console.log(`${logPrefix}:`, line);
+      stderrTail = (stderrTail + line + '\n').slice(-STDERR_TAIL_CHARS);
+    });
+
+    onLines(pythonProcess.stdio[EVENTS_FD] as NodeJS.ReadableStream, (line) => {
+      let event: ProcessorEvent;
+      try {
+        event = JSON.parse(line);
+      } catch {
+        console.warn(`${logPrefix} حدث غير صالح:`, line);
+        return;
+      }
+      if (event.event === 'result') result = event;
+      if (onEvent) {
+        try {
+          onEvent(event);
+        } catch (error) {
+          console.warn(`${logPrefix} خطأ في معالج الحدث:`, error);
+        }
+      }
+    });
+
+    pythonProcess.on('close', (code) => {
+      // النتيجة من حدث result، أو من سطر stdout الأخير إن لم تُفتح قناة الأحداث
+      let data: any = result ? result.data : undefined;
+      if (data === undefined) {
+        const lines = stdout.trim().split('\n');
+        try {
+          data = JSON.parse(lines[lines.length - 1]);
+        } catch {
+          data = undefined;
+        }
+      }
+
+      if (code === 0 && data !== undefined) {
+        resolve(data as T);
+        return;
+      }
+      const message = (data && data.error) || stderrTail.trim() || `exit code ${code}`;
+      reject(new Error(`فشل في معالجة الملف: ${message}`));
+    });
+
+    pythonProcess.on('error', (error) => {
+      reject(new Error(`خطأ في تشغيل Python: ${error.message}`));
+    });
+  });
+}
@@ -6,157 +6,70 @@
 
 import sys
 import json
-import os
-import zipfile
-import tempfile
-import shutil
 from pathlib import Path
-from PIL import Image
-import rasterio
-from rasterio.warp import transform_bounds
-from pyproj import Transformer
-import numpy as np
+
+# المحرك المشترك مع عامل Celery (worker/raster_engine)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'worker'))
+from raster_engine.archive import GEOTIFF_EXTENSIONS, extract_geotiff
+from raster_engine.engine import ProcessOptions, process_raster
+from raster_engine.events import emit_result, get_events, logs_to_stderr
+from raster_engine.memprofile import attach_report, memory_profile
 
 class QGISWebProcessor:
     def __init__(self):
         # إعدادات المعالج
-        self.supported_formats = ['.tif', '.tiff', '.geotiff']
+        self.supported_formats = list(GEOTIFF_EXTENSIONS)
+        # الصورة تبقى على شبكتها الأصلية، والحدود فقط تحول إلى WGS84
+        self.options = ProcessOptions(
+            target_crs=None,
+            assume_crs='EPSG:32638',  # UTM Zone 38N لليمن عند غياب نظام الإحداثيات
+            stretch='clip',
+            color_mode='rgb',
+            fallback_bounds=(42.0, 12.0, 47.0, 17.0),  # حدود اليمن التقريبية
+        )
         
     def process_zip_file(self, zip_path: str, output_dir: str) -> dict:
         """المعالجة الرئيسية لملف ZIP"""
         try:
-            # 1. استخراج ملفات ZIP
-            geotiff_files = self._extract_and_find_geotiff(zip_path)
-            if not geotiff_files:
-                raise ValueError("لم يتم العثور على ملفات GeoTIFF في الأرشيف")
-            
-            # 2. معالجة أول ملف GeoTIFF
-            geotiff_path = geotiff_files[0]
-            
-            # 3. قراءة البيانات الجغرافية
-            with rasterio.open(geotiff_path) as src:
-                # قراءة نظام الإحداثيات الأصلي
-                original_crs = src.crs
-                bounds_utm = src.bounds
-                transform = src.transform
-                width = src.width
-                height = src.height
-                
-                print(f"📊 معلومات الملف: CRS={original_crs}, أبعاد={width}x{height}")
-                
-                # قراءة البيانات كصورة
-                image_data = src.read()
-                
-                # تحديد عدد القنوات
-                num_bands = image_data.shape[0]
-                print(f"📊 عدد القنوات: {num_bands}")
-                
-                # تحويل إلى RGB إذا لزم الأمر
-                if num_bands == 1:
-                    # Grayscale to RGB
-                    single_band = image_data[0]
-                    rgb_data = np.stack([single_band, single_band, single_band], axis=0)
-                elif num_bands >= 3:
-                    # استخدام أول 3 قنوات
-                    rgb_data = image_data[:3]
-                elif num_bands == 4:
-                    # RGBA - نتجاهل قناة Alpha
-                    rgb_data = image_data[:3]
-                else:
-                    # في حالة عدد قنوات غير عادي، نستخدم القناة الأولى
-                    single_band = image_data[0]
-                    rgb_data = np.stack([single_band, single_band, single_band], axis=0)
-            
-            # 4. تحويل الحدود من UTM إلى WGS84
-            bounds_wgs84 = self._convert_bounds_to_wgs84(bounds_utm, original_crs)
-            
-            # 5. حفظ الصورة كـ PNG
-            output_path = Path(output_dir)
-            output_path.mkdir(parents=True, exist_ok=True)
-            
-            png_filename = f"{Path(geotiff_path).stem}.png"
-            png_path = output_path / png_filename
-            
-            # تحويل البيانات إلى صيغة يمكن حفظها
-            rgb_normalized = np.transpose(rgb_data, (1, 2, 0))
-            rgb_normalized = np.clip(rgb_normalized, 0, 255).astype(np.uint8)
-            
-            # حفظ كـ PNG
-            pil_image = Image.fromarray(rgb_normalized)
-            pil_image.save(png_path, 'PNG', optimize=True)
-            
-            # 6. إعداد النتيجة النهائية
+            events = get_events()
+            # 1. استخراج أول ملف GeoTIFF من الأرشيف
+            events.progress(5, 'extract')
+            with extract_geotiff(zip_path) as geotiff_path:
+                # 2. القراءة والتحويل والحفظ عبر المحرك المشترك
+                events.progress(20, 'render')
+                output_path = Path(output_dir)
+                raster, encoded = process_raster(geotiff_path, output_path, geotiff_path.stem, self.options)
+            
+            source = raster.source
+            print(f"📊 معلومات الملف: CRS={source['crs']}, أبعاد={source['width']}x{source['height']}")
+            print(f"📊 عدد القنوات: {source['band_count']}")
+            
+            # 3. إعداد النتيجة النهائية
+            bounds_wgs84 = raster.bounds_wgs84  # [west, south, east, north]
             result = {
                 "success": True,
-                "png_file": png_filename,
+                "png_file": encoded['filename'],
+                "image_format": encoded['format'],
                 "bounds_wgs84": {
                     "southwest": [bounds_wgs84[1], bounds_wgs84[0]],  # [lat, lng]
                     "northeast": [bounds_wgs84[3], bounds_wgs84[2]]   # [lat, lng]
                 },
-                "bounds_array": [[bounds_wgs84[1], bounds_wgs84[0]], 
-                               [bounds_wgs84[3], bounds_wgs84[2]]],
-                "original_crs": str(original_crs),
-                "dimensions": {"width": width, "height": height},
+                "bounds_array": raster.leaflet_bounds,
+                "original_crs": source['crs'],
+                "dimensions": {"width": source['width'], "height": source['height']},
                 "output_directory": str(output_path),
-                "transform": list(transform)[:6]
+                "transform": source['transform']
             }
             
+            events.progress(100, 'done')
             return result
             
         except Exception as e:
+            get_events().error(str(e))
             return {
                 "success": False,
                 "error": str(e)
             }
-    
-    def _extract_and_find_geotiff(self, zip_path: str) -> list:
-        """استخراج الملفات والبحث عن GeoTIFF"""
-        temp_dir = tempfile.mkdtemp()
-        geotiff_files = []
-        
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            
-            # البحث عن ملفات GeoTIFF
-            for root, dirs, files in os.walk(temp_dir):
-                for file in files:
-                    if any(file.lower().endswith(ext) for ext in self.supported_formats):
-                        geotiff_files.append(os.path.join(root, file))
-            
-            return geotiff_files
-            
-        except Exception as e:
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-            raise e
-    
-    def _convert_bounds_to_wgs84(self, bounds_utm, original_crs):
-        """تحويل الحدود من UTM إلى WGS84"""
-        try:
-            # التعامل مع CRS فارغ أو غير صحيح
-            if original_crs is None or str(original_crs).strip() == '':
-                print("⚠️ نظام إحداثيات غير محدد، استخدام UTM Zone 38N لليمن")
-                original_crs = 'EPSG:32638'  # UTM Zone 38N for Yemen
-            
-            # إنشاء محول الإحداثيات
-            transformer = Transformer.from_crs(original_crs, 'EPSG:4326', always_xy=True)
-            
-            # تحويل الزوايا الأربع
-            min_x, min_y, max_x, max_y = bounds_utm
-            
-            # تحويل الزاوية السفلية اليسرى
-            sw_lng, sw_lat = transformer.transform(min_x, min_y)
-            
-            # تحويل الزاوية العلوية اليمنى  
-            ne_lng, ne_lat = transformer.transform(max_x, max_y)
-            
-            return [sw_lng, sw_lat, ne_lng, ne_lat]  # [west, south, east, north]
-            
-        except Exception as e:
-            # استخدام إحداثيات افتراضية لليمن للاختبار
-            print(f"⚠️ فشل تحويل الإحداثيات، استخدام حدود افتراضية لليمن: {e}")
-            return [42.0, 12.0, 47.0, 17.0]  # حدود اليمن التقريبية
 
 def main():
     """الدالة الرئيسية"""
@@ -165,16 +78,19 @@ def main():
             "success": False,
             "error": "Usage: python qgis-web-processor.py <input_zip> <output_dir>"
         }
-        print(json.dumps(error_result))
+        emit_result(error_result)
         sys.exit(1)
     
     input_zip = sys.argv[1]
     output_dir = sys.argv[2]
     
-    processor = QGISWebProcessor()
-    result = processor.process_zip_file(input_zip, output_dir)
+    # السجلات إلى stderr والأحداث إلى RASTER_EVENTS_FD والنتيجة وحدها إلى stdout
+    with logs_to_stderr() as stdout, memory_profile() as memory:
+        get_events().start('qgis-web-processor', input_zip)
+        processor = QGISWebProcessor()
+        result = processor.process_zip_file(input_zip, output_dir)
     
-    print(json.dumps(result))
+    emit_result(attach_report(result, memory), stdout)
     
     if not result["success"]:
         sys.exit(1)
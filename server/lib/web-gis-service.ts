@@ -1,6 +1,6 @@
-import { spawn } from 'child_process';
 import path from 'path';
 import fs from 'fs/promises';
+import { runPythonProcessor } from './python-runner';
 
 export interface WebGISResult {
   success: boolean;
@@ -36,83 +36,39 @@ export class WebGISService {
     
     const pythonScript = path.join(process.cwd(), 'server/lib/qgis-web-processor.py');
     
-    return new Promise((resolve, reject) => {
-      console.log('🐍 تشغيل معالج QGIS Web...');
-      
-      const pythonProcess = spawn('python3', [pythonScript, zipFilePath, layerOutputDir], {
-        stdio: ['pipe', 'pipe', 'pipe'],
-        env: { ...process.env, PYTHONIOENCODING: 'utf-8' }
-      });
-
-      let stdoutData = '';
-      let stderrData = '';
-
-      pythonProcess.stdout.on('data', (data) => {
-        stdoutData += data.toString();
-      });
+    console.log('🐍 تشغيل معالج QGIS Web...');
+    // stdout يحمل سطر النتيجة وحده؛ السجلات على stderr والتقدم على قناة الأحداث
+    const pythonResult = await runPythonProcessor(pythonScript, [zipFilePath, layerOutputDir], {
+      logPrefix: '🐍 Python'
+    });
 
-      pythonProcess.stderr.on('data', (data) => {
-        stderrData += data.toString();
-        console.log('🐍 Python:', data.toString().trim());
-      });
+    if (!pythonResult.success) {
+      console.error('❌ فشل في معالجة WebGIS:', pythonResult.error);
+      return {
+        success: false,
+        layerId: layerId,
+        error: pythonResult.error
+      };
+    }
 
-      pythonProcess.on('close', (code) => {
-        if (code === 0) {
-          try {
-            // استخراج JSON من المخرجات المختلطة
-            const jsonStartIndex = stdoutData.lastIndexOf('{');
-            if (jsonStartIndex === -1) {
-              throw new Error('لم يتم العثور على JSON في المخرجات');
-            }
-            
-            const jsonStr = stdoutData.substring(jsonStartIndex);
-            console.log('📋 JSON المستخرج:', jsonStr.substring(0, 200) + '...');
-            
-            const pythonResult = JSON.parse(jsonStr);
-            
-            if (pythonResult.success) {
-              const result: WebGISResult = {
-                success: true,
-                layerId: layerId,
-                pngFile: pythonResult.png_file,
-                boundsWGS84: pythonResult.bounds_wgs84,
-                boundsArray: pythonResult.bounds_array,
-                originalCRS: pythonResult.original_crs,
-                dimensions: pythonResult.dimensions,
-                outputDirectory: pythonResult.output_directory
-              };
-              
-              console.log('✅ WebGIS معالجة مكتملة:', {
-                layerId: result.layerId,
-                bounds: result.boundsWGS84,
-                dimensions: result.dimensions
-              });
-              
-              resolve(result);
-            } else {
-              console.error('❌ فشل في معالجة WebGIS:', pythonResult.error);
-              resolve({
-                success: false,
-                layerId: layerId,
-                error: pythonResult.error
-              });
-            }
-          } catch (error) {
-            console.error('❌ خطأ في تحليل نتيجة WebGIS:', error);
-            console.error('📄 المخرجات الخام:', stdoutData);
-            reject(new Error(`خطأ في تحليل النتيجة: ${error}`));
-          }
-        } else {
-          console.error('❌ فشل في معالجة WebGIS:', stderrData);
-          reject(new Error(`فشل في المعالجة: ${stderrData}`));
-        }
-      });
+    const result: WebGISResult = {
+      success: true,
+      layerId: layerId,
+      pngFile: pythonResult.png_file,
+      boundsWGS84: pythonResult.bounds_wgs84,
+      boundsArray: pythonResult.bounds_array,
+      originalCRS: pythonResult.original_crs,
+      dimensions: pythonResult.dimensions,
+      outputDirectory: pythonResult.output_directory
+    };
 
-      pythonProcess.on('error', (error) => {
-        console.error('❌ خطأ في تشغيل Python:', error);
-        reject(new Error(`خطأ في تشغيل Python: ${error.message}`));
-      });
+    console.log('✅ WebGIS معالجة مكتملة:', {
+      layerId: result.layerId,
+      bounds: result.boundsWGS84,
+      dimensions: result.dimensions
     });
+
+    return result;
   }
 
   /**
@@ -3,7 +3,6 @@ import multer from 'multer';
 import path from 'path';
 import fs from 'fs/promises';
 import fsSync from 'fs';
-import { spawn } from 'child_process';
 import cors from 'cors';
 import { 
   loadGlobalLayerStates, 
@@ -11,6 +10,7 @@ import {
   getLayerVisibilityState,
   cleanupOrphanedStates
 } from '../lib/layer-state-manager';
+import { runPythonProcessor } from '../lib/python-runner';
 
 const router = express.Router();
 
@@ -42,6 +42,10 @@ interface LayerState {
   height?: number;
   crs?: string;
   error?: string;
+  // آخر حدث تقدم من المعالج (أثناء المعالجة فقط)
+  progress?: number;
+  stage?: string;
+  warnings?: string[];
 }
 
 export const layerStates = new Map<string, LayerState>();
@@ -272,86 +276,25 @@ async function processLayerEnhanced(layerId: string, tempFilePath: string, origi
     const processorPath = path.join(process.cwd(), 'server', 'lib', 
       isZipFile ? 'zip-processor.py' : 'enhanced-geotiff-processor.py');
     
-    return new Promise<void>((resolve, reject) => {
-      const pythonProcess = spawn('python3', [
-        processorPath,
-        tempFilePath,
-        outputDir,
-        originalName
-      ], {
-        stdio: ['pipe', 'pipe', 'pipe'],
-        env: { ...process.env }
-      });
-
-      let stdout = '';
-      let stderr = '';
-
-      pythonProcess.stdout.on('data', (data) => {
-        stdout += data.toString();
-        console.log('🐍 Python stdout:', data.toString().trim());
-      });
-
-      pythonProcess.stderr.on('data', (data) => {
-        stderr += data.toString();
-        console.error('🐍 Python stderr:', data.toString().trim());
-      });
-
-      pythonProcess.on('close', async (code) => {
-        try {
-          if (code === 0) {
-            // Parse result from stdout
-            const lines = stdout.trim().split('\n');
-            const resultLine = lines.find(line => line.startsWith('SUCCESS:'));
-            
-            if (resultLine) {
-              const result = JSON.parse(resultLine.replace('SUCCESS:', ''));
-              
-              // Update layer state with processing results
-              layerStates.set(layerId, {
-                status: 'processed',
-                fileName: originalName,
-                fileSize: fileSize,
-                uploadDate: new Date().toISOString(),
-                imageUrl: `/api/gis/layers/${layerId}/image/${result.output_file}`,
-                bounds: result.bounds_wgs84,
-                width: result.width,
-                height: result.height,
-                crs: result.crs || 'EPSG:4326'
-              });
-              
-              console.log(`✅ معالجة ناجحة للطبقة: ${layerId}`);
-              resolve();
-            } else {
-              throw new Error('لم يتم العثور على نتيجة المعالجة');
-            }
-          } else {
-            throw new Error(`خطأ في المعالج Python: ${stderr}`);
-          }
-        } catch (error) {
-          layerStates.set(layerId, {
-            status: 'error',
-            fileName: originalName,
-            fileSize: fileSize,
-            uploadDate: new Date().toISOString(),
-            error: error instanceof Error ? error.message : 'خطأ غير معروف'
-          });
-          reject(error);
+    // التقدم يصل كأحداث NDJSON؛ النتيجة النهائية في metadata.json داخل مجلد الإخراج
+    await runPythonProcessor(processorPath, [tempFilePath, outputDir, originalName], {
+      onEvent: (event) => {
+        const state = layerStates.get(layerId);
+        if (!state || state.status !== 'processing') return;
+        if (event.event === 'progress') {
+          state.progress = event.percent;
+          if (event.stage) state.stage = event.stage;
+        } else if (event.event === 'stage' && event.status === 'start' && event.stage) {
+          state.stage = event.stage;
+        } else if (event.event === 'warning' && event.message) {
+          state.warnings = [...(state.warnings || []), event.message];
         }
-      });
-
-      pythonProcess.on('error', (error) => {
-        console.error('❌ خطأ في تشغيل Python:', error);
-        layerStates.set(layerId, {
-          status: 'error',
-          fileName: originalName,
-          fileSize: fileSize,
-          uploadDate: new Date().toISOString(),
-          error: `خطأ في تشغيل المعالج: ${error.message}`
-        });
-        reject(error);
-      });
+      }
     });
 
+    await finalizeLayerStateFromOutput(layerId, outputDir, originalName, fileSize);
+    console.log(`✅ معالجة ناجحة للطبقة: ${layerId}`);
+
   } catch (error) {
     console.error(`❌ خطأ في معالجة الطبقة ${layerId}:`, error);
     layerStates.set(layerId, {
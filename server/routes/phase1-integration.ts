@@ -164,6 +164,7 @@ router.get('/jobs/:jobId', async (req: Request, res: Response) => {
         id: jobData.layer_id,
         status: 'processed',
         image_url: jobData.metadata.png_url,
+        thumbnails: jobData.metadata.thumbnails || [],
         cog_url: jobData.metadata.cog_url,
         bounds_wgs84: jobData.metadata.bounds_wgs84,
         width: jobData.metadata.width,
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+COG tuning benchmark: trial-encode results for every candidate setting
+نتائج الترميز التجريبي لكل إعداد COG مرشح
+
+Usage:
+    python benchmarks/cog_tuning.py <raster> [--objective balanced] [--lossy] [--write] [--json]
+
+--write also writes full COGs with the default and the chosen settings and
+reports their real size and time.
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from raster_engine.cog import DEFAULT_SETTINGS, write_cog
+from raster_engine.cog_tuning import tune_cog
+
+def write_both(input_path, settings):
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, candidate in (('default', DEFAULT_SETTINGS), ('chosen', settings)):
+            output = Path(temp_dir) / f"{name}.tif"
+            start = time.perf_counter()
+            write_cog(input_path, output, candidate)
+            results.append({
+                'cog': name,
+                'settings': candidate.as_dict(),
+                'seconds': round(time.perf_counter() - start, 3),
+                'bytes': output.stat().st_size,
+            })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input')
+    parser.add_argument('--objective', default=None)
+    parser.add_argument('--lossy', action='store_true')
+    parser.add_argument('--write', action='store_true')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = tune_cog(args.input, args.objective, allow_lossy=args.lossy or None)
+    tuning_seconds = round(time.perf_counter() - start, 3)
+    written = write_both(args.input, result.settings) if args.write else []
+
+    if args.json:
+        print(json.dumps({
+            'tuning_seconds': tuning_seconds,
+            'chosen': result.as_metadata(),
+            'trials': result.trials,
+            'written': written,
+        }, indent=2))
+        return
+
+    print(f"size weight {result.objective}, tuning took {tuning_seconds}s")
+    print(f"{'compress':<10}{'predictor':>10}{'block':>7}{'KB':>10}{'seconds':>10}{'score':>9}")
+    for trial in sorted(result.trials, key=lambda trial: trial['score']):
+        settings = trial['settings']
+        print(
+            f"{settings['compress']:<10}{settings['predictor']:>10}{settings['blocksize']:>7}"
+            f"{trial['bytes'] / 1e3:>10.1f}{trial['seconds']:>10.4f}{trial['score']:>9}"
+        )
+    print(f"chosen: {result.settings.as_dict()}")
+    for row in written:
+        print(f"{row['cog']:<8}{row['seconds']:>8}s{row['bytes'] / 1e6:>10.2f} MB")
+
+if __name__ == '__main__':
+    main()
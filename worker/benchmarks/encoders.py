@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Encoder benchmark: encode time versus output size for each preview format
+مقارنة زمن الترميز مع حجم الملف لكل صيغة معاينة
+
+Usage:
+    python benchmarks/encoders.py [image_or_raster] [--size 8192] [--repeat 3] [--json]
+
+Without an input a synthetic orthophoto-like RGB image of --size x --size is used.
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from raster_engine.encoders import EncoderOptions, encode_image
+
+CANDIDATES = [
+    ('png legacy optimize=True', None),
+    ('png level 1', EncoderOptions(format='png', png_compress_level=1, parallel_min_pixels=1 << 62)),
+    ('png level 6', EncoderOptions(format='png', png_compress_level=6, parallel_min_pixels=1 << 62)),
+    ('png level 6 parallel', EncoderOptions(format='png', png_compress_level=6, parallel_min_pixels=0)),
+    ('png level 9 parallel', EncoderOptions(format='png', png_compress_level=9, parallel_min_pixels=0)),
+    ('webp lossless', EncoderOptions(format='webp', lossless=True)),
+    ('webp q80', EncoderOptions(format='webp', quality=80)),
+    ('jpeg q85', EncoderOptions(format='jpeg', quality=85)),
+]
+
+def synthetic_image(size: int) -> Image.Image:
+    """Smooth terrain-like gradients with fine texture, roughly how orthophotos compress"""
+    rng = np.random.default_rng(42)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    base = np.stack([
+        np.sin(x * 9) * np.cos(y * 7),
+        np.sin(x * 5 + y * 3),
+        np.cos(x * 4 - y * 8),
+    ], axis=-1)
+    texture = rng.normal(0, 0.08, size=(size, size, 3)).astype(np.float32)
+    pixels = np.clip((base + texture + 1) * 127.5, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels, 'RGB')
+
+def load_image(path: str) -> Image.Image:
+    if Path(path).suffix.lower() in ('.tif', '.tiff'):
+        import rasterio
+        with rasterio.open(path) as src:
+            data = src.read(list(range(1, min(src.count, 3) + 1)))
+        data = np.moveaxis(data, 0, -1)
+        if data.dtype != np.uint8:
+            low, high = np.percentile(data, [2, 98])
+            data = np.clip((data - low) / max(high - low, 1e-9) * 255, 0, 255).astype(np.uint8)
+        return Image.fromarray(data[..., 0] if data.shape[-1] == 1 else data)
+    return Image.open(path).convert('RGB')
+
+def run(image: Image.Image, repeat: int):
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, options in CANDIDATES:
+            timings = []
+            size = 0
+            for attempt in range(repeat):
+                output = Path(temp_dir) / f"bench_{attempt}"
+                start = time.perf_counter()
+                if options is None:
+                    image.save(output, 'PNG', optimize=True)
+                    size = output.stat().st_size
+                else:
+                    size = encode_image(image, output, replace(options))['bytes']
+                timings.append(time.perf_counter() - start)
+            results.append({
+                'encoder': name,
+                'seconds': round(min(timings), 3),
+                'bytes': size,
+                'megapixels_per_second': round(image.width * image.height / 1e6 / min(timings), 1),
+            })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?')
+    parser.add_argument('--size', type=int, default=8192)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    image = load_image(args.input) if args.input else synthetic_image(args.size)
+    results = run(image, args.repeat)
+
+    if args.json:
+        print(json.dumps({'width': image.width, 'height': image.height, 'results': results}, indent=2))
+        return
+
+    print(f"{image.width}x{image.height} {image.mode}")
+    print(f"{'encoder':<26}{'seconds':>10}{'MB':>10}{'MP/s':>10}")
+    for row in results:
+        print(f"{row['encoder']:<26}{row['seconds']:>10}{row['bytes'] / 1e6:>10.2f}{row['megapixels_per_second']:>10}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the dispatcher, the worker and the server/lib processors
+قياس زمن بدء التشغيل للموزع والعامل ومعالجات server/lib
+
+Each target starts in a fresh interpreter, --repeat times:
+- modules (dispatcher, signatures, tasks) are imported from worker/
+- processors are run with no arguments, so they import everything, print
+  their usage and exit
+
+Reported per target: best/median wall time, peak RSS, the heavy packages that
+got loaded and the slowest imports (python -X importtime, self time).
+
+Usage:
+    python benchmarks/import_time.py [--repeat 5] [--only dispatcher tasks] [--json out.json]
+    python benchmarks/import_time.py --compare baseline.json --max-regression 0.2
+
+With --compare the exit status is 1 when a target's median is more than
+--max-regression slower than in the baseline, or it loads a heavy package
+the baseline did not.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+WORKER_DIR = Path(__file__).resolve().parents[1]
+PROCESSORS_DIR = WORKER_DIR.parent / 'server' / 'lib'
+
+# Packages the dispatcher should never need
+HEAVY_PACKAGES = ('numpy', 'rasterio', 'PIL', 'pyproj', 'minio', 'fiona', 'shapely', 'raster_engine')
+
+MODULE_TARGETS = ('dispatcher', 'signatures', 'tasks')
+
+def targets():
+    found = {name: ['-c', f'import {name}'] for name in MODULE_TARGETS}
+    for script in sorted(PROCESSORS_DIR.glob('*.py')):
+        found[script.stem] = [str(script)]
+    return found
+
+def run_once(argv, importtime=False):
+    """Wall seconds, peak RSS (KB), exit code and stderr of one fresh interpreter"""
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + argv
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command, cwd=WORKER_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'},
+    )
+    stderr = process.stderr.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return seconds, usage.ru_maxrss, process.returncode, stderr
+
+def parse_importtime(stderr):
+    """(module, self µs, cumulative µs) for each 'import time:' line"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+def measure(name, argv, repeat, top):
+    # Warm the page cache and .pyc files so runs compare imports, not disk
+    run_once(argv)
+    runs = [run_once(argv) for _ in range(repeat)]
+    _, _, _, stderr = run_once(argv, importtime=True)
+    imports = parse_importtime(stderr)
+    loaded = {module.split('.')[0] for module, _, _ in imports}
+    # Processors exit non-zero after printing their usage; only a traceback is a failure
+    failed = stderr.strip().splitlines()[-1] if 'Traceback (most recent call last)' in stderr else None
+    seconds = [run[0] for run in runs]
+    return {
+        'target': name,
+        'best_ms': round(min(seconds) * 1000, 1),
+        'median_ms': round(statistics.median(seconds) * 1000, 1),
+        'peak_rss_mb': round(max(run[1] for run in runs) / 1024, 1),
+        'exit_codes': sorted({run[2] for run in runs}),
+        'import_ms': round(sum(self_us for _, self_us, _ in imports) / 1000, 1),
+        'heavy': [package for package in HEAVY_PACKAGES if package in loaded],
+        'slowest': [
+            {'module': module, 'self_ms': round(self_us / 1000, 1)}
+            for module, self_us, _ in sorted(imports, key=lambda item: item[1], reverse=True)[:top]
+        ],
+        'error': failed,
+    }
+
+def compare(results, baseline_path, max_regression):
+    baseline = {row['target']: row for row in json.loads(Path(baseline_path).read_text())}
+    regressions = []
+    for row in results:
+        before = baseline.get(row['target'])
+        if not before:
+            continue
+        if row['median_ms'] > before['median_ms'] * (1 + max_regression):
+            regressions.append(f"{row['target']}: {before['median_ms']} ms -> {row['median_ms']} ms")
+        new_heavy = set(row['heavy']) - set(before['heavy'])
+        if new_heavy:
+            regressions.append(f"{row['target']}: now imports {', '.join(sorted(new_heavy))}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help="Slowest imports listed per target")
+    parser.add_argument('--only', nargs='+', help="Target names (default: all)")
+    parser.add_argument('--json', type=Path, help="Write the results here (a baseline for --compare)")
+    parser.add_argument('--compare', type=Path, help="Baseline results to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    args = parser.parse_args()
+
+    available = targets()
+    names = args.only or list(available)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        parser.error(f"Unknown targets: {', '.join(unknown)} (available: {', '.join(available)})")
+
+    results = []
+    print(f"{'target':<30} {'best ms':>8} {'median ms':>10} {'RSS MB':>7}  heavy imports")
+    for name in names:
+        row = measure(name, available[name], args.repeat, args.top)
+        results.append(row)
+        heavy = ', '.join(row['heavy']) or '-'
+        print(f"{name:<30} {row['best_ms']:>8} {row['median_ms']:>10} {row['peak_rss_mb']:>7}  {heavy}")
+        if row['error']:
+            print(f"{'':<30} failed: {row['error']}")
+        for item in row['slowest']:
+            print(f"{'':<30} {item['self_ms']:>8}  {item['module']}")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    if args.compare:
+        regressions = compare(results, args.compare, args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
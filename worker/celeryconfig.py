@@ -43,6 +43,8 @@ task_queues = (
 )
 
 # Worker settings
+# Also read by raster_engine.parallel to split the CPUs between worker processes
+worker_concurrency = int(os.getenv('CELERY_WORKER_CONCURRENCY', '2'))
 worker_prefetch_multiplier = 1
 worker_max_tasks_per_child = 100
 worker_disable_rate_limits = False
@@ -4,21 +4,26 @@ Processing Dispatcher - FastAPI service for Phase 1
 """
 
 import os
+import time
 import uuid
 from datetime import datetime, timezone
 from typing import Optional, Dict, Any
 from pathlib import Path
 
 from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import structlog
+import redis
 
-from celery import Celery
-import tasks
-from models import JobResponse, JobStatus
+import metrics
+import jobstore
+import tracing
+from queue_monitor import QueueStatusCollector
+from models import JobEnqueueResponse, JobStatusResponse
+from signatures import app as celery_app, process_upload, processing_task_name
+from storage import STAGING_PREFIX, get_storage
 
 # Setup logging
 logger = structlog.get_logger()
@@ -30,186 +35,189 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Traces start here and continue in the workers (TRACING_EXPORTER)
+tracing.set_service_name('binaa-dispatcher')
+
 # Database connection
 DATABASE_URL = os.getenv('DATABASE_URL')
 
-# Celery client
-celery_app = Celery('binaa_processing')
-celery_app.config_from_object('celeryconfig')
+# processing_jobs / gis_layers access (JOB_STORE=memory runs without Postgres)
+job_store = jobstore.from_env(DATABASE_URL)
+
+# Uploaded files: 'shared' leaves them in UPLOADS_DIR, which the workers mount too;
+# 'storage' stages them in the layer storage (MinIO) so workers on any node can read them
+UPLOADS_DIR = Path(os.getenv('UPLOADS_DIR', '/app/uploads'))
+INPUT_STAGING = os.getenv('INPUT_STAGING', 'shared').lower()
+if INPUT_STAGING not in ('shared', 'storage'):
+    raise ValueError(f"Unknown INPUT_STAGING: {INPUT_STAGING}")
+
+# Direct broker connection for queue depth (no worker broadcast needed);
+# other brokers (e.g. memory:// in load tests) report no queue lengths
+broker_redis = (
+    redis.Redis.from_url(celery_app.conf.broker_url)
+    if celery_app.conf.broker_url.startswith(('redis://', 'rediss://'))
+    else None
+)
+
+# Cached queue status, refreshed in the background
+queue_status = QueueStatusCollector(
+    celery_app,
+    broker_redis,
+    job_store,
+    queue_interval=float(os.getenv('QUEUE_STATUS_REFRESH_SECONDS', '5')),
+    worker_interval=float(os.getenv('WORKER_STATUS_REFRESH_SECONDS', '30')),
+)
 
 # Models imported from models.py
 
 def init_database():
-    """Initialize database tables if they don't exist"""
+    """Bring the database schema up to date (see migrations/)"""
     try:
-        with psycopg2.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS processing_jobs (
-                        id VARCHAR(255) PRIMARY KEY,
-                        layer_id VARCHAR(255),
-                        status VARCHAR(50) NOT NULL DEFAULT 'queued',
-                        progress INTEGER NOT NULL DEFAULT 0,
-                        metadata JSONB,
-                        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                        INDEX(status),
-                        INDEX(created_at)
-                    );
-                """)
-                
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS gis_layers (
-                        id VARCHAR(255) PRIMARY KEY,
-                        filename VARCHAR(500),
-                        status VARCHAR(50) NOT NULL DEFAULT 'pending',
-                        image_url TEXT,
-                        cog_url TEXT,
-                        bounds_wgs84 JSONB,
-                        width INTEGER,
-                        height INTEGER,
-                        crs VARCHAR(100),
-                        metadata JSONB,
-                        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                        INDEX(status)
-                    );
-                """)
-                
-                conn.commit()
-                logger.info("Database tables initialized")
-                
+        applied = job_store.prepare()
+        logger.info(f"Database schema up to date ({len(applied)} migration(s) applied)")
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
         raise
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
+    """Initialize database and start the queue status collector"""
     init_database()
+    queue_status.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background collectors"""
+    queue_status.stop()
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "processing-dispatcher"}
 
-@app.post("/enqueue", response_model=JobResponse)
+@app.post("/enqueue", response_model=JobEnqueueResponse)
 async def enqueue_processing_job(
     file: UploadFile = File(...),
     layer_id: Optional[str] = None,
-    priority: str = "normal"
+    priority: str = "normal",
+    memory_profile: bool = False
 ):
     """
     Enqueue a file processing job
     إدراج مهمة معالجة ملف في الطابور
     """
-    try:
-        # Generate IDs
-        job_id = str(uuid.uuid4())
-        if not layer_id:
-            layer_id = f"layer_{int(datetime.now().timestamp())}_{uuid.uuid4().hex[:8]}"
+    with tracing.span('POST /enqueue', kind='server', root=True, priority=priority) as span:
+        try:
+            # Generate IDs
+            job_id = str(uuid.uuid4())
+            if not layer_id:
+                layer_id = f"layer_{int(datetime.now().timestamp())}_{uuid.uuid4().hex[:8]}"
+            span.set_attribute('job.id', job_id)
+            span.set_attribute('layer.id', layer_id)
+        
+            # Save uploaded file temporarily
+            UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
         
-        # Save uploaded file temporarily
-        uploads_dir = Path("/app/uploads")
-        uploads_dir.mkdir(exist_ok=True)
+            file_path = UPLOADS_DIR / f"{job_id}_{file.filename}"
         
-        file_path = uploads_dir / f"{job_id}_{file.filename}"
+            with tracing.span('upload.save') as save_span, open(file_path, "wb") as buffer:
+                content = await file.read()
+                buffer.write(content)
+                save_span.set_attribute('bytes', len(content))
         
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+            logger.info(f"Saved file: {file_path} ({len(content)} bytes)")
         
-        logger.info(f"Saved file: {file_path} ({len(content)} bytes)")
+            # Insert job record
+            job_store.create_job(
+                job_id,
+                layer_id,
+                file.filename,
+                {'original_filename': file.filename, 'file_size': len(content)}
+            )
         
-        # Insert job record
-        with psycopg2.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO processing_jobs (id, layer_id, status, progress, metadata)
-                    VALUES (%s, %s, 'queued', 0, %s)
-                """, (
-                    job_id, 
-                    layer_id, 
-                    {'original_filename': file.filename, 'file_size': len(content)}
-                ))
-                
-                cur.execute("""
-                    INSERT INTO gis_layers (id, filename, status)
-                    VALUES (%s, %s, 'processing')
-                    ON CONFLICT (id) DO UPDATE SET
-                        filename = EXCLUDED.filename,
-                        status = 'processing',
-                        updated_at = NOW()
-                """, (layer_id, file.filename))
-                
-                conn.commit()
+            # Determine file type and enqueue appropriate task
+            file_extension = Path(file.filename).suffix.lower()
         
-        # Determine file type and enqueue appropriate task
-        file_extension = Path(file.filename).suffix.lower()
+            queue = 'processing' if priority == 'normal' else 'high_priority'
+            # Read by the worker to measure enqueue-to-start latency
+            headers = {'enqueued_at': time.time(), 'input_bytes': len(content)}
+            if memory_profile:
+                # RSS curve and allocation hot spots, uploaded as layers/<layer_id>/memory_profile.json
+                headers['memory_profile'] = True
         
-        if file_extension in ['.tif', '.tiff']:
-            # GeoTIFF processing
-            task = tasks.process_geotiff.apply_async(
-                args=[job_id, str(file_path), layer_id, file.filename],
-                task_id=job_id,
-                queue='processing' if priority == 'normal' else 'high_priority'
-            )
-        elif file_extension == '.zip':
-            # ZIP archive processing
-            task = tasks.process_zip_archive.apply_async(
-                args=[job_id, str(file_path), layer_id, file.filename],
-                task_id=job_id,
-                queue='processing' if priority == 'normal' else 'high_priority'
-            )
-        else:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Unsupported file type: {file_extension}"
-            )
+            # Enqueued by name: the dispatcher does not load the task implementations
+            task_name = processing_task_name(file.filename)
+            if task_name is None:
+                raise HTTPException(
+                    status_code=400, 
+                    detail=f"Unsupported file type: {file_extension}"
+                )
         
-        logger.info(f"Enqueued job {job_id} for layer {layer_id}")
+            input_reference = str(file_path)
+            if INPUT_STAGING == 'storage':
+                try:
+                    with tracing.span('upload.stage', kind='client', bytes=len(content)):
+                        input_reference = await run_in_threadpool(
+                            get_storage().stage, str(file_path), f"{STAGING_PREFIX}/{job_id}/{file.filename}"
+                        )
+                except Exception as e:
+                    # No task will ever pick the job up; do not leave it queued
+                    job_store.update_job(job_id, 'failed', 0, {
+                        'original_filename': file.filename,
+                        'file_size': len(content),
+                        'error': f"Input staging failed: {e}",
+                    })
+                    raise
+                finally:
+                    file_path.unlink(missing_ok=True)
         
-        return JobResponse(
-            job_id=job_id,
-            status="queued",
-            message="Job successfully queued for processing",
-            layer_id=layer_id
-        )
+            # The publish span is the parent of the worker's queue-wait and task spans
+            with tracing.span('celery.publish', kind='producer', queue=queue, task=task_name):
+                process_upload(task_name, job_id, input_reference, layer_id, file.filename).apply_async(
+                    task_id=job_id,
+                    queue=queue,
+                    headers=tracing.inject(headers)
+                )
         
-    except Exception as e:
-        logger.error(f"Failed to enqueue job: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+            metrics.JOBS_ENQUEUED.labels(task=task_name, queue=queue).inc()
+            logger.info(f"Enqueued job {job_id} for layer {layer_id}")
+        
+            return JobEnqueueResponse(
+                job_id=job_id,
+                status="queued",
+                message="Job successfully queued for processing",
+                layer_id=layer_id
+            )
+        
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to enqueue job: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/jobs/{job_id}", response_model=JobStatus)
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
 async def get_job_status(job_id: str):
     """
     Get job status and progress
     الحصول على حالة وتقدم المهمة
     """
     try:
-        with psycopg2.connect(DATABASE_URL) as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT * FROM processing_jobs WHERE id = %s
-                """, (job_id,))
-                
-                job = cur.fetchone()
-                
-                if not job:
-                    raise HTTPException(status_code=404, detail="Job not found")
-                
-                return JobStatus(
-                    job_id=job['id'],
-                    status=job['status'],
-                    progress=job['progress'],
-                    metadata=job['metadata'],
-                    created_at=job['created_at'],
-                    updated_at=job['updated_at']
-                )
-                
-    except psycopg2.Error as e:
+        job = job_store.get_job(job_id)
+    except Exception as e:
         logger.error(f"Database error: {e}")
         raise HTTPException(status_code=500, detail="Database error")
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return JobStatusResponse(
+        job_id=job['id'],
+        status=job['status'],
+        progress=job['progress'],
+        metadata=job['metadata'],
+        created_at=job['created_at'],
+        updated_at=job['updated_at']
+    )
 
 @app.post("/jobs/{job_id}/cancel")
 async def cancel_job(job_id: str):
@@ -222,67 +230,47 @@ async def cancel_job(job_id: str):
         celery_app.control.revoke(job_id, terminate=True)
         
         # Update database
-        with psycopg2.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    UPDATE processing_jobs 
-                    SET status = 'cancelled', updated_at = NOW()
-                    WHERE id = %s AND status IN ('queued', 'processing')
-                """, (job_id,))
-                
-                if cur.rowcount == 0:
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="Job cannot be cancelled (not found or already completed)"
-                    )
-                
-                conn.commit()
-        
-        logger.info(f"Cancelled job {job_id}")
-        return {"message": "Job cancelled successfully"}
-        
+        cancelled = job_store.cancel_job(job_id)
     except Exception as e:
         logger.error(f"Failed to cancel job {job_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if not cancelled:
+        raise HTTPException(
+            status_code=400, 
+            detail="Job cannot be cancelled (not found or already completed)"
+        )
+    
+    logger.info(f"Cancelled job {job_id}")
+    return {"message": "Job cancelled successfully"}
 
 @app.get("/queue/status")
 async def get_queue_status():
     """
-    Get processing queue status and metrics
+    Get processing queue status and metrics (cached snapshot)
     الحصول على حالة ومقاييس طابور المعالجة
     """
-    try:
-        # Get Celery queue stats
-        inspect = celery_app.control.inspect()
-        stats = inspect.stats()
-        active_tasks = inspect.active()
-        
-        # Get database stats
-        with psycopg2.connect(DATABASE_URL) as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT 
-                        status,
-                        COUNT(*) as count
-                    FROM processing_jobs 
-                    WHERE created_at > NOW() - INTERVAL '24 hours'
-                    GROUP BY status
-                """)
-                
-                db_stats = {row['status']: row['count'] for row in cur.fetchall()}
-        
-        return {
-            "queue_stats": {
-                "worker_stats": stats,
-                "active_tasks": len(active_tasks.get(list(active_tasks.keys())[0], [])) if active_tasks else 0,
-                "job_counts_24h": db_stats
-            },
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-        
-    except Exception as e:
-        logger.error(f"Failed to get queue status: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    snapshot = queue_status.snapshot()
+    
+    return {
+        "queue_stats": {
+            "worker_stats": snapshot['worker_stats'],
+            "active_tasks": snapshot['active_tasks'],
+            "queue_lengths": snapshot['queue_lengths'],
+            "job_counts_24h": snapshot['job_counts_24h']
+        },
+        "refreshed_at": snapshot['refreshed_at'],
+        "errors": snapshot['errors'],
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus scrape endpoint (queue depth is kept fresh by the collector)
+    نقطة جمع مقاييس Prometheus
+    """
+    return Response(content=metrics.render_latest(), media_type=metrics.CONTENT_TYPE_LATEST)
 
 if __name__ == "__main__":
     import uvicorn
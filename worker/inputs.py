@@ -0,0 +1,187 @@
+"""
+Job Inputs for Phase 1 Processing Pipeline
+مدخلات المهام لخط معالجة المرحلة الأولى
+
+A task's input is either a path on a filesystem shared with the dispatcher
+(UPLOADS_DIR, the default) or a reference to an input staged in the layer
+storage (s3://bucket/key, or file:// for local storage; see storage.py).
+open_input() turns either into a path the task can read:
+
+- GeoTIFFs are read in place through GDAL's /vsis3/ (ranged requests; only
+  the blocks the pipeline reads are transferred)
+- ZIP archives are downloaded, since they are listed and extracted with zipfile
+- with INPUT_CACHE_DIR set, staged inputs are downloaded once per node and
+  kept (least recently used first out, up to INPUT_CACHE_MAX_BYTES), so
+  each step of the pipeline, and a redelivered task, reads a local file
+
+A staged input is deleted from the storage when its task completes or
+fails. Inputs of jobs that were cancelled or whose worker died are removed
+by cleanup_old_jobs once they are older than the job retention window.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+
+import structlog
+
+import tracing
+from storage import get_storage
+
+logger = structlog.get_logger()
+
+STAGED_SCHEMES = ('s3://', 'file://')
+
+# Read-ahead and block caching for /vsis3/ reads; the upload is a single file,
+# so GDAL need not list its "directory" looking for sidecars
+GDAL_STREAMING_CONFIG = {
+    'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR',
+    'CPL_VSIL_CURL_ALLOWED_EXTENSIONS': '.tif,.tiff,.zip',
+    'VSI_CACHE': 'TRUE',
+    'VSI_CACHE_SIZE': str(64 * 1024 * 1024),
+    'GDAL_HTTP_MERGE_CONSECUTIVE_RANGES': 'YES',
+    'GDAL_HTTP_MULTIPLEX': 'YES',
+}
+
+def is_staged(reference: str) -> bool:
+    return reference.startswith(STAGED_SCHEMES)
+
+def input_name(reference: str) -> str:
+    """File name of an input (the last path component)"""
+    return reference.rstrip('/').rsplit('/', 1)[-1]
+
+class InputCache:
+    """Downloaded inputs in one directory, evicted least recently used first"""
+
+    def __init__(self, directory, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def path_for(self, reference: str) -> Path:
+        digest = hashlib.sha1(reference.encode()).hexdigest()[:16]
+        return self.directory / f"{digest}_{input_name(reference)}"
+
+    def get(self, reference: str) -> Path:
+        path = self.path_for(reference)
+        if path.exists():
+            # mtime is the recency the eviction goes by
+            os.utime(path)
+            logger.info(f"Input cache hit: {reference}")
+            return path
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Download under a private name; the rename publishes it to other worker processes
+        fd, partial = tempfile.mkstemp(prefix='.partial_', dir=self.directory)
+        os.close(fd)
+        try:
+            fetch(reference, partial)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.unlink(partial)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep: Optional[Path] = None):
+        """Remove the least recently used inputs until the cache fits max_bytes"""
+        with self._lock:
+            entries = []
+            for path in self.directory.iterdir():
+                if path.name.startswith('.partial_'):
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                # Readers that already opened it keep their file until they close it
+                path.unlink(missing_ok=True)
+                total -= size
+
+_cache: Optional[InputCache] = None
+_gdal_configured = False
+
+def get_cache() -> Optional[InputCache]:
+    global _cache
+    directory = os.getenv('INPUT_CACHE_DIR')
+    if directory and _cache is None:
+        _cache = InputCache(directory, int(os.getenv('INPUT_CACHE_MAX_BYTES', str(20 * 1024 ** 3))))
+    return _cache
+
+def fetch(reference: str, local_path: str):
+    with tracing.span('storage.fetch', kind='client', input=reference) as span:
+        get_storage().fetch(reference, local_path)
+        span.set_attribute('bytes', os.path.getsize(local_path))
+
+def gdal_path(reference: str) -> str:
+    """Streamed path for a staged input; GDAL reads its configuration from the environment"""
+    global _gdal_configured
+    storage = get_storage()
+    if not _gdal_configured:
+        for key, value in {**GDAL_STREAMING_CONFIG, **storage.gdal_config()}.items():
+            os.environ.setdefault(key, value)
+        _gdal_configured = True
+    return storage.gdal_path(reference)
+
+@contextmanager
+def open_input(reference: str, local: bool = False) -> Iterator[str]:
+    """
+    Readable path for a task input. local=True guarantees a real file (needed
+    for zipfile); otherwise staged GeoTIFFs are streamed unless cached.
+    """
+    if not is_staged(reference):
+        yield reference
+        return
+
+    streamed = gdal_path(reference)
+    if not streamed.startswith('/vsi'):
+        # Local storage backend: already a file on this node
+        yield streamed
+        return
+
+    cache = get_cache()
+    if cache:
+        yield str(cache.get(reference))
+        return
+
+    if not local:
+        yield streamed
+        return
+
+    with tempfile.TemporaryDirectory(prefix='input_') as temp_dir:
+        path = Path(temp_dir) / input_name(reference)
+        fetch(reference, str(path))
+        yield str(path)
+
+def discard(reference: str):
+    """
+    Delete a staged input after its task completed or failed (tasks are not
+    retried). Shared-filesystem uploads are left alone.
+    """
+    if not is_staged(reference):
+        return
+    try:
+        get_storage().remove(reference)
+    except Exception as e:
+        logger.warning(f"Failed to remove staged input {reference}: {e}")
+
+def remove_expired(max_age: timedelta) -> int:
+    """
+    Delete staged inputs older than max_age: those of jobs cancelled mid-run or
+    lost with their worker, which never reached discard()
+    """
+    removed = get_storage().remove_staged(datetime.now(timezone.utc) - max_age)
+    if removed:
+        logger.info(f"Removed {removed} expired staged inputs")
+    return removed
@@ -0,0 +1,208 @@
+"""
+Job Store for Phase 1 Processing Pipeline
+مخزن حالة المهام لخط معالجة المرحلة الأولى
+
+The dispatcher's and the tasks' reads and writes of processing_jobs /
+gis_layers go through a JobStore. PostgresJobStore is the production store;
+MemoryJobStore keeps everything in the current process so the dispatcher or
+the whole pipeline can run with no database (load tests, run_local.py).
+JOB_STORE selects one: 'postgres' (default) or 'memory'.
+"""
+
+import json
+import os
+from abc import ABC, abstractmethod
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+import structlog
+
+import tracing
+from migrate import apply_migrations
+
+logger = structlog.get_logger()
+
+# Statuses a job can still be cancelled from
+CANCELLABLE_STATUSES = ('queued', 'processing', 'preview_ready')
+
+class JobStore(ABC):
+    """Job state persistence used by the dispatcher and the tasks"""
+
+    @abstractmethod
+    def prepare(self) -> List[str]:
+        """Bring the schema up to date; returns the migrations applied"""
+
+    @abstractmethod
+    def create_job(self, job_id: str, layer_id: str, filename: str, metadata: Dict[str, Any]):
+        """Insert a queued job and mark its layer processing"""
+
+    @abstractmethod
+    def update_job(self, job_id: str, status: str, progress: int, metadata: Dict[str, Any]):
+        """Set a job's state, creating the row if the dispatcher did not"""
+
+    @abstractmethod
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job's row, or None when there is none"""
+
+    @abstractmethod
+    def cancel_job(self, job_id: str) -> bool:
+        """Mark a job cancelled; False when it is missing or already finished"""
+
+    @abstractmethod
+    def job_counts_24h(self) -> Dict[str, int]:
+        """Jobs created in the last 24 hours, per status"""
+
+def _db_span(operation: str, **attributes):
+    """Client span for one job store call, inside the current trace"""
+    return tracing.span(f"db.{operation}", kind='client', **{'db.system': 'postgresql', **attributes})
+
+class PostgresJobStore(JobStore):
+    def __init__(self, database_url: Optional[str]):
+        self.database_url = database_url
+
+    def prepare(self) -> List[str]:
+        return apply_migrations(self.database_url)
+
+    def create_job(self, job_id: str, layer_id: str, filename: str, metadata: Dict[str, Any]):
+        with _db_span('create_job'), psycopg2.connect(self.database_url) as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO processing_jobs (id, layer_id, status, progress, metadata)
+                    VALUES (%s, %s, 'queued', 0, %s)
+                """, (job_id, layer_id, json.dumps(metadata)))
+
+                cur.execute("""
+                    INSERT INTO gis_layers (id, filename, status)
+                    VALUES (%s, %s, 'processing')
+                    ON CONFLICT (id) DO UPDATE SET
+                        filename = EXCLUDED.filename,
+                        status = 'processing',
+                        updated_at = NOW()
+                """, (layer_id, filename))
+
+                conn.commit()
+
+    def update_job(self, job_id: str, status: str, progress: int, metadata: Dict[str, Any]):
+        with _db_span('update_job', status=status, progress=progress), psycopg2.connect(self.database_url) as conn:
+            with conn.cursor() as cur:
+                values = (status, progress, json.dumps(metadata), datetime.now(timezone.utc), job_id)
+                # UPDATE-then-INSERT rather than ON CONFLICT (id): a partitioned
+                # processing_jobs has (id, created_at) as its primary key. The
+                # per-job lock (held until commit) keeps two updates of a missing
+                # job from both inserting it
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (job_id,))
+                cur.execute("""
+                    UPDATE processing_jobs
+                    SET status = %s, progress = %s, metadata = %s, updated_at = %s
+                    WHERE id = %s
+                """, values)
+                if cur.rowcount == 0:
+                    cur.execute("""
+                        INSERT INTO processing_jobs (status, progress, metadata, updated_at, id)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """, values)
+                conn.commit()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with _db_span('get_job'), psycopg2.connect(self.database_url) as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("""
+                    SELECT * FROM processing_jobs WHERE id = %s
+                """, (job_id,))
+                return cur.fetchone()
+
+    def cancel_job(self, job_id: str) -> bool:
+        with _db_span('cancel_job'), psycopg2.connect(self.database_url) as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE processing_jobs
+                    SET status = 'cancelled', updated_at = NOW()
+                    WHERE id = %s AND status IN %s
+                """, (job_id, CANCELLABLE_STATUSES))
+                conn.commit()
+                return cur.rowcount > 0
+
+    def job_counts_24h(self) -> Dict[str, int]:
+        with psycopg2.connect(self.database_url) as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("""
+                    SELECT
+                        status,
+                        SUM(job_count) as count
+                    FROM processing_job_rollups
+                    WHERE bucket > NOW() - INTERVAL '24 hours'
+                    GROUP BY status
+                    HAVING SUM(job_count) > 0
+                """)
+                return {row['status']: row['count'] for row in cur.fetchall()}
+
+class MemoryJobStore(JobStore):
+    """processing_jobs rows in a dict; lives and dies with the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._layers: Dict[str, Dict[str, Any]] = {}
+        # (monotonic seconds, status, progress) per job, for timing pipeline stages
+        self.history: Dict[str, List[Tuple[float, str, int]]] = {}
+
+    def prepare(self) -> List[str]:
+        # No schema to migrate
+        return []
+
+    def create_job(self, job_id: str, layer_id: str, filename: str, metadata: Dict[str, Any]):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            self._jobs[job_id] = {
+                'id': job_id,
+                'layer_id': layer_id,
+                'status': 'queued',
+                'progress': 0,
+                'metadata': dict(metadata),
+                'created_at': now,
+                'updated_at': now,
+            }
+            self._layers[layer_id] = {'id': layer_id, 'filename': filename, 'status': 'processing', 'updated_at': now}
+
+    def update_job(self, job_id: str, status: str, progress: int, metadata: Dict[str, Any]):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            job = self._jobs.setdefault(job_id, {'id': job_id, 'layer_id': None, 'created_at': now})
+            job.update(status=status, progress=progress, metadata=dict(metadata), updated_at=now)
+            self.history.setdefault(job_id, []).append((time.monotonic(), status, progress))
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def cancel_job(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job['status'] not in CANCELLABLE_STATUSES:
+                return False
+            job['status'] = 'cancelled'
+            job['updated_at'] = datetime.now(timezone.utc)
+            return True
+
+    def job_counts_24h(self) -> Dict[str, int]:
+        since = datetime.now(timezone.utc) - timedelta(hours=24)
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for job in self._jobs.values():
+                if job['created_at'] > since:
+                    counts[job['status']] = counts.get(job['status'], 0) + 1
+        return counts
+
+def from_env(database_url: Optional[str] = None) -> JobStore:
+    kind = os.getenv('JOB_STORE', 'postgres').lower()
+    if kind == 'memory':
+        logger.warning("Using the in-memory job store; jobs are lost when the dispatcher stops")
+        return MemoryJobStore()
+    if kind != 'postgres':
+        raise ValueError(f"Unknown JOB_STORE: {kind}")
+    return PostgresJobStore(database_url or os.getenv('DATABASE_URL'))
@@ -0,0 +1,201 @@
+"""
+Prometheus Metrics for Phase 1 Processing Pipeline
+مقاييس Prometheus لخط معالجة المرحلة الأولى
+
+Workers run under Celery's prefork pool, so every child process writes its
+samples to PROMETHEUS_MULTIPROC_DIR and the exposition side aggregates them
+with MultiProcessCollector. The variable must be set before this module is
+imported (docker-compose sets it for both the dispatcher and the workers).
+"""
+
+import os
+import time
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    CONTENT_TYPE_LATEST,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+import structlog
+
+logger = structlog.get_logger()
+
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', '9808'))
+
+# Celery's Redis transport stores prioritised messages under "<queue>\x06\x16<n>"
+PRIORITY_SEP = '\x06\x16'
+PRIORITY_STEPS = (0, 3, 6, 9)
+
+# Upper bound (bytes) -> label, checked in order
+FILE_SIZE_BUCKETS = (
+    (10 * 1024 ** 2, 'lt_10mb'),
+    (100 * 1024 ** 2, '10mb_100mb'),
+    (1024 ** 3, '100mb_1gb'),
+)
+
+# Metrics
+JOBS_ENQUEUED = Counter(
+    'binaa_jobs_enqueued_total',
+    'Jobs accepted by the dispatcher',
+    ['task', 'queue'],
+)
+QUEUE_DEPTH = Gauge(
+    'binaa_queue_depth',
+    'Messages waiting in each Celery queue',
+    ['queue'],
+    multiprocess_mode='mostrecent',
+)
+QUEUE_WAIT = Histogram(
+    'binaa_job_queue_wait_seconds',
+    'Time between enqueue in the dispatcher and task start in a worker',
+    ['task'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+PROCESSING_DURATION = Histogram(
+    'binaa_job_processing_seconds',
+    'Task execution time by input file size',
+    ['task', 'size_bucket', 'outcome'],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+)
+JOB_FAILURES = Counter(
+    'binaa_job_failures_total',
+    'Tasks that raised an exception',
+    ['task', 'exception'],
+)
+JOBS_IN_FLIGHT = Gauge(
+    'binaa_jobs_in_flight',
+    'Tasks currently executing',
+    ['task'],
+    multiprocess_mode='livesum',
+)
+JOBS_24H = Gauge(
+    'binaa_jobs_24h',
+    'Jobs created in the last 24 hours by status',
+    ['status'],
+    multiprocess_mode='mostrecent',
+)
+JOB_AVG_DURATION_24H = Gauge(
+    'binaa_job_avg_duration_24h_seconds',
+    'Average job duration over the last 24 hours by status',
+    ['status'],
+    multiprocess_mode='mostrecent',
+)
+
+def file_size_bucket(size_bytes: Optional[int]) -> str:
+    """Map a file size to a low-cardinality histogram label"""
+    if size_bytes is None:
+        return 'unknown'
+    for upper, label in FILE_SIZE_BUCKETS:
+        if size_bytes < upper:
+            return label
+    return 'gt_1gb'
+
+def build_registry() -> CollectorRegistry:
+    """Registry to expose: aggregated across processes when multiprocess mode is on"""
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def render_latest() -> bytes:
+    """Render all metrics in the Prometheus text format"""
+    return generate_latest(build_registry())
+
+def refresh_queue_depths(redis_client, queues: Iterable[str]) -> Dict[str, int]:
+    """Read queue lengths straight from the Redis broker and publish them"""
+    queues = list(queues)
+    pipe = redis_client.pipeline(transaction=False)
+    for queue in queues:
+        for step in PRIORITY_STEPS:
+            pipe.llen(queue if step == 0 else f"{queue}{PRIORITY_SEP}{step}")
+    lengths = pipe.execute()
+
+    depths = {}
+    per_queue = len(PRIORITY_STEPS)
+    for index, queue in enumerate(queues):
+        depths[queue] = sum(lengths[index * per_queue:(index + 1) * per_queue])
+        QUEUE_DEPTH.labels(queue=queue).set(depths[queue])
+    return depths
+
+def record_job_counts(stats: Dict[str, Dict[str, Any]]):
+    """Publish the 24h per-status counts computed by update_processing_statistics"""
+    for status, values in stats.items():
+        JOBS_24H.labels(status=status).set(values.get('count') or 0)
+        JOB_AVG_DURATION_24H.labels(status=status).set(float(values.get('avg_duration') or 0))
+
+# Worker-side instrumentation (Celery signals)
+
+_task_started: Dict[str, tuple] = {}
+
+def request_header(task, name: str):
+    """Custom message headers surface either on the request or under request.headers"""
+    value = getattr(task.request, name, None)
+    if value is None:
+        value = (getattr(task.request, 'headers', None) or {}).get(name)
+    return value
+
+def _input_size(args) -> Optional[int]:
+    """Input file size for processing tasks (input path is the second argument)"""
+    if not args or len(args) < 2 or not isinstance(args[1], str):
+        return None
+    try:
+        return os.path.getsize(args[1])
+    except OSError:
+        return None
+
+def on_task_prerun(task_id=None, task=None, args=None, **_):
+    enqueued_at = request_header(task, 'enqueued_at')
+    if enqueued_at:
+        QUEUE_WAIT.labels(task=task.name).observe(max(0.0, time.time() - float(enqueued_at)))
+
+    JOBS_IN_FLIGHT.labels(task=task.name).inc()
+    # Staged inputs are not local files; the dispatcher sends their size along
+    size = _input_size(args) or request_header(task, 'input_bytes')
+    _task_started[task_id] = (time.monotonic(), file_size_bucket(size))
+
+def on_task_postrun(task_id=None, task=None, state=None, **_):
+    JOBS_IN_FLIGHT.labels(task=task.name).dec()
+    started = _task_started.pop(task_id, None)
+    if started:
+        start, size_bucket = started
+        PROCESSING_DURATION.labels(
+            task=task.name,
+            size_bucket=size_bucket,
+            outcome='success' if state == 'SUCCESS' else 'failure'
+        ).observe(time.monotonic() - start)
+
+def on_task_failure(sender=None, exception=None, **_):
+    JOB_FAILURES.labels(task=sender.name, exception=type(exception).__name__).inc()
+
+def on_worker_init(**_):
+    """Reset stale multiprocess files and expose the aggregated registry"""
+    if MULTIPROC_DIR:
+        shutil.rmtree(MULTIPROC_DIR, ignore_errors=True)
+        Path(MULTIPROC_DIR).mkdir(parents=True, exist_ok=True)
+    start_http_server(WORKER_METRICS_PORT, registry=build_registry())
+    logger.info(f"Worker metrics exposed on :{WORKER_METRICS_PORT}")
+
+def on_worker_process_shutdown(pid=None, **_):
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+def connect_worker_signals():
+    """Attach the task instrumentation to Celery's signals"""
+    from celery import signals
+
+    signals.task_prerun.connect(on_task_prerun, weak=False)
+    signals.task_postrun.connect(on_task_postrun, weak=False)
+    signals.task_failure.connect(on_task_failure, weak=False)
+    signals.worker_init.connect(on_worker_init, weak=False)
+    signals.worker_process_shutdown.connect(on_worker_process_shutdown, weak=False)
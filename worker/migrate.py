@@ -0,0 +1,61 @@
+"""
+Schema Migrations for Phase 1 Processing Pipeline
+ترحيلات مخطط قاعدة البيانات لخط معالجة المرحلة الأولى
+
+Applies worker/migrations/*.sql in filename order, each in its own
+transaction, and records applied versions in schema_migrations. An advisory
+lock keeps concurrently starting dispatchers from racing each other.
+"""
+
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import psycopg2
+import structlog
+
+logger = structlog.get_logger()
+
+MIGRATIONS_DIR = Path(__file__).parent / 'migrations'
+MIGRATION_LOCK_ID = 7_200_101
+
+def pending_migrations(applied: set) -> List[Path]:
+    """Migration files not yet recorded in schema_migrations"""
+    return [path for path in sorted(MIGRATIONS_DIR.glob('*.sql')) if path.stem not in applied]
+
+def apply_migrations(database_url: Optional[str]) -> List[str]:
+    """Apply all pending migrations and return their versions"""
+    applied_now = []
+    with psycopg2.connect(database_url) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            try:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version VARCHAR(255) PRIMARY KEY,
+                        applied_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                    )
+                """)
+                conn.commit()
+
+                cur.execute("SELECT version FROM schema_migrations")
+                applied = {row[0] for row in cur.fetchall()}
+
+                for path in pending_migrations(applied):
+                    logger.info(f"Applying migration {path.name}")
+                    cur.execute(path.read_text(encoding='utf-8'))
+                    cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (path.stem,))
+                    conn.commit()
+                    applied_now.append(path.stem)
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+                conn.commit()
+
+    return applied_now
+
+if __name__ == '__main__':
+    versions = apply_migrations(os.getenv('DATABASE_URL'))
+    print(f"Applied {len(versions)} migration(s): {', '.join(versions) or '-'}")
@@ -0,0 +1,32 @@
+-- Phase 1 processing tables
+-- Replaces the MySQL-style inline INDEX(...) clauses previously in init_database
+
+CREATE TABLE IF NOT EXISTS processing_jobs (
+    id VARCHAR(255) PRIMARY KEY,
+    layer_id VARCHAR(255),
+    status VARCHAR(50) NOT NULL DEFAULT 'queued',
+    progress INTEGER NOT NULL DEFAULT 0,
+    metadata JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_processing_jobs_status ON processing_jobs(status);
+CREATE INDEX IF NOT EXISTS idx_processing_jobs_created_at ON processing_jobs(created_at);
+
+CREATE TABLE IF NOT EXISTS gis_layers (
+    id VARCHAR(255) PRIMARY KEY,
+    filename VARCHAR(500),
+    status VARCHAR(50) NOT NULL DEFAULT 'pending',
+    image_url TEXT,
+    cog_url TEXT,
+    bounds_wgs84 JSONB,
+    width INTEGER,
+    height INTEGER,
+    crs VARCHAR(100),
+    metadata JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_gis_layers_status ON gis_layers(status);
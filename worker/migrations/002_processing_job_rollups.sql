@@ -0,0 +1,85 @@
+-- Indexes for the status/time queries and per-minute rollups of processing_jobs
+-- Statistics read processing_job_rollups (O(buckets)) instead of scanning jobs
+
+-- (status, created_at) serves status filters and 24h windows; it supersedes the single-column status index
+CREATE INDEX IF NOT EXISTS idx_processing_jobs_status_created_at ON processing_jobs(status, created_at);
+DROP INDEX IF EXISTS idx_processing_jobs_status;
+CREATE INDEX IF NOT EXISTS idx_processing_jobs_layer_id ON processing_jobs(layer_id);
+
+-- Small partial index for the live part of the queue
+CREATE INDEX IF NOT EXISTS idx_processing_jobs_active
+    ON processing_jobs(created_at)
+    WHERE status IN ('queued', 'processing');
+
+-- One row per (minute of created_at, current status)
+-- total_duration_seconds sums (updated_at - created_at) of the jobs counted in the row
+CREATE TABLE IF NOT EXISTS processing_job_rollups (
+    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    job_count INTEGER NOT NULL DEFAULT 0,
+    total_duration_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, status)
+);
+
+CREATE OR REPLACE FUNCTION apply_processing_job_rollup(
+    job_created_at TIMESTAMP WITH TIME ZONE,
+    job_updated_at TIMESTAMP WITH TIME ZONE,
+    job_status VARCHAR,
+    direction INTEGER
+) RETURNS VOID AS $$
+BEGIN
+    IF job_created_at IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO processing_job_rollups AS r (bucket, status, job_count, total_duration_seconds)
+    VALUES (
+        date_trunc('minute', job_created_at),
+        job_status,
+        direction,
+        direction * COALESCE(EXTRACT(EPOCH FROM (job_updated_at - job_created_at)), 0)
+    )
+    ON CONFLICT (bucket, status) DO UPDATE SET
+        job_count = r.job_count + EXCLUDED.job_count,
+        total_duration_seconds = r.total_duration_seconds + EXCLUDED.total_duration_seconds;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Moves a job between rollup rows as its status/updated_at change.
+-- Deletes are deliberately not tracked: rollups keep history after retention removes jobs.
+CREATE OR REPLACE FUNCTION processing_jobs_rollup_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        IF OLD.status IS NOT DISTINCT FROM NEW.status
+           AND OLD.created_at IS NOT DISTINCT FROM NEW.created_at
+           AND OLD.updated_at IS NOT DISTINCT FROM NEW.updated_at THEN
+            RETURN NULL;
+        END IF;
+        PERFORM apply_processing_job_rollup(OLD.created_at, OLD.updated_at, OLD.status, -1);
+    END IF;
+
+    PERFORM apply_processing_job_rollup(NEW.created_at, NEW.updated_at, NEW.status, 1);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill and attach the trigger without letting writes slip in between
+LOCK TABLE processing_jobs IN SHARE ROW EXCLUSIVE MODE;
+
+INSERT INTO processing_job_rollups (bucket, status, job_count, total_duration_seconds)
+SELECT
+    date_trunc('minute', created_at),
+    status,
+    COUNT(*),
+    COALESCE(SUM(EXTRACT(EPOCH FROM (updated_at - created_at))), 0)
+FROM processing_jobs
+WHERE created_at IS NOT NULL
+GROUP BY 1, 2
+ON CONFLICT (bucket, status) DO NOTHING;
+
+DROP TRIGGER IF EXISTS processing_jobs_rollup ON processing_jobs;
+CREATE TRIGGER processing_jobs_rollup
+    AFTER INSERT OR UPDATE ON processing_jobs
+    FOR EACH ROW
+    EXECUTE FUNCTION processing_jobs_rollup_trigger();
@@ -0,0 +1,4 @@
+-- Supports batched retention deletes on an unpartitioned processing_jobs
+CREATE INDEX IF NOT EXISTS idx_processing_jobs_finished_updated_at
+    ON processing_jobs(updated_at)
+    WHERE status IN ('completed', 'failed', 'cancelled');
@@ -0,0 +1,5 @@
+-- Jobs with a published quick-look (status 'preview_ready') are still live
+DROP INDEX IF EXISTS idx_processing_jobs_active;
+CREATE INDEX IF NOT EXISTS idx_processing_jobs_active
+    ON processing_jobs(created_at)
+    WHERE status IN ('queued', 'processing', 'preview_ready');
@@ -12,6 +12,8 @@ class JobStatus(str, Enum):
     """Job processing status enumeration"""
     QUEUED = "queued"
     PROCESSING = "processing"
+    # Quick-look published; full-resolution outputs still processing
+    PREVIEW_READY = "preview_ready"
     COMPLETED = "completed"
     FAILED = "failed"
     CANCELLED = "cancelled"
@@ -62,6 +64,15 @@ class JobEnqueueResponse(BaseModel):
     status: str
     message: str
 
+class JobStatusResponse(BaseModel):
+    """Job status response model"""
+    job_id: str
+    status: JobStatus
+    progress: int
+    metadata: Optional[Dict[str, Any]] = None
+    created_at: datetime
+    updated_at: datetime
+
 class QueueStats(BaseModel):
     """Processing queue statistics"""
     active_workers: int
@@ -0,0 +1,107 @@
+"""
+Profiling helpers for Phase 1 Processing Pipeline
+أدوات تحليل الأداء لخط معالجة المرحلة الأولى
+
+StackSampler records the Python stack of every thread at a fixed interval
+and writes them in the folded format ("frame;frame;frame count" per line)
+read by flamegraph.pl, speedscope and inferno. Unlike cProfile it sees the
+raster thread pool and time spent inside GDAL/NumPy calls (attributed to the
+calling Python frame), at a cost that does not grow with the call count.
+Child processes (the tiled warp) are not sampled; use py-spy --subprocesses
+for those.
+"""
+
+import cProfile
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+class StackSampler:
+    """Folded stack counts of all threads, sampled every `interval` seconds"""
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                # Pool threads waiting for work only add noise
+                if not self.include_idle and stack and stack[0].startswith(('wait (', '_worker (', 'select (')):
+                    continue
+                stack.append(names.get(ident, f'thread-{ident}'))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_folded(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+@contextmanager
+def profiled(
+    cprofile_path=None,
+    folded_path=None,
+    interval: float = 0.005,
+    top: int = 0,
+) -> Iterator[dict]:
+    """
+    cProfile and/or stack sampling around a block; yields a dict that receives
+    the wall time and sample count when the block exits
+    """
+    profile = cProfile.Profile() if cprofile_path or top else None
+    sampler = StackSampler(interval) if folded_path else None
+    stats = {}
+    if sampler:
+        sampler.start()
+    if profile:
+        profile.enable()
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats['seconds'] = round(time.perf_counter() - start, 3)
+        if profile:
+            profile.disable()
+            if cprofile_path:
+                profile.dump_stats(str(cprofile_path))
+            if top:
+                pstats.Stats(profile, stream=sys.stderr).sort_stats('cumulative').print_stats(top)
+        if sampler:
+            sampler.stop()
+            sampler.write_folded(folded_path)
+            stats['samples'] = sampler.samples
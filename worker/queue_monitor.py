@@ -0,0 +1,119 @@
+"""
+Queue Status Collector for Phase 1 Processing Pipeline
+جامع حالة الطوابير لخط معالجة المرحلة الأولى
+
+Refreshes queue, worker and job-count snapshots on a background thread so
+GET /queue/status only copies a dict. Queue lengths come straight from the
+Redis broker; the worker broadcast (inspect) runs on a slower interval since
+it waits for every worker to reply.
+"""
+
+import copy
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import structlog
+
+import metrics
+
+logger = structlog.get_logger()
+
+class QueueStatusCollector:
+    """Background refresher holding the latest queue status snapshot"""
+
+    def __init__(
+        self,
+        celery_app,
+        redis_client,
+        job_store,
+        queue_interval: float = 5.0,
+        worker_interval: float = 30.0,
+        inspect_timeout: float = 1.0,
+    ):
+        self.celery_app = celery_app
+        self.redis_client = redis_client
+        self.job_store = job_store
+        self.queue_interval = queue_interval
+        self.worker_interval = worker_interval
+        self.inspect_timeout = inspect_timeout
+        self.queues = [queue.name for queue in celery_app.conf.task_queues]
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_worker_refresh = 0.0
+        self._snapshot: Dict[str, Any] = {
+            'queue_lengths': {},
+            'worker_stats': {},
+            'active_tasks': 0,
+            'job_counts_24h': {},
+            'refreshed_at': {},
+            'errors': {},
+        }
+
+    def start(self):
+        """Take a first snapshot synchronously, then keep refreshing in the background"""
+        if self._thread and self._thread.is_alive():
+            return
+        self.refresh(include_workers=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='queue-status-collector', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.inspect_timeout + self.queue_interval)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Latest snapshot; never touches the broker, workers or database"""
+        with self._lock:
+            return copy.deepcopy(self._snapshot)
+
+    def _run(self):
+        while not self._stop.wait(self.queue_interval):
+            include_workers = time.monotonic() - self._last_worker_refresh >= self.worker_interval
+            self.refresh(include_workers=include_workers)
+
+    def refresh(self, include_workers: bool = False):
+        """Refresh each section independently, keeping the last good value on failure"""
+        self._refresh_section('queue_lengths', self._read_queue_lengths)
+        self._refresh_section('job_counts_24h', self._read_job_counts)
+        if include_workers:
+            self._last_worker_refresh = time.monotonic()
+            self._refresh_section('workers', self._read_workers)
+
+    def _refresh_section(self, name: str, reader):
+        try:
+            values = reader()
+        except Exception as e:
+            logger.warning(f"Queue status refresh failed for {name}: {e}")
+            with self._lock:
+                self._snapshot['errors'][name] = str(e)
+            return
+
+        with self._lock:
+            self._snapshot.update(values)
+            self._snapshot['refreshed_at'][name] = datetime.now(timezone.utc).isoformat()
+            self._snapshot['errors'].pop(name, None)
+
+    def _read_queue_lengths(self) -> Dict[str, Any]:
+        if self.redis_client is None:
+            # Broker without inspectable lists (memory:// in load tests)
+            return {'queue_lengths': {}}
+        # Also publishes binaa_queue_depth for /metrics
+        return {'queue_lengths': metrics.refresh_queue_depths(self.redis_client, self.queues)}
+
+    def _read_workers(self) -> Dict[str, Any]:
+        inspect = self.celery_app.control.inspect(timeout=self.inspect_timeout)
+        stats = inspect.stats() or {}
+        active = inspect.active() or {}
+        return {
+            'worker_stats': stats,
+            'active_tasks': sum(len(tasks) for tasks in active.values()),
+        }
+
+    def _read_job_counts(self) -> Dict[str, Any]:
+        return {'job_counts_24h': self.job_store.job_counts_24h()}
@@ -0,0 +1,23 @@
+"""
+Shared raster processing engine for the Celery worker and the server/lib processors
+محرك معالجة البيانات النقطية المشترك
+
+- engine: ProcessOptions, render_raster / process_raster (open, reproject, normalize, encode)
+- archive: GeoTIFF discovery, /vsizip/ paths and single-member extraction from ZIP uploads
+- georef: WGS84 bounds, world files and .prj files
+- crs: cached CRS objects and pyproj transformers, densified bounds transforms
+- normalize: stretches to 8-bit display values
+- encoders: PNG/WebP/JPEG output
+- cog: Cloud Optimized GeoTIFF output (CogSettings)
+- cog_tuning: trial encodes that pick COG compression, predictor and block size
+- parallel: shared per-process thread pool sized to the worker concurrency
+- tiled_warp: tile-by-tile reprojection across processes for large rasters
+- scratch: intermediate arrays, memory-mapped above a size threshold
+- metadata: header-only metadata reads with a persistent SQLite cache
+- thumbnails: cascading thumbnail sizes from one preview
+- quicklook: small overview-based preview published before the full outputs
+- events: NDJSON progress events for the server/lib processors
+- memprofile: RSS sampling and tracemalloc allocation hot spots per job
+- layer: the processors' layer result / metadata.json and the single-file processing path
+- batch: manifest-driven batch processing across a process pool
+"""
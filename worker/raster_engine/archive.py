@@ -0,0 +1,62 @@
+"""
+GeoTIFF discovery inside ZIP archives
+البحث عن ملفات GeoTIFF داخل الأرشيفات المضغوطة
+"""
+
+import shutil
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from .events import get_events
+
+GEOTIFF_EXTENSIONS = ('.tif', '.tiff', '.geotiff')
+# Sidecar files that carry georeferencing for a TIFF of the same stem
+SIDECAR_EXTENSIONS = ('.tfw', '.tifw', '.wld', '.prj', '.aux.xml')
+
+def is_zip(path) -> bool:
+    return str(path).lower().endswith('.zip')
+
+def find_geotiffs(zip_path) -> List[zipfile.ZipInfo]:
+    """GeoTIFF members in archive order"""
+    with zipfile.ZipFile(zip_path, 'r') as archive:
+        return [
+            info for info in archive.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(GEOTIFF_EXTENSIONS)
+        ]
+
+def choose_geotiff(zip_path, largest: bool = False) -> zipfile.ZipInfo:
+    """First GeoTIFF in the archive, or the largest one"""
+    members = find_geotiffs(zip_path)
+    if not members:
+        raise ValueError("No GeoTIFF files found in archive")
+    if largest:
+        return max(members, key=lambda info: info.file_size)
+    return members[0]
+
+def vsizip_path(zip_path, member: str) -> str:
+    """GDAL path of an archive member; rasterio reads it in place, sidecars included"""
+    return f"/vsizip/{Path(zip_path).resolve()}/{member}"
+
+@contextmanager
+def extract_geotiff(zip_path, member: Optional[str] = None, largest: bool = False) -> Iterator[Path]:
+    """
+    Extract one GeoTIFF (plus its sidecar files) to a temporary directory and
+    yield its path; the directory is removed when the block exits.
+    """
+    name = member or choose_geotiff(zip_path, largest=largest).filename
+    stem = name[:name.rfind('.')]
+    temp_dir = tempfile.mkdtemp(prefix='raster_engine_')
+    try:
+        with get_events().stage('extract'), zipfile.ZipFile(zip_path, 'r') as archive:
+            for info in archive.infolist():
+                lower = info.filename.lower()
+                if info.filename == name or (
+                    info.filename.startswith(stem) and lower.endswith(SIDECAR_EXTENSIONS)
+                ):
+                    archive.extract(info, temp_dir)
+        yield Path(temp_dir) / name
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
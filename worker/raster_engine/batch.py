@@ -0,0 +1,265 @@
+"""
+Manifest-driven batch processing
+المعالجة الدفعية انطلاقاً من ملف بيان
+
+A manifest is JSON lines, one layer per line:
+  {"input": "uploads/a.zip", "output": "processed/layer_a", "options": {"max_size": 4096}}
+  {"id": "layer_b", "input": "b.tif", "output": "processed/layer_b", "stem": "processed"}
+
+`options` are ProcessOptions fields (`encoder` takes EncoderOptions fields);
+anything left out keeps the single-file processor defaults (WGS84 bilinear,
+2-98 percentile stretch, RGB). ZIP inputs are read in place through
+/vsizip/. Each item writes <output>/<stem><ext> plus a metadata.json in the
+same layout as the single-file processors (layer.py).
+
+Items run in a pool of spawned processes, each paying interpreter and GDAL
+start-up once for the whole batch. The CPUs are divided between the
+processes (RASTER_THREADS per process) and at most two items per process
+are queued at a time, so a manifest of any length is read lazily. Results
+are written one JSON line per item as items finish; a results file from an
+interrupted run can be passed back to skip items that already succeeded. A
+pool process that dies (e.g. killed for memory) breaks the pool; a new
+pool takes over, and only an item that kills its process twice fails.
+"""
+
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Union
+
+from .encoders import EncoderOptions
+from .engine import ProcessOptions, process_raster
+from .layer import layer_metadata, write_layer_metadata
+from .metadata import dataset_path
+
+PROCESSES = int(os.getenv('RASTER_BATCH_PROCESSES', '0')) or (os.cpu_count() or 1)
+# Items queued per process beyond the one it is running
+QUEUE_DEPTH = 2
+# Runs an item gets when pool processes die under it; the last one alone (see run_batch)
+POOL_ATTEMPTS = 2
+
+# ProcessOptions fields given as JSON arrays
+_TUPLE_OPTIONS = ('percentiles', 'value_range', 'fallback_bounds')
+
+@dataclass
+class BatchItem:
+    """One manifest line"""
+    id: str
+    input: str
+    output: str
+    stem: str = 'processed'
+    options: Dict[str, Any] = field(default_factory=dict)
+    line: int = 0
+
+@dataclass
+class BatchSummary:
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+    processes: int = 0
+    pool_restarts: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        done = self.succeeded + self.failed
+        return {
+            'success': self.failed == 0,
+            'total': self.total,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'processes': self.processes,
+            'pool_restarts': self.pool_restarts,
+            'seconds': round(self.seconds, 3),
+            'items_per_second': round(done / self.seconds, 3) if self.seconds else None,
+        }
+
+def parse_item(entry: Dict[str, Any], line: int = 0) -> BatchItem:
+    if not isinstance(entry, dict):
+        raise ValueError("manifest line is not a JSON object")
+    missing = [key for key in ('input', 'output') if not entry.get(key)]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    options = entry.get('options') or {}
+    # Fail at read time rather than inside a worker
+    build_options(options)
+    return BatchItem(
+        id=str(entry.get('id') or entry['output']),
+        input=str(entry['input']),
+        output=str(entry['output']),
+        stem=str(entry.get('stem') or 'processed'),
+        options=options,
+        line=line,
+    )
+
+def read_manifest(lines: Iterable[str]) -> Iterator[Union[BatchItem, Dict[str, Any]]]:
+    """BatchItems, or a failed result for lines that cannot be parsed"""
+    for number, text in enumerate(lines, start=1):
+        text = text.strip()
+        if not text or text.startswith('#'):
+            continue
+        try:
+            yield parse_item(json.loads(text), number)
+        except (ValueError, TypeError) as e:
+            yield {'id': f'line:{number}', 'line': number, 'success': False, 'error': f"Invalid manifest line: {e}"}
+
+def build_options(options: Dict[str, Any]) -> ProcessOptions:
+    known = {f.name for f in fields(ProcessOptions)}
+    unknown = sorted(set(options) - known)
+    if unknown:
+        raise ValueError(f"unknown options: {', '.join(unknown)}")
+    values = dict(options)
+    for name in _TUPLE_OPTIONS:
+        if values.get(name) is not None:
+            values[name] = tuple(values[name])
+    if isinstance(values.get('encoder'), dict):
+        values['encoder'] = EncoderOptions.from_env(**values['encoder'])
+    return ProcessOptions(**values)
+
+def process_item(item: BatchItem) -> Dict[str, Any]:
+    """Run one item (in a pool process); never raises"""
+    start = time.perf_counter()
+    result: Dict[str, Any] = {'id': item.id, 'line': item.line, 'input': item.input, 'output': item.output}
+    try:
+        source = dataset_path(item.input)
+        raster, encoded = process_raster(source, item.output, item.stem, build_options(item.options))
+        write_layer_metadata(item.output, layer_metadata(raster, encoded, Path(source).name))
+        result.update(success=True, imageFile=encoded['filename'], width=raster.width, height=raster.height)
+    except Exception as e:
+        result.update(success=False, error=str(e), traceback=traceback.format_exc(limit=5))
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+def _init_process(threads: int):
+    os.environ['RASTER_THREADS'] = str(threads)
+    # The events descriptor belongs to the parent; the number may be reused by another file here
+    os.environ.pop('RASTER_EVENTS_FD', None)
+
+def completed_ids(results: Optional[TextIO]) -> Set[str]:
+    """Ids that succeeded in an earlier results stream"""
+    done: Set[str] = set()
+    if results is None:
+        return done
+    for text in results:
+        try:
+            record = json.loads(text)
+        except ValueError:
+            # Last line of an interrupted run
+            continue
+        if record.get('success') and 'id' in record:
+            done.add(record['id'])
+    return done
+
+def run_batch(
+    manifest: Iterable[str],
+    on_result: Callable[[Dict[str, Any]], None],
+    processes: Optional[int] = None,
+    skip: Optional[Set[str]] = None,
+) -> BatchSummary:
+    """Process manifest lines across a process pool; on_result gets each result as it finishes"""
+    processes = max(1, processes or PROCESSES)
+    threads = max(1, (os.cpu_count() or 1) // processes)
+    skip = skip or set()
+    summary = BatchSummary(processes=processes)
+    start = time.perf_counter()
+
+    def record(result: Dict[str, Any]):
+        if result['success']:
+            summary.succeeded += 1
+        else:
+            summary.failed += 1
+        on_result(result)
+
+    # Spawned children start without the parent's GDAL state or threads
+    context = multiprocessing.get_context('spawn')
+
+    def new_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(processes, mp_context=context, initializer=_init_process, initargs=(threads,))
+
+    pool = new_pool()
+    pending: Dict[Any, BatchItem] = {}
+    # Items to run again in a fresh pool, and the runs each line has had cut short
+    retry: List[BatchItem] = []
+    attempts: Dict[int, int] = {}
+    broken = False
+
+    def failed(item: BatchItem, error: str) -> Dict[str, Any]:
+        return {'id': item.id, 'line': item.line, 'input': item.input, 'output': item.output,
+                'success': False, 'error': error}
+
+    def collect(futures):
+        nonlocal broken
+        for future in futures:
+            item = pending.pop(future)
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                # A pool process died (e.g. killed for memory), failing every item in flight with it.
+                # Which one caused it is unknown, so each gets another run
+                broken = True
+                attempts[item.line] = attempts.get(item.line, 0) + 1
+                if attempts[item.line] < POOL_ATTEMPTS:
+                    retry.append(item)
+                    continue
+                result = failed(item, "Worker process died while running this item (e.g. killed for memory)")
+            except Exception as e:
+                result = failed(item, f"Worker process failed: {e!r}")
+            record(result)
+
+    def submit(item: BatchItem):
+        nonlocal broken
+        if broken:
+            retry.append(item)
+            return
+        try:
+            pending[pool.submit(process_item, item)] = item
+        except BrokenProcessPool:
+            broken = True
+            retry.append(item)
+
+    def replace_broken_pool():
+        """
+        A broken pool takes no more work: finish its futures and start a new one.
+        The items it lost run again one at a time, so an item that kills its
+        process again is the one at fault and the others are not lost with it.
+        """
+        nonlocal pool, broken
+        while broken:
+            collect(wait(pending).done)
+            pool.shutdown()
+            pool = new_pool()
+            summary.pool_restarts += 1
+            broken = False
+            while retry and not broken:
+                submit(retry.pop(0))
+                collect(wait(pending).done)
+
+    try:
+        for item in read_manifest(manifest):
+            summary.total += 1
+            if isinstance(item, dict):
+                record(item)
+                continue
+            if item.id in skip:
+                summary.skipped += 1
+                continue
+            if len(pending) >= processes * QUEUE_DEPTH:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            submit(item)
+            collect([future for future in pending if future.done()])
+            replace_broken_pool()
+        while pending or broken:
+            collect(wait(pending).done)
+            replace_broken_pool()
+    finally:
+        pool.shutdown()
+
+    summary.seconds = time.perf_counter() - start
+    return summary
@@ -0,0 +1,73 @@
+"""
+Cloud Optimized GeoTIFF output
+إنشاء ملفات GeoTIFF المحسنة للسحابة (COG)
+"""
+
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+import rasterio
+from rasterio.enums import Resampling
+
+OVERVIEW_FACTORS = [2, 4, 8, 16]
+
+@dataclass(frozen=True)
+class CogSettings:
+    """Compression and tiling of a COG"""
+    compress: str = 'deflate'
+    # 1 none, 2 horizontal differencing, 3 floating point
+    predictor: int = 1
+    blocksize: int = 512
+    # JPEG only; photometric YCbCr for 3-band uint8
+    quality: Optional[int] = None
+    photometric: Optional[str] = None
+
+    @property
+    def lossy(self) -> bool:
+        return self.compress == 'jpeg'
+
+    def profile(self) -> Dict[str, Any]:
+        profile = {
+            'compress': self.compress,
+            'tiled': True,
+            'blockxsize': self.blocksize,
+            'blockysize': self.blocksize,
+        }
+        if self.predictor != 1:
+            profile['predictor'] = self.predictor
+        if self.quality is not None:
+            profile['jpeg_quality'] = self.quality
+        if self.photometric:
+            profile['photometric'] = self.photometric
+            profile['interleave'] = 'pixel'
+        return profile
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {key: value for key, value in asdict(self).items() if value is not None}
+
+# What every COG used before tuning
+DEFAULT_SETTINGS = CogSettings()
+
+def write_cog(input_path, output_path, settings: Optional[CogSettings] = None):
+    """Create Cloud Optimized GeoTIFF"""
+    settings = settings or DEFAULT_SETTINGS
+    with rasterio.open(input_path) as src:
+        profile = src.profile.copy()
+        # Encoding of the source (e.g. its own predictor or JPEG photometric) does not carry over
+        for key in ('compress', 'predictor', 'photometric', 'jpeg_quality'):
+            profile.pop(key, None)
+
+        # COG optimization settings
+        profile.update({
+            'driver': 'GTiff',
+            'BIGTIFF': 'IF_SAFER',
+            **settings.profile(),
+        })
+
+        with rasterio.open(output_path, 'w', **profile) as dst:
+            for i in range(1, src.count + 1):
+                dst.write(src.read(i), i)
+
+            # Add overviews
+            dst.build_overviews(OVERVIEW_FACTORS, Resampling.average)
+            dst.update_tags(ns='rio_overview', resampling='average')
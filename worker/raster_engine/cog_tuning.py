@@ -0,0 +1,160 @@
+"""
+COG encoding auto-tuner
+الضبط التلقائي لترميز ملفات COG
+
+A few windows of the input are trial-encoded in memory with each candidate
+setting: DEFLATE/ZSTD/LZW with predictor 1/2 (3 for floating point), LERC,
+256/512 blocks, and JPEG-YCbCr for 3-band uint8 inputs without nodata.
+Every candidate is scored against the default (deflate, 512, no predictor)
+on the same windows:
+
+    score = w * log(bytes / default_bytes) + (1 - w) * log(seconds / default_seconds)
+
+where w is the size weight of RASTER_COG_TUNING_OBJECTIVE ('size' = 1,
+'speed' = 0, 'balanced' = 0.5, or a number in between). The lowest score
+wins; ties go to the default. Tuning is off unless RASTER_COG_TUNING is set.
+"""
+
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import rasterio
+from rasterio.errors import RasterioError
+from rasterio.io import MemoryFile
+from rasterio.windows import Window
+
+from .cog import DEFAULT_SETTINGS, CogSettings
+
+ENABLED = os.getenv('RASTER_COG_TUNING', '').lower() in ('1', 'true', 'yes')
+OBJECTIVE = os.getenv('RASTER_COG_TUNING_OBJECTIVE', 'balanced')
+# JPEG-YCbCr is lossy; allowed only for 3-band uint8 inputs and only when set
+ALLOW_LOSSY = os.getenv('RASTER_COG_TUNING_LOSSY', 'false').lower() in ('1', 'true', 'yes')
+JPEG_QUALITY = int(os.getenv('RASTER_COG_JPEG_QUALITY', '90'))
+SAMPLE_SIZE = int(os.getenv('RASTER_COG_TUNING_SAMPLE', '1024'))
+SAMPLE_WINDOWS = int(os.getenv('RASTER_COG_TUNING_WINDOWS', '3'))
+
+OBJECTIVES = {'size': 1.0, 'balanced': 0.5, 'speed': 0.0}
+
+@dataclass
+class TuningResult:
+    settings: CogSettings
+    objective: float
+    trials: List[Dict[str, Any]] = field(default_factory=list)
+
+    def as_metadata(self) -> Dict[str, Any]:
+        """Chosen settings plus how they compared with the default on the samples"""
+        chosen = next(trial for trial in self.trials if trial['settings'] == self.settings.as_dict())
+        default = next(trial for trial in self.trials if trial['settings'] == DEFAULT_SETTINGS.as_dict())
+        return {
+            **self.settings.as_dict(),
+            'tuned': True,
+            'size_weight': self.objective,
+            'sample_bytes_ratio': round(chosen['bytes'] / default['bytes'], 4),
+            'sample_seconds_ratio': round(chosen['seconds'] / default['seconds'], 4),
+            'candidates': len(self.trials),
+        }
+
+def size_weight(objective=None) -> float:
+    """Size weight in [0, 1] of an objective name or number"""
+    objective = OBJECTIVE if objective is None else objective
+    if isinstance(objective, str) and objective.lower() in OBJECTIVES:
+        return OBJECTIVES[objective.lower()]
+    return min(1.0, max(0.0, float(objective)))
+
+def candidates(dtype: str, count: int, nodata=None, allow_lossy: bool = ALLOW_LOSSY) -> List[CogSettings]:
+    floating = np.dtype(dtype).kind == 'f'
+    predictors = (1, 2, 3) if floating else (1, 2)
+    settings = [DEFAULT_SETTINGS]
+    for blocksize in (256, 512):
+        for compress in ('deflate', 'zstd', 'lzw'):
+            settings += [CogSettings(compress, predictor, blocksize) for predictor in predictors]
+        # max_z_error defaults to 0, so LERC stays lossless
+        settings.append(CogSettings('lerc', 1, blocksize))
+        if allow_lossy and dtype == 'uint8' and count == 3 and nodata is None:
+            settings.append(CogSettings('jpeg', 1, blocksize, quality=JPEG_QUALITY, photometric='ycbcr'))
+    # The default appears once, first
+    return list(dict.fromkeys(settings))
+
+def sample_windows(width: int, height: int, size: int = SAMPLE_SIZE, count: int = SAMPLE_WINDOWS) -> List[Window]:
+    """Windows at the centre and spread along the diagonals, clipped to the raster"""
+    size_x, size_y = min(size, width), min(size, height)
+    centres = [(0.5, 0.5), (0.25, 0.25), (0.75, 0.75), (0.25, 0.75), (0.75, 0.25)][:max(1, count)]
+    windows = []
+    for fx, fy in centres:
+        col = min(max(0, int(width * fx) - size_x // 2), width - size_x)
+        row = min(max(0, int(height * fy) - size_y // 2), height - size_y)
+        window = Window(col, row, size_x, size_y)
+        if window not in windows:
+            windows.append(window)
+    return windows
+
+def trial_encode(samples: Sequence[np.ndarray], profile: Dict[str, Any], settings: CogSettings) -> Dict[str, Any]:
+    """
+    Bytes and seconds to encode the samples in memory with settings; raises
+    RasterioError when the output does not use the requested compression
+    """
+    total_bytes = 0
+    total_seconds = 0.0
+    for data in samples:
+        trial = {
+            **profile,
+            'driver': 'GTiff',
+            'count': data.shape[0],
+            'height': data.shape[1],
+            'width': data.shape[2],
+            **settings.profile(),
+        }
+        with MemoryFile() as memfile:
+            start = time.perf_counter()
+            with memfile.open(**trial) as dst:
+                dst.write(data)
+            total_seconds += time.perf_counter() - start
+            total_bytes += len(memfile.getbuffer())
+            # GDAL warns and writes uncompressed when it lacks the codec
+            with memfile.open() as written:
+                compression = written.compression.value.lower() if written.compression else 'none'
+            if compression != settings.compress.lower():
+                raise RasterioError(f"{settings.compress} not available in this GDAL (wrote {compression})")
+    return {'settings': settings.as_dict(), 'bytes': total_bytes, 'seconds': round(total_seconds, 6)}
+
+def tune_cog(input_path, objective=None, allow_lossy: Optional[bool] = None) -> TuningResult:
+    """Trial-encode sample windows of input_path and pick the settings with the best score"""
+    weight = size_weight(objective)
+    with rasterio.open(input_path) as src:
+        profile = {key: src.profile[key] for key in ('dtype', 'crs', 'transform', 'nodata') if key in src.profile}
+        samples = [src.read(window=window) for window in sample_windows(src.width, src.height)]
+        options = candidates(
+            src.dtypes[0], src.count, src.nodata, ALLOW_LOSSY if allow_lossy is None else allow_lossy
+        )
+
+    trials = []
+    for settings in options:
+        try:
+            trials.append(trial_encode(samples, profile, settings))
+        except RasterioError:
+            # Codec not built into this GDAL, or not valid for this data type;
+            # its output would be scored and recorded as a codec it is not
+            continue
+
+    default = trials[0]
+    best, best_score = DEFAULT_SETTINGS, 0.0
+    for trial in trials:
+        # Guard against zero-sized timings on tiny samples
+        size_ratio = trial['bytes'] / max(1, default['bytes'])
+        speed_ratio = max(trial['seconds'], 1e-6) / max(default['seconds'], 1e-6)
+        trial['score'] = round(weight * math.log(size_ratio) + (1 - weight) * math.log(speed_ratio), 4)
+        if trial['score'] < best_score:
+            best_score = trial['score']
+            best = CogSettings(**trial['settings'])
+    return TuningResult(settings=best, objective=weight, trials=trials)
+
+def cog_settings(input_path, objective=None) -> Tuple[CogSettings, Dict[str, Any]]:
+    """Settings for the COG of input_path and their metadata record; the default when tuning is off"""
+    if ENABLED:
+        result = tune_cog(input_path, objective)
+        return result.settings, result.as_metadata()
+    return DEFAULT_SETTINGS, {**DEFAULT_SETTINGS.as_dict(), 'tuned': False}
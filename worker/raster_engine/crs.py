@@ -0,0 +1,121 @@
+"""
+Process-wide CRS and transformer caches
+ذاكرة مؤقتة لأنظمة الإحداثيات ومحولاتها على مستوى العملية
+
+Building a CRS or a pyproj Transformer means PROJ database lookups and
+pipeline construction; warm workers would otherwise pay that on every job.
+CRS objects are immutable and shared across threads. pyproj Transformers
+are not thread-safe, so the transformer cache is keyed by the calling thread
+as well. Both caches are LRU-bounded (RASTER_CRS_CACHE_SIZE,
+RASTER_TRANSFORMER_CACHE_SIZE).
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Sequence, Tuple
+
+import numpy as np
+from pyproj import CRS as ProjCRS, Transformer
+from rasterio.crs import CRS
+
+CRS_CACHE_SIZE = int(os.getenv('RASTER_CRS_CACHE_SIZE', '64'))
+TRANSFORMER_CACHE_SIZE = int(os.getenv('RASTER_TRANSFORMER_CACHE_SIZE', '128'))
+DEFAULT_DENSIFY_POINTS = 21
+
+class BoundedCache:
+    """Thread-safe LRU mapping; values are built outside the lock"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+
+        # Two threads may build the same entry; the first one stored wins
+        value = factory()
+        with self._lock:
+            value = self._items.setdefault(key, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+_crs_cache = BoundedCache(CRS_CACHE_SIZE)
+_proj_crs_cache = BoundedCache(CRS_CACHE_SIZE)
+_transformer_cache = BoundedCache(TRANSFORMER_CACHE_SIZE)
+
+def crs_key(value) -> Hashable:
+    """Stable cache key for an EPSG code, user-input string, rasterio CRS or pyproj CRS"""
+    if isinstance(value, int):
+        return f"EPSG:{value}"
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, CRS):
+        return value.to_wkt()
+    if isinstance(value, ProjCRS):
+        return value.srs
+    raise TypeError(f"Unsupported CRS value: {value!r}")
+
+def get_crs(value) -> CRS:
+    """Cached rasterio CRS"""
+    if isinstance(value, CRS):
+        return value
+    key = crs_key(value)
+    return _crs_cache.get_or_create(key, lambda: CRS.from_user_input(key))
+
+def get_proj_crs(value) -> ProjCRS:
+    """Cached pyproj CRS"""
+    key = crs_key(value)
+    return _proj_crs_cache.get_or_create(key, lambda: ProjCRS.from_user_input(key))
+
+def get_transformer(src, dst, always_xy: bool = True, **options) -> Transformer:
+    """Cached Transformer for (src, dst, options) owned by the calling thread"""
+    key = (crs_key(src), crs_key(dst), always_xy, tuple(sorted(options.items())), threading.get_ident())
+    return _transformer_cache.get_or_create(
+        key,
+        lambda: Transformer.from_crs(get_proj_crs(src), get_proj_crs(dst), always_xy=always_xy, **options),
+    )
+
+def edge_points(bounds: Sequence[float], densify_pts: int = DEFAULT_DENSIFY_POINTS) -> Tuple[np.ndarray, np.ndarray]:
+    """Points along all four edges of (west, south, east, north), corners included"""
+    west, south, east, north = bounds
+    steps = np.linspace(0.0, 1.0, densify_pts + 2)
+    xs_h = west + (east - west) * steps
+    ys_v = south + (north - south) * steps
+    xs = np.concatenate([xs_h, xs_h, np.full_like(ys_v, west), np.full_like(ys_v, east)])
+    ys = np.concatenate([np.full_like(xs_h, south), np.full_like(xs_h, north), ys_v, ys_v])
+    return xs, ys
+
+def transform_bounds(src, dst, bounds: Sequence[float], densify_pts: int = DEFAULT_DENSIFY_POINTS) -> Tuple[float, float, float, float]:
+    """Bounds in dst covering the densified edges of bounds in src, in one array transform"""
+    xs, ys = edge_points(bounds, densify_pts)
+    out_x, out_y = get_transformer(src, dst).transform(xs, ys)
+    finite = np.isfinite(out_x) & np.isfinite(out_y)
+    if not finite.any():
+        raise ValueError(f"Bounds {tuple(bounds)} cannot be transformed to {crs_key(dst)}")
+    out_x, out_y = out_x[finite], out_y[finite]
+    return float(out_x.min()), float(out_y.min()), float(out_x.max()), float(out_y.max())
+
+def cache_info():
+    """Entry counts and hit rates, for logs and debugging"""
+    return {
+        name: {'size': len(cache), 'hits': cache.hits, 'misses': cache.misses}
+        for name, cache in (('crs', _crs_cache), ('proj_crs', _proj_crs_cache), ('transformer', _transformer_cache))
+    }
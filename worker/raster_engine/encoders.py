@@ -0,0 +1,263 @@
+"""
+Output image encoders
+مُرمّزات صور المخرجات
+
+Formats: png (explicit zlib level, no `optimize` pass), webp (lossy or
+lossless) and jpeg. Large PNGs are encoded in parallel horizontal strips:
+each strip is deflated independently with a sync flush and the pieces are
+concatenated into one valid zlib stream, the same technique pigz uses.
+Defaults come from RASTER_OUTPUT_* environment variables.
+
+encode_pixels() writes an interleaved (rows, cols, channels) uint8 buffer,
+as the engine renders it: large PNGs are deflated in strips straight from
+the buffer, so no full-size PIL image is built. Everything else goes
+through PIL, which keeps RGB in 4 bytes per pixel and so holds a copy of
+the image while encoding.
+"""
+
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+from . import parallel
+
+FORMATS = {
+    'png': {'extension': '.png', 'mime_type': 'image/png', 'pil_format': 'PNG'},
+    'webp': {'extension': '.webp', 'mime_type': 'image/webp', 'pil_format': 'WEBP'},
+    'jpeg': {'extension': '.jpg', 'mime_type': 'image/jpeg', 'pil_format': 'JPEG'},
+}
+EXTENSION_FORMATS = {'.png': 'png', '.webp': 'webp', '.jpg': 'jpeg', '.jpeg': 'jpeg'}
+
+# libwebp cannot encode images larger than this in either dimension
+WEBP_MAX_DIMENSION = 16383
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_COLOR_TYPES = {'L': 0, 'RGB': 2, 'LA': 4, 'RGBA': 6}
+# Channels of an interleaved uint8 buffer -> PIL/PNG mode
+PIXEL_MODES = {1: 'L', 2: 'LA', 3: 'RGB', 4: 'RGBA'}
+PNG_FILTER_UP = 2
+ADLER_BASE = 65521
+
+@dataclass
+class EncoderOptions:
+    """How preview images are written"""
+    format: str = 'png'
+    lossless: bool = False
+    quality: int = 85
+    png_compress_level: int = 6
+    # Images with at least this many pixels are PNG-encoded in parallel strips
+    parallel_min_pixels: int = 4096 * 4096
+    strip_rows: int = 256
+    workers: int = field(default_factory=parallel.thread_count)
+
+    @classmethod
+    def from_env(cls, **overrides) -> 'EncoderOptions':
+        options = cls(
+            format=os.getenv('RASTER_OUTPUT_FORMAT', 'png').lower(),
+            lossless=os.getenv('RASTER_OUTPUT_LOSSLESS', '0') == '1',
+            quality=int(os.getenv('RASTER_OUTPUT_QUALITY', '85')),
+            png_compress_level=int(os.getenv('RASTER_PNG_COMPRESS_LEVEL', '6')),
+            parallel_min_pixels=int(os.getenv('RASTER_PARALLEL_ENCODE_MIN_PIXELS', str(4096 * 4096))),
+            workers=int(os.getenv('RASTER_ENCODE_WORKERS', str(parallel.thread_count()))),
+        )
+        options = replace(options, **overrides)
+        if options.format == 'jpg':
+            options = replace(options, format='jpeg')
+        if options.format not in FORMATS:
+            raise ValueError(f"Unsupported output format: {options.format}")
+        return options
+
+    @property
+    def extension(self) -> str:
+        return FORMATS[self.format]['extension']
+
+def format_for_path(path) -> str:
+    """Output format implied by a file extension (defaults to png)"""
+    return EXTENSION_FORMATS.get(Path(path).suffix.lower(), 'png')
+
+def world_file_suffix(extension: str) -> str:
+    """World file extension for an image extension (.png -> .pgw, .jpg -> .jgw)"""
+    ext = extension.lstrip('.')
+    return f".{ext[0]}{ext[-1]}w"
+
+def pixels_mode(pixels: np.ndarray) -> str:
+    return PIXEL_MODES[pixels.shape[2] if pixels.ndim == 3 else 1]
+
+def image_from_pixels(pixels: np.ndarray) -> Image.Image:
+    """PIL image of an interleaved uint8 buffer; greyscale shares its memory, RGB is copied"""
+    height, width = pixels.shape[:2]
+    mode = pixels_mode(pixels)
+    return Image.frombuffer(mode, (width, height), pixels, 'raw', mode, 0, 1)
+
+def _effective_options(size, mode: str, options: EncoderOptions) -> EncoderOptions:
+    if options.format == 'webp' and max(size) > WEBP_MAX_DIMENSION:
+        # Keep the output lossless-equivalent when WebP cannot hold the image
+        return replace(options, format='png')
+    if options.format == 'jpeg' and mode not in ('L', 'RGB'):
+        return replace(options, format='png')
+    return options
+
+def _describe(output_path, options: EncoderOptions, start: float) -> Dict[str, Any]:
+    return {
+        'format': options.format,
+        'mime_type': FORMATS[options.format]['mime_type'],
+        'lossless': options.format == 'png' or (options.format == 'webp' and options.lossless),
+        'quality': None if options.format == 'png' else options.quality,
+        'png_compress_level': options.png_compress_level if options.format == 'png' else None,
+        'bytes': os.path.getsize(output_path),
+        'encode_seconds': round(time.perf_counter() - start, 4),
+        'filename': Path(output_path).name,
+        'path': str(output_path),
+    }
+
+def _save_with_pil(image: Image.Image, output_path, options: EncoderOptions):
+    if options.format == 'png':
+        image.save(output_path, 'PNG', compress_level=options.png_compress_level)
+    elif options.format == 'webp':
+        if options.lossless:
+            # method 0-6 trades speed for size; 4 matches libwebp's default
+            image.save(output_path, 'WEBP', lossless=True, quality=100, method=4)
+        else:
+            image.save(output_path, 'WEBP', quality=options.quality, method=4)
+    else:
+        image.save(output_path, 'JPEG', quality=options.quality, optimize=False, progressive=False)
+
+def encode_image(image: Image.Image, output_path, options: Optional[EncoderOptions] = None) -> Dict[str, Any]:
+    """Write `image` to exactly `output_path` and describe what was written"""
+    options = _effective_options(image.size, image.mode, options or EncoderOptions.from_env())
+    start = time.perf_counter()
+    width, height = image.size
+    if (
+        options.format == 'png' and width * height >= options.parallel_min_pixels
+        and image.mode in PNG_COLOR_TYPES and options.workers > 1
+    ):
+        write_png_parallel(image, output_path, options.png_compress_level, options.strip_rows, options.workers)
+    else:
+        _save_with_pil(image, output_path, options)
+    return _describe(output_path, options, start)
+
+def encode_pixels(pixels: np.ndarray, output_path, options: Optional[EncoderOptions] = None) -> Dict[str, Any]:
+    """
+    Write an interleaved (rows, cols, channels) uint8 buffer to exactly
+    `output_path`. PNGs of at least parallel_min_pixels are deflated in strips
+    from the buffer itself (concurrently when workers > 1); smaller images go
+    through PIL, whose adaptive row filters make smaller files
+    """
+    height, width = pixels.shape[:2]
+    options = _effective_options((width, height), pixels_mode(pixels), options or EncoderOptions.from_env())
+    start = time.perf_counter()
+    if options.format == 'png' and width * height >= options.parallel_min_pixels:
+        write_png_strips(pixels, output_path, options.png_compress_level, options.strip_rows, options.workers)
+    else:
+        _save_with_pil(image_from_pixels(pixels), output_path, options)
+    return _describe(output_path, options, start)
+
+def save_image(image: Image.Image, directory, stem: str, options: Optional[EncoderOptions] = None) -> Dict[str, Any]:
+    """Write `image` as <directory>/<stem><ext>, the extension following the chosen format"""
+    options = _effective_options(image.size, image.mode, options or EncoderOptions.from_env())
+    return encode_image(image, Path(directory) / f"{stem}{options.extension}", options)
+
+def save_pixels(pixels: np.ndarray, directory, stem: str, options: Optional[EncoderOptions] = None) -> Dict[str, Any]:
+    """save_image() for an interleaved uint8 buffer (see encode_pixels)"""
+    height, width = pixels.shape[:2]
+    options = _effective_options((width, height), pixels_mode(pixels), options or EncoderOptions.from_env())
+    return encode_pixels(pixels, Path(directory) / f"{stem}{options.extension}", options)
+
+# Parallel PNG
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+def _zlib_header(level: int) -> bytes:
+    cmf = 0x78  # deflate, 32K window
+    flevel = 0 if level < 2 else 1 if level < 6 else 2 if level == 6 else 3
+    flg = flevel << 6
+    flg += 31 - ((cmf * 256 + flg) % 31)
+    return bytes((cmf, flg))
+
+def adler32_combine(adler1: int, adler2: int, len2: int) -> int:
+    """Checksum of A+B from the checksums of A and B (port of zlib's adler32_combine)"""
+    rem = len2 % ADLER_BASE
+    sum1 = adler1 & 0xffff
+    sum2 = (rem * sum1) % ADLER_BASE
+    sum1 += (adler2 & 0xffff) + ADLER_BASE - 1
+    sum2 += ((adler1 >> 16) & 0xffff) + ((adler2 >> 16) & 0xffff) + ADLER_BASE - rem
+    if sum1 >= ADLER_BASE:
+        sum1 -= ADLER_BASE
+    if sum1 >= ADLER_BASE:
+        sum1 -= ADLER_BASE
+    if sum2 >= (ADLER_BASE << 1):
+        sum2 -= (ADLER_BASE << 1)
+    if sum2 >= ADLER_BASE:
+        sum2 -= ADLER_BASE
+    return sum1 | (sum2 << 16)
+
+def _encode_strip(pixels: np.ndarray, start: int, stop: int, level: int, last: bool):
+    """Up-filter and deflate rows [start, stop); returns (deflate bytes, adler32, raw length)"""
+    rows = pixels[start:stop].reshape(stop - start, -1)
+    raw = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+    raw[:, 0] = PNG_FILTER_UP
+    raw[0, 1:] = rows[0] if start == 0 else rows[0] - pixels[start - 1].reshape(-1)
+    np.subtract(rows[1:], rows[:-1], out=raw[1:, 1:])
+    data = raw.data
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return deflated, zlib.adler32(data), raw.nbytes
+
+def write_png_parallel(
+    image: Image.Image,
+    output_path,
+    level: int = 6,
+    strip_rows: int = 256,
+    workers: int = 4,
+):
+    """Encode an 8-bit L/LA/RGB/RGBA image as PNG with strips deflated concurrently"""
+    write_png_strips(np.asarray(image), output_path, level, strip_rows, workers)
+
+def write_png_strips(
+    pixels: np.ndarray,
+    output_path,
+    level: int = 6,
+    strip_rows: int = 256,
+    workers: int = 4,
+):
+    """Encode an interleaved uint8 buffer as PNG, up to `workers` strips deflated at a time"""
+    height, width = pixels.shape[:2]
+    bounds = [(start, min(start + strip_rows, height)) for start in range(0, height, strip_rows)]
+
+    # Strips go to the shared raster pool; `workers` bounds how many are in flight
+    pool = parallel.get_pool()
+    with open(output_path, 'wb') as out:
+        out.write(PNG_SIGNATURE)
+        out.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, PNG_COLOR_TYPES[pixels_mode(pixels)], 0, 0, 0)))
+
+        # zlib releases the GIL while deflating, so strips compress in parallel
+        def submit(index):
+            start, stop = bounds[index]
+            return pool.submit(_encode_strip, pixels, start, stop, level, index == len(bounds) - 1)
+
+        pending = deque(submit(index) for index in range(min(max(1, workers), len(bounds))))
+        next_index = len(pending)
+        adler = 1
+        for index in range(len(bounds)):
+            deflated, strip_adler, raw_length = pending.popleft().result()
+            if next_index < len(bounds):
+                pending.append(submit(next_index))
+                next_index += 1
+            adler = adler32_combine(adler, strip_adler, raw_length)
+            if index == 0:
+                deflated = _zlib_header(level) + deflated
+            if index == len(bounds) - 1:
+                deflated += struct.pack('>I', adler)
+            out.write(_png_chunk(b'IDAT', deflated))
+
+        out.write(_png_chunk(b'IEND', b''))
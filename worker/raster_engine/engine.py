@@ -0,0 +1,219 @@
+"""
+Raster processing engine: open, reproject, normalize and encode in one place
+محرك المعالجة: الفتح وإعادة الإسقاط والتطبيع والترميز في مكان واحد
+
+The Celery tasks call process_raster() in-process; the server/lib CLI
+scripts are thin adapters that map ProcessOptions onto their historical
+behaviour and output schemas.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import rasterio
+from affine import Affine
+from PIL import Image
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.transform import array_bounds
+from rasterio.warp import calculate_default_transform, reproject
+
+from . import parallel, scratch, tiled_warp
+from .encoders import EncoderOptions, image_from_pixels, save_pixels
+from .events import get_events
+from .georef import Bounds, as_crs, crs_label, leaflet_bounds, to_wgs84_bounds
+from .normalize import to_uint8
+
+@dataclass
+class ProcessOptions:
+    """How an input raster is turned into a display image"""
+    # Grid of the output image; None keeps the source grid
+    target_crs: Optional[str] = 'EPSG:4326'
+    # CRS assumed for inputs that carry none (None: treat them as already in target_crs)
+    assume_crs: Optional[str] = None
+    resampling: str = 'bilinear'
+    stretch: str = 'percentile'
+    percentiles: Tuple[float, float] = (2, 98)
+    # Input range for the 'linear' stretch
+    value_range: Optional[Tuple[float, float]] = None
+    gamma: float = 1.0
+    # Leave zero pixels (usually collar/fill) out of the stretch statistics
+    ignore_zero: bool = True
+    # 'rgb' always writes three channels; 'auto' keeps single-band rasters greyscale
+    color_mode: str = 'rgb'
+    # Longest output side; the source is read decimated, never upsampled
+    max_size: Optional[int] = None
+    # Warp in tiles across processes; None decides by destination size (RASTER_TILED_WARP_MIN_PIXELS)
+    tiled_warp: Optional[bool] = None
+    # WGS84 bounds reported when the bounds cannot be transformed
+    fallback_bounds: Optional[Bounds] = None
+    encoder: Optional[EncoderOptions] = None
+
+@dataclass
+class RenderedRaster:
+    """Display pixels plus the georeferencing of the grid it was rendered on"""
+    # Interleaved (rows, cols, channels) uint8 buffer
+    pixels: np.ndarray = field(repr=False)
+    width: int
+    height: int
+    crs: Optional[CRS]
+    transform: Affine
+    bounds: Bounds
+    bounds_wgs84: Bounds
+    source: Dict[str, Any] = field(default_factory=dict)
+    _image: Optional[Image.Image] = field(default=None, init=False, repr=False)
+
+    @property
+    def image(self) -> Image.Image:
+        """PIL image of `pixels`, built on first use (an RGB image is a full copy)"""
+        if self._image is None:
+            self._image = image_from_pixels(self.pixels)
+        return self._image
+
+    @property
+    def leaflet_bounds(self):
+        return leaflet_bounds(self.bounds_wgs84)
+
+def describe(src) -> Dict[str, Any]:
+    """JSON-friendly header information of an open dataset"""
+    transform = src.transform
+    return {
+        'width': src.width,
+        'height': src.height,
+        'band_count': src.count,
+        'dtype': str(src.dtypes[0]),
+        'crs': crs_label(src.crs),
+        'bounds': [float(v) for v in src.bounds],
+        'transform': list(transform)[:6],
+        'pixel_size_x': abs(transform.a),
+        'pixel_size_y': abs(transform.e),
+        'nodata': src.nodata,
+    }
+
+def read_metadata(input_path) -> Dict[str, Any]:
+    with rasterio.open(input_path) as src:
+        return describe(src)
+
+def _display_bands(count: int):
+    """Bands that end up in the image: the first three, or the first one"""
+    return [1, 2, 3] if count >= 3 else [1]
+
+def _output_shape(width: int, height: int, max_size: Optional[int]) -> Tuple[int, int]:
+    if not max_size or max(width, height) <= max_size:
+        return width, height
+    scale = max_size / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def _channels(band_count: int, color_mode: str) -> int:
+    return 3 if band_count >= 3 or color_mode == 'rgb' else 1
+
+def render_raster(input_path, options: Optional[ProcessOptions] = None) -> RenderedRaster:
+    """Read, optionally reproject, and normalize an input into an interleaved uint8 buffer"""
+    options = options or ProcessOptions()
+    resampling = Resampling[options.resampling]
+    events = get_events()
+
+    with rasterio.open(input_path) as src:
+        source = describe(src)
+        if src.width == 0 or src.height == 0 or src.count == 0:
+            raise ValueError("Empty or corrupt raster")
+
+        src_crs = src.crs or as_crs(options.assume_crs)
+        target_crs = as_crs(options.target_crs)
+        nodata = src.nodata
+        needs_warp = src_crs is not None and target_crs is not None and src_crs != target_crs
+
+        indexes = _display_bands(src.count)
+        width, height = _output_shape(src.width, src.height, options.max_size)
+        decimated = (width, height) != (src.width, src.height)
+        transform = src.transform * Affine.scale(src.width / width, src.height / height)
+
+        tiled = False
+        if needs_warp:
+            dst_transform, dst_width, dst_height = calculate_default_transform(
+                src_crs, target_crs, width, height, *array_bounds(height, width, transform)
+            )
+            tiled = options.tiled_warp
+            if tiled is None:
+                tiled = not decimated and dst_width * dst_height >= tiled_warp.MIN_PIXELS
+
+        if not tiled:
+            with events.stage('read'):
+                data = scratch.allocate((len(indexes), height, width), src.dtypes[indexes[0] - 1], fill=None)
+                src.read(indexes, out=data, resampling=resampling)
+
+    if tiled:
+        # Warped tile by tile in separate processes, straight from the file
+        with events.stage('reproject'):
+            data = tiled_warp.warp_tiled(
+                str(input_path), indexes, src_crs, target_crs, dst_transform, dst_width, dst_height,
+                resampling=options.resampling, src_nodata=nodata, dst_nodata=nodata,
+            )
+        transform, width, height, crs = dst_transform, dst_width, dst_height, target_crs
+    elif needs_warp:
+        with events.stage('reproject'):
+            reprojected = scratch.allocate((data.shape[0], dst_height, dst_width), data.dtype)
+            reproject(
+                source=data,
+                destination=reprojected,
+                src_transform=transform,
+                src_crs=src_crs,
+                src_nodata=nodata,
+                dst_transform=dst_transform,
+                dst_crs=target_crs,
+                dst_nodata=nodata,
+                resampling=resampling,
+                num_threads=parallel.thread_count(),
+            )
+        data, transform, width, height, crs = reprojected, dst_transform, dst_width, dst_height, target_crs
+    else:
+        crs = src_crs or target_crs
+
+    # array_bounds returns (west, south, east, north)
+    bounds = tuple(float(v) for v in array_bounds(height, width, transform))
+    try:
+        bounds_wgs84 = to_wgs84_bounds(crs, bounds)
+    except Exception:
+        if options.fallback_bounds is None:
+            raise
+        bounds_wgs84 = tuple(options.fallback_bounds)
+
+    # Normalized straight into the interleaved buffer the image is built from
+    with events.stage('normalize'):
+        band_count = min(3, data.shape[0])
+        pixels = scratch.allocate((height, width, _channels(band_count, options.color_mode)), np.uint8, fill=None)
+        to_uint8(
+            data[:band_count], options.stretch, options.percentiles, nodata, options.ignore_zero,
+            out=pixels[..., :band_count], gamma=options.gamma, value_range=options.value_range,
+            channel_axis=-1,
+        )
+        if band_count < pixels.shape[-1]:
+            # Greyscale shown as RGB
+            pixels[..., band_count:] = pixels[..., :band_count]
+    del data
+    return RenderedRaster(
+        pixels=pixels,
+        width=width,
+        height=height,
+        crs=crs,
+        transform=transform,
+        bounds=bounds,
+        bounds_wgs84=bounds_wgs84,
+        source=source,
+    )
+
+def process_raster(
+    input_path,
+    output_dir,
+    stem: str,
+    options: Optional[ProcessOptions] = None,
+) -> Tuple[RenderedRaster, Dict[str, Any]]:
+    """Render an input and write it as <output_dir>/<stem><ext>; returns (raster, encode info)"""
+    options = options or ProcessOptions()
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    rendered = render_raster(input_path, options)
+    with get_events().stage('encode'):
+        encoded = save_pixels(rendered.pixels, output_dir, stem, options.encoder)
+    return rendered, encoded
@@ -0,0 +1,123 @@
+"""
+NDJSON progress events for the server/lib processors
+أحداث التقدم بصيغة NDJSON لمعالجات server/lib
+
+A processor has three streams:
+- stdout: only the final result, as one line of JSON
+- stderr: human-readable logs
+- RASTER_EVENTS_FD (an extra pipe the caller opens, e.g. fd 3): one JSON
+  event per line, flushed as it happens
+
+Events all carry "event" and "ts" (seconds since the processor started):
+  {"event": "start", "processor": "...", "input": "..."}
+  {"event": "progress", "percent": 40, "stage": "render", "message": "..."}
+  {"event": "stage", "stage": "reproject", "status": "start"}
+  {"event": "stage", "stage": "reproject", "status": "end", "seconds": 1.84}
+  {"event": "warning", "message": "..."}
+  {"event": "error", "message": "..."}
+  {"event": "item", "done": 12, "id": "...", "success": true}   (batch-processor)
+  {"event": "result", "success": true, "data": {...}}   (last)
+
+Without RASTER_EVENTS_FD events are dropped, so the engine can report
+stages unconditionally (the Celery worker never sets it). Stage hooks
+(add_stage_hook) wrap every stage regardless; the worker uses one to turn
+stages into trace spans.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from typing import Any, Callable, ContextManager, Dict, List, Optional, TextIO
+
+# Context managers entered around every stage, called with the stage name
+_stage_hooks: List[Callable[[str], ContextManager]] = []
+
+def add_stage_hook(hook: Callable[[str], ContextManager]):
+    _stage_hooks.append(hook)
+
+class EventStream:
+    """Writes events to a text stream, or nowhere when there is none"""
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        self._stream = stream
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    @classmethod
+    def from_env(cls) -> 'EventStream':
+        fd = os.getenv('RASTER_EVENTS_FD')
+        if not fd:
+            return cls()
+        try:
+            return cls(open(int(fd), 'w', buffering=1, encoding='utf-8', closefd=False))
+        except (OSError, ValueError):
+            # The caller did not actually open the descriptor
+            return cls()
+
+    @property
+    def enabled(self) -> bool:
+        return self._stream is not None
+
+    def emit(self, event: str, **fields):
+        if self._stream is None:
+            return
+        line = json.dumps(
+            {'event': event, 'ts': round(time.monotonic() - self._started, 3), **fields},
+            ensure_ascii=False, default=str,
+        )
+        with self._lock:
+            try:
+                self._stream.write(line + '\n')
+            except (OSError, ValueError):
+                # Reader went away; keep processing
+                self._stream = None
+
+    def start(self, processor: str, input_path=None):
+        self.emit('start', processor=processor, input=None if input_path is None else str(input_path))
+
+    def progress(self, percent: int, stage: Optional[str] = None, message: Optional[str] = None):
+        self.emit('progress', percent=percent, stage=stage, message=message)
+
+    def warning(self, message: str):
+        self.emit('warning', message=message)
+
+    def error(self, message: str):
+        self.emit('error', message=message)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Emit start/end events around a block, with its duration"""
+        self.emit('stage', stage=name, status='start')
+        start = time.perf_counter()
+        try:
+            with ExitStack() as hooks:
+                for hook in _stage_hooks:
+                    hooks.enter_context(hook(name))
+                yield
+        finally:
+            self.emit('stage', stage=name, status='end', seconds=round(time.perf_counter() - start, 4))
+
+_events: Optional[EventStream] = None
+
+def get_events() -> EventStream:
+    global _events
+    if _events is None:
+        _events = EventStream.from_env()
+    return _events
+
+@contextmanager
+def logs_to_stderr():
+    """Send print() output to stderr for the duration; yields the real stdout for the result"""
+    stdout = sys.stdout
+    with redirect_stdout(sys.stderr):
+        yield stdout
+
+def emit_result(result: Dict[str, Any], stdout: Optional[TextIO] = None):
+    """Final result: one JSON line on stdout plus the closing `result` event"""
+    get_events().emit('result', success=bool(result.get('success', True)), data=result)
+    stdout = stdout or sys.stdout
+    stdout.write(json.dumps(result, ensure_ascii=False) + '\n')
+    stdout.flush()
@@ -0,0 +1,59 @@
+"""
+Georeferencing helpers: WGS84 bounds, world files and projection files
+أدوات الإسناد الجغرافي: حدود WGS84 وملفات World و PRJ
+"""
+
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+
+from affine import Affine
+from rasterio.crs import CRS
+
+from .crs import get_crs, transform_bounds
+
+WGS84 = get_crs('EPSG:4326')
+
+Bounds = Tuple[float, float, float, float]  # west, south, east, north
+
+def as_crs(value) -> Optional[CRS]:
+    """CRS from a rasterio CRS, 'EPSG:xxxx' string, WKT or EPSG code"""
+    if value is None or value == '':
+        return None
+    return get_crs(value)
+
+def crs_label(crs: Optional[CRS]) -> str:
+    """'EPSG:xxxx' when the CRS has an EPSG code, WKT otherwise"""
+    if crs is None:
+        return 'UNKNOWN'
+    epsg = crs.to_epsg()
+    return f"EPSG:{epsg}" if epsg else crs.to_wkt()
+
+def to_wgs84_bounds(crs: Optional[CRS], bounds: Sequence[float]) -> Bounds:
+    """Transform (west, south, east, north) into WGS84, densifying the edges"""
+    if crs is None or crs == WGS84:
+        return tuple(float(v) for v in bounds)
+    return transform_bounds(crs, WGS84, bounds)
+
+def leaflet_bounds(bounds: Sequence[float]):
+    """[[south, west], [north, east]] from (west, south, east, north)"""
+    return [[bounds[1], bounds[0]], [bounds[3], bounds[2]]]
+
+def world_file_lines(transform: Affine):
+    """Six world-file values; the last two address the centre of the upper-left pixel"""
+    return [
+        transform.a,
+        transform.d,
+        transform.b,
+        transform.e,
+        transform.c + transform.a / 2 + transform.b / 2,
+        transform.f + transform.d / 2 + transform.e / 2,
+    ]
+
+def write_world_file(path, transform: Affine):
+    with open(path, 'w') as f:
+        for value in world_file_lines(transform):
+            f.write(f"{value}\n")
+
+def write_prj(path, crs: CRS):
+    """WKT1 projection file (.prj) as GDAL writes it"""
+    Path(path).write_text(crs.to_wkt())
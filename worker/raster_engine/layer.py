@@ -0,0 +1,90 @@
+"""
+Layer outputs: the rendered image plus its metadata.json
+مخرجات الطبقة: الصورة المعالجة وملف metadata.json
+
+The processors in server/lib and the batch runner all describe a layer with
+the same dict, written next to the image as metadata.json and returned as
+the processor result. layer_metadata() builds it and process_layer() runs
+the whole single-file path (render, encode, write metadata, progress
+events), so the processors keep only their argument parsing and, for ZIP
+uploads, the extraction.
+"""
+
+import json
+import os
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .engine import ProcessOptions, process_raster
+from .events import get_events
+
+def layer_metadata(raster, encoded: Dict[str, Any], original_name: str) -> Dict[str, Any]:
+    """metadata.json (and processor result) for a rendered layer"""
+    return {
+        "success": True,
+        "imageFile": encoded['filename'],
+        "image_format": encoded['format'],
+        "image_mime_type": encoded['mime_type'],
+        "bbox": list(raster.bounds_wgs84),  # [west, south, east, north]
+        "leaflet_bounds": raster.leaflet_bounds,  # [[south,west],[north,east]]
+        "width": raster.width,
+        "height": raster.height,
+        "crs": raster.crs.to_string() if raster.crs else None,
+        "original_name": original_name,
+        "processed_at": datetime.utcnow().isoformat() + "Z"
+    }
+
+def write_layer_metadata(output_dir, metadata: Dict[str, Any]) -> Path:
+    path = Path(output_dir) / 'metadata.json'
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    return path
+
+def process_layer(
+    input_path,
+    output_dir,
+    options: ProcessOptions,
+    original_name: Optional[str] = None,
+    stem: str = 'processed',
+) -> Dict[str, Any]:
+    """
+    Render input_path into output_dir and write its metadata.json. Returns the
+    metadata, or {"success": False, "error": ...}; never raises. Diagnostics
+    go to print() (the processors send it to stderr).
+    """
+    events = get_events()
+    try:
+        if not os.path.exists(input_path):
+            return {
+                "success": False,
+                "error": f"الملف غير موجود: {input_path}"
+            }
+
+        print(f"📊 معالجة GeoTIFF: {input_path}")
+        events.progress(10, 'render')
+        raster, encoded = process_raster(input_path, output_dir, stem, options)
+        source = raster.source
+        print(f"📏 الأبعاد: {source['width']}x{source['height']}")
+        print(f"🗺️ نظام الإحداثيات: {source['crs']}")
+        print(f"📍 الحدود: {source['bounds']}")
+        print(f"🎨 عدد النطاقات: {source['band_count']}")
+        print(f"✅ تم حفظ الصورة: {encoded['path']}")
+        events.progress(90, 'metadata')
+
+        metadata = layer_metadata(raster, encoded, original_name or os.path.basename(input_path))
+        write_layer_metadata(output_dir, metadata)
+
+        print("✅ تمت المعالجة بنجاح")
+        events.progress(100, 'done')
+        return metadata
+
+    except Exception as e:
+        print(f"❌ خطأ في معالجة GeoTIFF: {e}")
+        events.error(str(e))
+        traceback.print_exc()
+        return {
+            "success": False,
+            "error": f"خطأ في معالجة الملف: {str(e)}"
+        }
@@ -0,0 +1,260 @@
+"""
+Per-job memory profiles: RSS over time and allocation hot spots
+ملفات تعريف الذاكرة لكل مهمة
+
+A MemoryProfile samples the process RSS every RASTER_MEMPROFILE_INTERVAL
+seconds and runs tracemalloc (NumPy registers its array buffers with it, so
+large arrays show up at the line that allocated them). Whenever traced
+memory reaches a new high a snapshot is taken, so the allocation sites
+reported are the ones live at the peak rather than at the end. Samples are
+labelled with the engine stage running at the time (events stage hook).
+
+Memory the allocator does not see (GDAL's block cache, memory-mapped scratch
+arrays) is only in the RSS curve; child processes (tiled warp) only in
+children_peak_rss_mb. tracemalloc slows allocation-heavy Python code, so
+profiling is opt-in: RASTER_MEMPROFILE=true for every job, or per job.
+
+With a spool path the report so far is rewritten there every few seconds,
+so a process killed for running out of memory still leaves one behind.
+"""
+
+import json
+import os
+import resource
+import sysconfig
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from .events import add_stage_hook
+
+ENABLED = os.getenv('RASTER_MEMPROFILE', '').lower() in ('1', 'true', 'yes')
+INTERVAL = float(os.getenv('RASTER_MEMPROFILE_INTERVAL', '0.25'))
+TOP_SITES = int(os.getenv('RASTER_MEMPROFILE_TOP', '15'))
+FRAMES = int(os.getenv('RASTER_MEMPROFILE_FRAMES', '8'))
+SPOOL_SECONDS = 5.0
+# RSS curve points kept in the report (peaks survive the downsampling)
+MAX_POINTS = 240
+MB = 1024 * 1024
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is not available)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _mb(nbytes: float) -> float:
+    return round(nbytes / MB, 1)
+
+def _frame(frame) -> str:
+    return f"{frame.filename}:{frame.lineno}"
+
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+# NumPy, rasterio and the standard library allocate on our behalf; blame their caller
+_LIBRARY_PATHS = tuple({sysconfig.get_path(name) for name in ('stdlib', 'platstdlib', 'purelib', 'platlib')})
+
+def _site(traceback: tracemalloc.Traceback):
+    """Innermost frame outside installed libraries (frames run oldest to newest)"""
+    for frame in reversed(traceback):
+        if not frame.filename.startswith(_LIBRARY_PATHS):
+            return frame
+    return traceback[-1]
+
+def allocation_sites(snapshot: tracemalloc.Snapshot, top: int = TOP_SITES) -> List[Dict[str, Any]]:
+    """Live memory per allocating line of our code, with the call path of its largest block"""
+    sites: Dict[str, Dict[str, Any]] = {}
+    for trace in snapshot.filter_traces(_IGNORED).traces:
+        key = _frame(_site(trace.traceback))
+        site = sites.setdefault(key, {'site': key, 'size': 0, 'blocks': 0, 'largest': None})
+        site['size'] += trace.size
+        site['blocks'] += 1
+        if site['largest'] is None or trace.size > site['largest'].size:
+            site['largest'] = trace
+    ranked = sorted(sites.values(), key=lambda site: site['size'], reverse=True)[:top]
+    return [
+        {
+            'site': site['site'],
+            'size_mb': _mb(site['size']),
+            'blocks': site['blocks'],
+            'allocated_in': _frame(site['largest'].traceback[-1]),
+            'stack': [_frame(frame) for frame in site['largest'].traceback],
+        }
+        for site in ranked
+    ]
+
+class MemoryProfile:
+    def __init__(
+        self,
+        interval: float = INTERVAL,
+        top: int = TOP_SITES,
+        frames: int = FRAMES,
+        spool_path: Optional[str] = None,
+        info: Optional[Dict[str, Any]] = None,
+    ):
+        self.interval = interval
+        self.top = top
+        self.frames = frames
+        self.spool_path = spool_path
+        # Copied into the report (job id, input, ...)
+        self.info = dict(info or {})
+        self.stage: Optional[str] = None
+        self.samples: List[tuple] = []
+        self.stage_peaks: Dict[str, int] = {}
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._snapshot_traced = 0
+        self._sites: Optional[List[Dict[str, Any]]] = None
+        self._owns_tracemalloc = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+        self._ended: Optional[float] = None
+        self.python_peak: Optional[int] = None
+
+    def start(self):
+        global _active
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._owns_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._started = time.monotonic()
+        self._sample()
+        _active = self
+        self._thread = threading.Thread(target=self._run, name='memory-profile', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        global _active
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._sample()
+        self._ended = time.monotonic()
+        self.python_peak = tracemalloc.get_traced_memory()[1]
+        if self._snapshot is None:
+            self._take_snapshot(tracemalloc.get_traced_memory()[0])
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+        if _active is self:
+            _active = None
+        self._spool()
+
+    def _sample(self):
+        rss = rss_bytes()
+        with self._lock:
+            self.samples.append((time.monotonic() - self._started, rss, self.stage))
+            if self.stage:
+                self.stage_peaks[self.stage] = max(self.stage_peaks.get(self.stage, 0), rss)
+        traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        # A new snapshot only when traced memory grows 10% past the last one
+        if traced > max(16 * MB, self._snapshot_traced * 1.1):
+            self._take_snapshot(traced)
+
+    def _take_snapshot(self, traced: int):
+        if not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot()
+        with self._lock:
+            self._snapshot = snapshot
+            self._snapshot_traced = traced
+            self._sites = None
+
+    def _run(self):
+        last_spool = time.monotonic()
+        while not self._stop.wait(self.interval):
+            self._sample()
+            if self.spool_path and time.monotonic() - last_spool >= SPOOL_SECONDS:
+                self._spool()
+                last_spool = time.monotonic()
+
+    def _spool(self):
+        if not self.spool_path:
+            return
+        temp = f"{self.spool_path}.tmp"
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f)
+        os.replace(temp, self.spool_path)
+
+    def _curve(self) -> List[list]:
+        with self._lock:
+            samples = list(self.samples)
+        step = max(1, -(-len(samples) // MAX_POINTS))
+        curve = []
+        for i in range(0, len(samples), step):
+            t, rss, stage = max(samples[i:i + step], key=lambda sample: sample[1])
+            curve.append([round(t, 2), _mb(rss), stage])
+        return curve
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot, sites = self._snapshot, self._sites
+        if sites is None and snapshot is not None:
+            sites = allocation_sites(snapshot, self.top)
+            with self._lock:
+                if self._snapshot is snapshot:
+                    self._sites = sites
+        rss = [sample[1] for sample in self.samples] or [0]
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+        return {
+            **self.info,
+            'complete': self._ended is not None,
+            'seconds': round((self._ended or time.monotonic()) - self._started, 2),
+            'interval': self.interval,
+            'start_rss_mb': _mb(rss[0]),
+            'peak_rss_mb': _mb(max(rss)),
+            'end_rss_mb': _mb(rss[-1]),
+            'children_peak_rss_mb': _mb(children),
+            'python_peak_mb': _mb(self.python_peak if self.python_peak is not None else tracemalloc.get_traced_memory()[1]),
+            'snapshot_traced_mb': _mb(self._snapshot_traced),
+            'stage_peak_rss_mb': {stage: _mb(peak) for stage, peak in self.stage_peaks.items()},
+            'rss_mb': self._curve(),  # [seconds, MB, stage]
+            'top_allocations': sites or [],
+        }
+
+# Stage labels for the profile that is running, if any
+_active: Optional[MemoryProfile] = None
+
+@contextmanager
+def _label_stage(name: str):
+    profile = _active
+    if profile is None:
+        yield
+        return
+    previous, profile.stage = profile.stage, name
+    try:
+        yield
+    finally:
+        profile.stage = previous
+
+add_stage_hook(_label_stage)
+
+@contextmanager
+def memory_profile(enabled: Optional[bool] = None, **kwargs) -> Iterator[Optional[MemoryProfile]]:
+    """Profile a block when enabled (default RASTER_MEMPROFILE); yields None otherwise"""
+    if not (ENABLED if enabled is None else enabled):
+        yield None
+        return
+    profile = MemoryProfile(**kwargs)
+    profile.start()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+
+def attach_report(result: Dict[str, Any], profile: Optional[MemoryProfile]) -> Dict[str, Any]:
+    """Add a finished profile's report to a processor result as `memory_profile`"""
+    if profile is not None:
+        result['memory_profile'] = profile.report()
+    return result
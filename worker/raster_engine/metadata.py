@@ -0,0 +1,131 @@
+"""
+Header-only raster metadata with a persistent cache
+قراءة البيانات الوصفية من ترويسة الملف مع ذاكرة تخزين دائمة
+
+GeoTIFFs inside ZIP uploads are opened in place through GDAL's /vsizip/
+reader: only the central directory, the TIFF header and the IFD with its
+GeoKeys are read, nothing is extracted. Results are stored in a SQLite
+file (RASTER_METADATA_CACHE; empty disables it) keyed by a sampled content
+hash, the size and the mtime of the input, so repeat calls for the same
+upload are a single indexed lookup.
+
+The hash covers the first, middle and last RASTER_METADATA_HASH_BYTES of the
+file rather than all of it, keeping cold calls independent of file size; the
+size and mtime in the key catch edits the samples miss.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import rasterio
+
+from .archive import choose_geotiff, is_zip, vsizip_path
+from .engine import describe
+
+# Bump when the stored dict changes shape
+SCHEMA_VERSION = 1
+HASH_SAMPLE_BYTES = int(os.getenv('RASTER_METADATA_HASH_BYTES', str(64 * 1024)))
+
+def _default_cache_path() -> str:
+    cache_home = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'raster_engine', 'metadata.sqlite')
+
+CACHE_PATH = os.getenv('RASTER_METADATA_CACHE', _default_cache_path())
+
+def sampled_hash(path, sample_bytes: int = HASH_SAMPLE_BYTES) -> str:
+    """blake2b over the head, middle and tail of a file"""
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        if size <= 3 * sample_bytes:
+            digest.update(f.read())
+        else:
+            for offset in (0, size // 2 - sample_bytes // 2, size - sample_bytes):
+                f.seek(offset)
+                digest.update(f.read(sample_bytes))
+    return digest.hexdigest()
+
+def cache_key(path, member: Optional[str] = None, largest: bool = False) -> str:
+    stat = os.stat(path)
+    selector = member or ('largest' if largest else 'first')
+    return f"v{SCHEMA_VERSION}:{sampled_hash(path)}:{stat.st_size}:{stat.st_mtime_ns}:{selector}"
+
+class MetadataCache:
+    """Key -> metadata dict in a SQLite file shared by every process on the host"""
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS raster_metadata ('
+                'key TEXT PRIMARY KEY, info TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute('SELECT info FROM raster_metadata WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, info: Dict[str, Any]):
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO raster_metadata (key, info, created_at) VALUES (?, ?, ?)',
+                (key, json.dumps(info), time.time()),
+            )
+
+_cache: Optional[MetadataCache] = None
+
+def get_cache() -> Optional[MetadataCache]:
+    global _cache
+    if not CACHE_PATH:
+        return None
+    if _cache is None:
+        _cache = MetadataCache(CACHE_PATH)
+    return _cache
+
+def dataset_path(path, member: Optional[str] = None, largest: bool = False) -> str:
+    """Path rasterio can open directly: the file itself, or its GeoTIFF member through /vsizip/"""
+    if not is_zip(path):
+        return str(path)
+    return vsizip_path(path, member or choose_geotiff(path, largest=largest).filename)
+
+def read_metadata(path, member: Optional[str] = None, largest: bool = False) -> Dict[str, Any]:
+    """describe() of a GeoTIFF or of a GeoTIFF member of a ZIP, plus the member name"""
+    cache = get_cache()
+    key = None
+    if cache is not None:
+        try:
+            key = cache_key(path, member, largest)
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        except sqlite3.Error:
+            # A broken or locked cache must not fail the read
+            cache = None
+
+    if is_zip(path):
+        member = member or choose_geotiff(path, largest=largest).filename
+    with rasterio.open(dataset_path(path, member, largest)) as src:
+        info = describe(src)
+    info['member'] = member or Path(path).name
+
+    if cache is not None:
+        try:
+            cache.put(key, info)
+        except sqlite3.Error:
+            pass
+    return info
@@ -0,0 +1,271 @@
+"""
+Band normalization to 8-bit display values
+تطبيع النطاقات إلى قيم عرض 8-بت
+
+Stretches:
+- percentile: map the [low, high] percentiles of valid pixels to 0-255
+- minmax: map the band minimum/maximum to 0-255
+- linear: map an explicit value_range (e.g. 0-4095 for 12-bit sensors) to 0-255
+- clip: keep values as they are, clipped to 0-255
+Any stretch can be followed by a gamma curve (gamma > 1 brightens).
+
+uint8 and uint16 bands take a lookup-table path: statistics come from an
+exact histogram and each block is mapped with one np.take through a 256 or
+65,536 entry uint8 table, so no per-pixel arithmetic runs at all.
+
+Bands are written straight into a caller-provided uint8 buffer, either
+band-sequential or pixel-interleaved (channel_axis=-1). Arithmetic runs on row blocks
+with one reused scratch buffer of RASTER_NORMALIZE_BLOCK_PIXELS elements
+per thread, in float32 unless the input needs float64; bands and row blocks
+run concurrently on the shared raster thread pool. Nodata and non-finite
+pixels become 0; constant bands become 0 instead of dividing by zero.
+"""
+
+import math
+import os
+import threading
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import parallel
+
+STRETCHES = ('percentile', 'minmax', 'linear', 'clip')
+LUT_DTYPES = (np.dtype(np.uint8), np.dtype(np.uint16))
+
+BLOCK_PIXELS = int(os.getenv('RASTER_NORMALIZE_BLOCK_PIXELS', str(1024 * 1024)))
+# Percentiles are estimated from a regular subsample of at most this many pixels
+STATS_SAMPLE_PIXELS = int(os.getenv('RASTER_STATS_SAMPLE_PIXELS', str(1024 * 1024)))
+
+def work_dtype(dtype) -> np.dtype:
+    """float32 unless the input has more precision than float32 can carry"""
+    dtype = np.dtype(dtype)
+    if dtype.itemsize >= 8 or (dtype.kind in 'iu' and dtype.itemsize >= 4):
+        return np.dtype(np.float64)
+    return np.dtype(np.float32)
+
+def block_rows(width: int, block_pixels: int = BLOCK_PIXELS) -> int:
+    return max(1, block_pixels // max(1, width))
+
+def _has_nodata(nodata) -> bool:
+    return nodata is not None and not (isinstance(nodata, float) and math.isnan(nodata))
+
+def invalid_mask(block: np.ndarray, nodata=None, ignore_zero: bool = False) -> Optional[np.ndarray]:
+    """Pixels excluded from statistics and written as 0, or None when there are none to check"""
+    mask = None
+    if _has_nodata(nodata):
+        mask = block == nodata
+    if block.dtype.kind == 'f':
+        nonfinite = ~np.isfinite(block)
+        mask = nonfinite if mask is None else np.logical_or(mask, nonfinite, out=mask)
+    if ignore_zero:
+        zero = block <= 0
+        mask = zero if mask is None else np.logical_or(mask, zero, out=mask)
+    return mask
+
+def _sample(band: np.ndarray, max_pixels: int) -> np.ndarray:
+    """Strided view with at most ~max_pixels elements (no copy)"""
+    step = max(1, math.ceil(math.sqrt(band.size / max_pixels)))
+    return band[::step, ::step] if step > 1 else band
+
+def band_range(
+    band: np.ndarray,
+    stretch: str = 'percentile',
+    percentiles: Sequence[float] = (2, 98),
+    nodata=None,
+    ignore_zero: bool = False,
+    value_range: Optional[Tuple[float, float]] = None,
+) -> Tuple[float, float]:
+    """Input values mapped to 0 and 255"""
+    if stretch == 'clip':
+        return 0.0, 255.0
+    if stretch == 'linear':
+        if value_range is None:
+            raise ValueError("The linear stretch needs a value_range")
+        return float(value_range[0]), float(value_range[1])
+    if band.dtype in LUT_DTYPES:
+        # Exact extremes need every pixel; percentiles are fine on the subsample
+        source = band if stretch == 'minmax' else _sample(band, STATS_SAMPLE_PIXELS)
+        return histogram_range(histogram(source, nodata, ignore_zero), stretch, percentiles)
+
+    if stretch == 'minmax':
+        # Exact, block by block, so no band-sized temporaries
+        low, high = math.inf, -math.inf
+        rows = block_rows(band.shape[-1])
+        for start in range(0, band.shape[0], rows):
+            block = band[start:start + rows]
+            mask = invalid_mask(block, nodata, ignore_zero)
+            values = block if mask is None else block[~mask]
+            if values.size:
+                low = min(low, float(values.min()))
+                high = max(high, float(values.max()))
+        return (low, high) if low <= high else (0.0, 0.0)
+
+    sample = _sample(band, STATS_SAMPLE_PIXELS)
+    mask = invalid_mask(sample, nodata, ignore_zero)
+    values = sample if mask is None else sample[~mask]
+    if values.size == 0:
+        return 0.0, 0.0
+    low, high = np.percentile(values, percentiles)
+    return float(low), float(high)
+
+def stretch_band(
+    band: np.ndarray,
+    low: float,
+    high: float,
+    out: np.ndarray,
+    nodata=None,
+    scratch: Optional[np.ndarray] = None,
+    gamma: float = 1.0,
+) -> np.ndarray:
+    """Map [low, high] to 0-255 (then the gamma curve) into the uint8 array `out`"""
+    if high <= low:
+        out[...] = 0
+        return out
+    if band.dtype in LUT_DTYPES:
+        return apply_lut(band, build_lut(band.dtype, low, high, gamma, nodata), out)
+
+    height, width = band.shape
+    rows = block_rows(width)
+    dtype = work_dtype(band.dtype)
+    if scratch is None or scratch.dtype != dtype or scratch.size < rows * width:
+        scratch = np.empty(rows * width, dtype=dtype)
+    scale = dtype.type(255.0 / (high - low))
+    offset = dtype.type(low)
+
+    for start in range(0, height, rows):
+        block = band[start:start + rows]
+        work = scratch[:block.size].reshape(block.shape)
+        np.subtract(block, offset, out=work, dtype=dtype, casting='unsafe')
+        np.multiply(work, scale, out=work)
+        np.clip(work, 0, 255, out=work)
+        if gamma != 1.0:
+            _apply_gamma(work, gamma)
+        # Zero/negative pixels already clip to 0, so only nodata and NaN need masking
+        mask = invalid_mask(block, nodata)
+        if mask is not None:
+            work[mask] = 0
+        np.copyto(out[start:start + rows], work, casting='unsafe')
+    return out
+
+_scratch = threading.local()
+
+def _thread_scratch(size: int, dtype: np.dtype) -> np.ndarray:
+    """Per-thread reusable scratch buffer"""
+    buffer = getattr(_scratch, 'buffer', None)
+    if buffer is None or buffer.dtype != dtype or buffer.size < size:
+        buffer = _scratch.buffer = np.empty(size, dtype=dtype)
+    return buffer
+
+def _apply_gamma(work: np.ndarray, gamma: float):
+    """In place: 255 * (work / 255) ** (1 / gamma)"""
+    np.multiply(work, 1.0 / 255.0, out=work)
+    np.power(work, 1.0 / gamma, out=work)
+    np.multiply(work, 255.0, out=work)
+
+# Lookup-table path (uint8 / uint16)
+
+def histogram(band: np.ndarray, nodata=None, ignore_zero: bool = False) -> np.ndarray:
+    """Exact value counts of a uint8/uint16 band, with excluded values zeroed"""
+    size = np.iinfo(band.dtype).max + 1
+    counts = np.zeros(size, dtype=np.int64)
+    rows = block_rows(band.shape[-1])
+    for start in range(0, band.shape[0], rows):
+        counts += np.bincount(band[start:start + rows].ravel(), minlength=size)
+    if _has_nodata(nodata) and 0 <= nodata < size and float(nodata).is_integer():
+        counts[int(nodata)] = 0
+    if ignore_zero:
+        counts[0] = 0
+    return counts
+
+def histogram_range(counts: np.ndarray, stretch: str, percentiles: Sequence[float]) -> Tuple[float, float]:
+    """minmax or percentiles (numpy's linear interpolation) from a histogram"""
+    present = np.flatnonzero(counts)
+    if present.size == 0:
+        return 0.0, 0.0
+    if stretch == 'minmax':
+        return float(present[0]), float(present[-1])
+
+    cdf = np.cumsum(counts)
+    total = int(cdf[-1])
+    values = []
+    for percentile in percentiles:
+        rank = percentile / 100.0 * (total - 1)
+        below = int(np.searchsorted(cdf, math.floor(rank), side='right'))
+        above = int(np.searchsorted(cdf, math.ceil(rank), side='right'))
+        values.append(below + (rank - math.floor(rank)) * (above - below))
+    return float(values[0]), float(values[1])
+
+def build_lut(dtype, low: float, high: float, gamma: float = 1.0, nodata=None) -> np.ndarray:
+    """uint8 table indexed by every possible input value"""
+    size = np.iinfo(dtype).max + 1
+    if high <= low:
+        return np.zeros(size, dtype=np.uint8)
+    values = np.arange(size, dtype=np.float64)
+    values -= low
+    values *= 255.0 / (high - low)
+    np.clip(values, 0, 255, out=values)
+    if gamma != 1.0:
+        _apply_gamma(values, gamma)
+    lut = values.astype(np.uint8)
+    if _has_nodata(nodata) and 0 <= nodata < size and float(nodata).is_integer():
+        lut[int(nodata)] = 0
+    return lut
+
+def apply_lut(band: np.ndarray, lut: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """out = lut[band], block by block and without temporaries"""
+    rows = block_rows(band.shape[-1])
+    for start in range(0, band.shape[0], rows):
+        np.take(lut, band[start:start + rows], out=out[start:start + rows], mode='clip')
+    return out
+
+def to_uint8(
+    data: np.ndarray,
+    stretch: str = 'percentile',
+    percentiles: Sequence[float] = (2, 98),
+    nodata=None,
+    ignore_zero: bool = False,
+    out: Optional[np.ndarray] = None,
+    gamma: float = 1.0,
+    value_range: Optional[Tuple[float, float]] = None,
+    channel_axis: int = 0,
+) -> np.ndarray:
+    """Normalize a (bands, rows, cols) array into `out` (allocated when not given)
+
+    channel_axis=-1 takes a pixel-interleaved (rows, cols, bands) `out`, e.g.
+    the buffer an RGB image is built from; each band is written to its channel.
+    """
+    if stretch not in STRETCHES:
+        raise ValueError(f"Unsupported stretch: {stretch}")
+    if out is None:
+        out = np.empty(np.moveaxis(data, 0, channel_axis).shape, dtype=np.uint8)
+    # (bands, rows, cols) view of `out`, whatever its layout
+    channels = np.moveaxis(out, channel_axis, 0)
+
+    if data.dtype == np.uint8 and stretch == 'clip' and gamma == 1.0 and not _has_nodata(nodata):
+        np.copyto(channels, data)
+        return out
+
+    # Statistics per band, then every (band, row block) pair as one flat task list
+    ranges = parallel.map_ordered(
+        lambda band: band_range(band, stretch, percentiles, nodata, ignore_zero, value_range), data
+    )
+    luts = [
+        build_lut(band.dtype, low, high, gamma, nodata) if band.dtype in LUT_DTYPES else None
+        for band, (low, high) in zip(data, ranges)
+    ]
+    height, width = data.shape[1:]
+    windows = parallel.row_windows(height, block_rows(width))
+
+    def run(task):
+        index, (start, stop) = task
+        band, band_out = data[index, start:stop], channels[index, start:stop]
+        if luts[index] is not None:
+            np.take(luts[index], band, out=band_out, mode='clip')
+        else:
+            low, high = ranges[index]
+            scratch = _thread_scratch(band.size, work_dtype(band.dtype))
+            stretch_band(band, low, high, band_out, nodata, scratch, gamma)
+
+    parallel.map_ordered(run, [(index, window) for index in range(data.shape[0]) for window in windows])
+    return out
@@ -0,0 +1,58 @@
+"""
+Shared thread pool for band- and block-level work
+مجمع خيوط مشترك لمعالجة النطاقات والكتل
+
+NumPy ufuncs, zlib and GDAL release the GIL, so bands and row blocks can be
+processed concurrently by threads. One pool is shared per process and sized
+by RASTER_THREADS; when unset, the CPUs are divided between the Celery
+worker processes (CELERY_WORKER_CONCURRENCY) so a busy worker does not run
+concurrency x cpu_count threads. CLI processors get every core.
+
+Work submitted to the pool must not itself wait on the pool: callers flatten
+nested loops (bands x blocks) into one task list instead.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def thread_count() -> int:
+    """Threads available to one job in this process"""
+    configured = os.getenv('RASTER_THREADS')
+    if configured:
+        return max(1, int(configured))
+    processes = int(os.getenv('CELERY_WORKER_CONCURRENCY', '1'))
+    return max(1, (os.cpu_count() or 1) // max(1, processes))
+
+def get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=thread_count(), thread_name_prefix='raster')
+        return _pool
+
+def _reset_after_fork():
+    # Pool threads do not survive fork (Celery prefork children); start fresh
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def map_ordered(fn: Callable[[T], R], items: Iterable[T]) -> List[R]:
+    """fn over items on the shared pool, results in input order; serial when it cannot help"""
+    items = list(items)
+    if len(items) <= 1 or thread_count() == 1:
+        return [fn(item) for item in items]
+    return list(get_pool().map(fn, items))
+
+def row_windows(height: int, rows: int) -> List[Tuple[int, int]]:
+    """[start, stop) row ranges covering height"""
+    return [(start, min(start + rows, height)) for start in range(0, height, max(1, rows))]
@@ -0,0 +1,25 @@
+"""
+Quick-look previews published before the full-resolution outputs
+معاينة سريعة تُنشر قبل مخرجات الدقة الكاملة
+
+A quick-look is a small (RASTER_QUICKLOOK_SIZE) render of the input in WGS84.
+The read is decimated with nearest resampling, which GDAL serves from the
+closest overview level when the file has overviews and from every n-th
+row/column otherwise, so its cost follows the output size rather than the
+input size. The full preview replaces it once the pipeline finishes.
+"""
+
+import os
+from dataclasses import replace
+from typing import Optional
+
+from .engine import ProcessOptions, RenderedRaster, render_raster
+
+SIZE = int(os.getenv('RASTER_QUICKLOOK_SIZE', '512'))
+
+def quicklook_options(options: Optional[ProcessOptions] = None, size: int = SIZE) -> ProcessOptions:
+    """`options` (the full preview's) reduced to a quick, overview-friendly read"""
+    return replace(options or ProcessOptions(), max_size=size, resampling='nearest', tiled_warp=False)
+
+def render_quicklook(input_path, options: Optional[ProcessOptions] = None, size: int = SIZE) -> RenderedRaster:
+    return render_raster(input_path, quicklook_options(options, size))
@@ -0,0 +1,110 @@
+"""
+Scratch arrays for full-size intermediates
+مصفوفات مؤقتة للبيانات الوسيطة كاملة الحجم
+
+Arrays below RASTER_SCRATCH_MEMMAP_MIN_BYTES are ordinary NumPy arrays.
+Larger ones are memory-mapped files in RASTER_SCRATCH_DIR, so the page cache
+(not the worker's heap) holds them and rasters larger than RAM still go
+through the same code. Point RASTER_SCRATCH_DIR at a tmpfs (/dev/shm, or the
+alias 'tmpfs') to keep them in shared memory instead of on disk.
+
+A mapped file is unlinked as soon as it is mapped: the kernel frees it when
+the array is dropped, whether the job succeeds, raises, or the process is
+killed on cancellation. Files other processes must open by name
+(scratch_file) are removed when the block exits; sweep() removes any left
+behind by processes that no longer exist.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+MEMMAP_MIN_BYTES = int(os.getenv('RASTER_SCRATCH_MEMMAP_MIN_BYTES', str(512 * 1024 ** 2)))
+PREFIX = 'raster_scratch_'
+TMPFS_DIR = '/dev/shm'
+
+def scratch_dir() -> str:
+    configured = os.getenv('RASTER_SCRATCH_DIR')
+    if configured == 'tmpfs':
+        return TMPFS_DIR
+    return configured or tempfile.gettempdir()
+
+def _create(nbytes: int, directory: Optional[str]):
+    """Sized (sparse, zero-filled) scratch file tagged with this process id"""
+    directory = directory or scratch_dir()
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=f"{PREFIX}{os.getpid()}_", suffix='.dat', dir=directory)
+    try:
+        os.ftruncate(fd, max(1, nbytes))
+    except BaseException:
+        os.close(fd)
+        os.unlink(path)
+        raise
+    return fd, path
+
+def allocate(
+    shape: Sequence[int],
+    dtype,
+    fill=0,
+    directory: Optional[str] = None,
+    min_bytes: Optional[int] = None,
+) -> np.ndarray:
+    """Array of shape/dtype filled with `fill` (None: uninitialized), file-backed when large"""
+    dtype = np.dtype(dtype)
+    shape = tuple(int(n) for n in shape)
+    nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    if nbytes < (MEMMAP_MIN_BYTES if min_bytes is None else min_bytes):
+        if fill is None:
+            return np.empty(shape, dtype=dtype)
+        return np.full(shape, fill, dtype=dtype)
+
+    fd, path = _create(nbytes, directory)
+    try:
+        array = np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+    finally:
+        # The mapping keeps the data alive after the name is gone
+        os.close(fd)
+        os.unlink(path)
+    if fill is not None and fill != 0:
+        array[...] = fill
+    return array
+
+@contextmanager
+def scratch_file(nbytes: int, directory: Optional[str] = None):
+    """Path of a zero-filled scratch file for other processes to map; removed on exit"""
+    fd, path = _create(nbytes, directory)
+    os.close(fd)
+    try:
+        yield path
+    finally:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def sweep(directory: Optional[str] = None) -> int:
+    """Remove scratch files whose owning process is gone; returns the number removed"""
+    removed = 0
+    for path in Path(directory or scratch_dir()).glob(f"{PREFIX}*.dat"):
+        pid = path.name[len(PREFIX):].split('_', 1)[0]
+        if not pid.isdigit() or process_alive(int(pid)):
+            continue
+        try:
+            path.unlink()
+            removed += 1
+        except OSError:
+            pass
+    return removed
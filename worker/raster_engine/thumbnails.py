@@ -0,0 +1,47 @@
+"""
+Thumbnail pyramid for layer lists, panels and map overlays
+صور مصغرة متدرجة لقوائم الطبقات واللوحات والخريطة
+
+Sizes (RASTER_THUMBNAIL_SIZES, longest side in pixels) are made in one pass
+from the largest down: each level is resampled from the level above it, so
+the small ones never touch the full preview. Sizes that are not smaller than
+the source image are not written; callers point them at the source itself.
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from PIL import Image
+
+from .encoders import EncoderOptions, save_image
+
+def _parse_sizes(value: str) -> List[int]:
+    return sorted({int(size) for size in value.split(',') if size.strip()}, reverse=True)
+
+SIZES = _parse_sizes(os.getenv('RASTER_THUMBNAIL_SIZES', '128,512,2048'))
+
+def fit_size(width: int, height: int, size: int):
+    """(width, height) scaled so the longest side is `size`"""
+    scale = size / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def make_thumbnails(
+    image: Image.Image,
+    output_dir,
+    stem: str,
+    sizes: Optional[Sequence[int]] = None,
+    options: Optional[EncoderOptions] = None,
+) -> List[Dict[str, Any]]:
+    """Write <stem>_<size><ext> per size smaller than `image`, largest first; returns encode info per level"""
+    options = options or EncoderOptions.from_env()
+    levels = []
+    current = image
+    for size in sorted(set(sizes or SIZES), reverse=True):
+        if size >= max(current.size):
+            continue
+        # reducing_gap: box-reduce by whole factors first, then a short Lanczos pass
+        current = current.resize(fit_size(*current.size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        encoded = save_image(current, output_dir, f"{stem}_{size}", options)
+        encoded.update({'size': size, 'width': current.width, 'height': current.height})
+        levels.append(encoded)
+    return levels
@@ -0,0 +1,161 @@
+"""
+Tiled reprojection across processes
+إعادة الإسقاط المجزأة على عدة عمليات
+
+The destination grid is split into square tiles. Each tile is warped in its
+own process straight from the source file: the tile's footprint is
+transformed back into the source CRS, the matching source window is read
+(padded by the resampling kernel's reach), warped, and written into a shared
+memory-mapped scratch file. Every destination pixel sees the same source
+pixels it would in a single warp, so tile edges are seamless.
+
+Processes are used because a single GDAL warp call saturates one core on
+large inputs. Celery prefork children are daemonic and cannot start
+processes; there the tiles run on the shared thread pool instead (GDAL
+releases the GIL while warping).
+"""
+
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.enums import Resampling
+from rasterio.warp import reproject
+from rasterio.windows import Window, bounds as window_bounds, from_bounds, transform as window_transform
+
+from . import parallel, scratch
+from .crs import crs_key, transform_bounds
+
+TILE_SIZE = int(os.getenv('RASTER_WARP_TILE_SIZE', '2048'))
+# Destination grids with at least this many pixels use the tiled warp
+MIN_PIXELS = int(os.getenv('RASTER_TILED_WARP_MIN_PIXELS', str(8192 * 8192)))
+
+# Source pixels a destination pixel can reach at 1:1 scale, per resampling kernel
+KERNEL_RADIUS = {
+    'nearest': 1,
+    'bilinear': 2,
+    'cubic': 3,
+    'cubic_spline': 3,
+    'lanczos': 4,
+}
+
+def process_count() -> int:
+    configured = os.getenv('RASTER_WARP_PROCESSES')
+    return max(1, int(configured)) if configured else parallel.thread_count()
+
+def tile_windows(width: int, height: int, tile_size: int = TILE_SIZE):
+    return [
+        Window(col, row, min(tile_size, width - col), min(tile_size, height - row))
+        for row in range(0, height, tile_size)
+        for col in range(0, width, tile_size)
+    ]
+
+def source_window(src, src_crs, dst_crs, dst_tile_transform: Affine, tile: Window, resampling: str) -> Optional[Window]:
+    """Padded source window covering a destination tile, or None when it falls outside the source"""
+    footprint = window_bounds(Window(0, 0, tile.width, tile.height), dst_tile_transform)
+    west, south, east, north = transform_bounds(dst_crs, src_crs, footprint)
+    window = from_bounds(west, south, east, north, transform=src.transform)
+
+    # Downsampling widens the kernel in source pixels
+    scale = max(1.0, window.width / max(1, tile.width), window.height / max(1, tile.height))
+    pad = math.ceil(KERNEL_RADIUS.get(resampling, 1) * scale) + 1
+
+    col_start = max(0, math.floor(window.col_off) - pad)
+    row_start = max(0, math.floor(window.row_off) - pad)
+    col_stop = min(src.width, math.ceil(window.col_off + window.width) + pad)
+    row_stop = min(src.height, math.ceil(window.row_off + window.height) + pad)
+    if col_stop <= col_start or row_stop <= row_start:
+        return None
+    return Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+def _warp_tile(job: Dict[str, Any]):
+    """Warp one destination tile into the shared output (runs in a child process or thread)"""
+    tile = Window(*job['tile'])
+    output = np.memmap(job['output_path'], dtype=job['dtype'], mode='r+', shape=tuple(job['shape']))
+    destination = np.full(
+        (len(job['indexes']), int(tile.height), int(tile.width)),
+        job['dst_nodata'] if job['dst_nodata'] is not None else 0,
+        dtype=job['dtype'],
+    )
+
+    with rasterio.open(job['src_path']) as src:
+        dst_tile_transform = window_transform(tile, job['dst_transform'])
+        window = source_window(src, job['src_crs'], job['dst_crs'], dst_tile_transform, tile, job['resampling'])
+        if window is not None:
+            source = src.read(job['indexes'], window=window)
+            reproject(
+                source=source,
+                destination=destination,
+                src_transform=src.window_transform(window),
+                src_crs=job['src_crs'],
+                src_nodata=job['src_nodata'],
+                dst_transform=dst_tile_transform,
+                dst_crs=job['dst_crs'],
+                dst_nodata=job['dst_nodata'],
+                resampling=Resampling[job['resampling']],
+                num_threads=1,
+            )
+
+    rows = slice(int(tile.row_off), int(tile.row_off + tile.height))
+    cols = slice(int(tile.col_off), int(tile.col_off + tile.width))
+    output[:, rows, cols] = destination
+    output.flush()
+    del output
+
+def warp_tiled(
+    src_path: str,
+    indexes: Sequence[int],
+    src_crs,
+    dst_crs,
+    dst_transform: Affine,
+    dst_width: int,
+    dst_height: int,
+    resampling: str = 'bilinear',
+    src_nodata=None,
+    dst_nodata=None,
+    tile_size: int = TILE_SIZE,
+    processes: Optional[int] = None,
+    directory: Optional[str] = None,
+) -> np.memmap:
+    """Warp src_path onto the destination grid tile by tile; returns a (bands, rows, cols) memmap"""
+    with rasterio.open(src_path) as src:
+        dtype = np.dtype(src.dtypes[indexes[0] - 1])
+
+    shape = (len(indexes), dst_height, dst_width)
+    nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    # Every tile writer maps the same zero-filled scratch file by name
+    with scratch.scratch_file(nbytes, directory) as output_path:
+        jobs = [
+            {
+                'src_path': str(src_path),
+                'indexes': list(indexes),
+                'src_crs': crs_key(src_crs),
+                'dst_crs': crs_key(dst_crs),
+                'dst_transform': dst_transform,
+                'tile': (tile.col_off, tile.row_off, tile.width, tile.height),
+                'resampling': resampling,
+                'src_nodata': src_nodata,
+                'dst_nodata': dst_nodata,
+                'output_path': output_path,
+                'dtype': dtype.str,
+                'shape': shape,
+            }
+            for tile in tile_windows(dst_width, dst_height, tile_size)
+        ]
+
+        processes = processes or process_count()
+        if processes > 1 and len(jobs) > 1 and not multiprocessing.current_process().daemon:
+            # spawn: GDAL state inherited through fork is not safe to reuse
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=min(processes, len(jobs)), mp_context=context) as pool:
+                list(pool.map(_warp_tile, jobs))
+        else:
+            parallel.map_ordered(_warp_tile, jobs)
+
+        # The mapping keeps the data alive after the name is gone
+        return np.memmap(output_path, dtype=dtype, mode='r', shape=shape)
@@ -0,0 +1,289 @@
+"""
+Job Retention for Phase 1 Processing Pipeline
+الاحتفاظ بسجلات المهام لخط معالجة المرحلة الأولى
+
+processing_jobs can run in two layouts:
+
+- partitioned by day on created_at (after `python retention.py partition`):
+  retention detaches and drops whole partitions, so cleanup cost does not
+  grow with job volume and produces no per-row WAL or bloat.
+- a plain table: retention deletes finished jobs in small batches, committing
+  after each one and stopping when the time budget is spent.
+"""
+
+import os
+import re
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+import structlog
+
+logger = structlog.get_logger()
+
+RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', '7'))
+ROLLUP_RETENTION_DAYS = int(os.getenv('JOB_ROLLUP_RETENTION_DAYS', '30'))
+PARTITION_PRECREATE_DAYS = int(os.getenv('JOB_PARTITION_PRECREATE_DAYS', '7'))
+CLEANUP_BATCH_SIZE = int(os.getenv('JOB_CLEANUP_BATCH_SIZE', '1000'))
+CLEANUP_TIME_BUDGET_SECONDS = float(os.getenv('JOB_CLEANUP_TIME_BUDGET_SECONDS', '30'))
+
+PARTITION_PREFIX = 'processing_jobs_p'
+PARTITION_NAME_RE = re.compile(rf'^{PARTITION_PREFIX}(\d{{8}})$')
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+def is_partitioned(cur) -> bool:
+    cur.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = 'processing_jobs'
+        )
+    """)
+    return cur.fetchone()[0]
+
+def list_partitions(cur) -> Dict[date, str]:
+    """Daily partitions attached to processing_jobs, keyed by day"""
+    cur.execute("""
+        SELECT child.relname
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname = 'processing_jobs'
+    """)
+    partitions = {}
+    for (name,) in cur.fetchall():
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            partitions[datetime.strptime(match.group(1), '%Y%m%d').date()] = name
+    return partitions
+
+def create_partition(cur, day: date) -> str:
+    """
+    Create the partition for one day. Rows for that day already in the default
+    partition (the beat schedule stalled past the pre-created days) would make
+    CREATE ... PARTITION OF fail, so they are moved into a standalone table
+    that is then attached.
+    """
+    name = partition_name(day)
+    lower, upper = day.isoformat(), (day + timedelta(days=1)).isoformat()
+    # Keep new rows for the day out of the default partition until the new one is attached
+    cur.execute("SET LOCAL lock_timeout = '5s'")
+    cur.execute("LOCK TABLE processing_jobs_default IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute(
+        "SELECT EXISTS (SELECT 1 FROM processing_jobs_default WHERE created_at >= %s AND created_at < %s)",
+        (lower, upper),
+    )
+    if not cur.fetchone()[0]:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {name}
+            PARTITION OF processing_jobs
+            FOR VALUES FROM ('{lower}') TO ('{upper}')
+        """)
+        return name
+
+    cur.execute(f"CREATE TABLE {name} (LIKE processing_jobs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM processing_jobs_default
+            WHERE created_at >= %s AND created_at < %s
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, (lower, upper))
+    logger.info(f"Moved {cur.rowcount} rows from processing_jobs_default into {name}")
+    cur.execute(f"ALTER TABLE processing_jobs ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+    return name
+
+def ensure_partitions(cur, start: date, end: date, conn=None) -> List[str]:
+    """
+    Create missing daily partitions for [start, end]. With conn each day is
+    committed on its own, and a day that fails is logged and left for the
+    next run instead of aborting the caller.
+    """
+    existing = list_partitions(cur)
+    created = []
+    day = start
+    while day <= end:
+        if day not in existing:
+            try:
+                created.append(create_partition(cur, day))
+                if conn is not None:
+                    conn.commit()
+            except psycopg2.Error as e:
+                if conn is None:
+                    raise
+                conn.rollback()
+                logger.warning(f"Could not create partition {partition_name(day)}, retrying on the next cleanup run: {e}")
+        day += timedelta(days=1)
+    return created
+
+def drop_expired_partitions(conn, retention_days: int) -> List[str]:
+    """Detach and drop partitions whose whole day is older than the retention window"""
+    cutoff = datetime.now(timezone.utc).date() - timedelta(days=retention_days)
+    dropped = []
+    with conn.cursor() as cur:
+        for day, name in sorted(list_partitions(cur).items()):
+            if day + timedelta(days=1) > cutoff:
+                continue
+            try:
+                # Metadata-only operations; give up quickly instead of queueing behind long queries
+                cur.execute("SET LOCAL lock_timeout = '5s'")
+                cur.execute(f"ALTER TABLE processing_jobs DETACH PARTITION {name}")
+                cur.execute(f"DROP TABLE {name}")
+                conn.commit()
+            except psycopg2.errors.LockNotAvailable:
+                conn.rollback()
+                logger.warning(f"Partition {name} is busy, retrying on the next cleanup run")
+                break
+            dropped.append(name)
+    return dropped
+
+def delete_in_batches(
+    conn,
+    retention_days: int,
+    table: str = 'processing_jobs',
+    batch_size: int = CLEANUP_BATCH_SIZE,
+    time_budget: float = CLEANUP_TIME_BUDGET_SECONDS,
+) -> int:
+    """Delete finished jobs past retention in short transactions until done or out of time"""
+    deadline = time.monotonic() + time_budget
+    deleted = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute(f"""
+                DELETE FROM {table}
+                WHERE id IN (
+                    SELECT id FROM {table}
+                    WHERE status IN %s
+                    AND updated_at < NOW() - make_interval(days => %s)
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+            """, (FINISHED_STATUSES, retention_days, batch_size))
+            batch = cur.rowcount
+            conn.commit()
+            deleted += batch
+            if batch < batch_size or time.monotonic() >= deadline:
+                break
+    return deleted
+
+def run_retention(database_url: Optional[str], retention_days: int = RETENTION_DAYS) -> Dict[str, Any]:
+    """Apply job and rollup retention using whichever layout processing_jobs has"""
+    result: Dict[str, Any] = {'deleted_jobs': 0, 'dropped_partitions': [], 'created_partitions': []}
+    with psycopg2.connect(database_url) as conn:
+        with conn.cursor() as cur:
+            partitioned = is_partitioned(cur)
+
+        if partitioned:
+            result['mode'] = 'partitions'
+            today = datetime.now(timezone.utc).date()
+            with conn.cursor() as cur:
+                result['created_partitions'] = ensure_partitions(
+                    cur, today, today + timedelta(days=PARTITION_PRECREATE_DAYS), conn=conn
+                )
+            conn.commit()
+            result['dropped_partitions'] = drop_expired_partitions(conn, retention_days)
+            # Rows that landed in the default partition are still removed row by row
+            result['deleted_jobs'] = delete_in_batches(conn, retention_days, table='processing_jobs_default')
+        else:
+            result['mode'] = 'batched'
+            result['deleted_jobs'] = delete_in_batches(conn, retention_days)
+
+        with conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM processing_job_rollups
+                WHERE bucket < NOW() - make_interval(days => %s)
+            """, (ROLLUP_RETENTION_DAYS,))
+        conn.commit()
+
+    return result
+
+def convert_to_partitioned(database_url: Optional[str]) -> Dict[str, Any]:
+    """
+    One-off maintenance: rebuild processing_jobs as a table partitioned by day.
+    Holds an exclusive lock on processing_jobs while rows are copied, so run it
+    with the workers stopped.
+    """
+    with psycopg2.connect(database_url) as conn:
+        with conn.cursor() as cur:
+            if is_partitioned(cur):
+                return {'converted': False, 'reason': 'already partitioned'}
+
+            cur.execute("LOCK TABLE processing_jobs IN ACCESS EXCLUSIVE MODE")
+            cur.execute("ALTER TABLE processing_jobs RENAME TO processing_jobs_legacy")
+            cur.execute("ALTER INDEX IF EXISTS processing_jobs_pkey RENAME TO processing_jobs_legacy_pkey")
+            cur.execute("SELECT MIN(created_at)::date FROM processing_jobs_legacy")
+            first_day = cur.fetchone()[0]
+
+            # The partition key must be part of the primary key
+            cur.execute("""
+                CREATE TABLE processing_jobs (
+                    id VARCHAR(255) NOT NULL,
+                    layer_id VARCHAR(255),
+                    status VARCHAR(50) NOT NULL DEFAULT 'queued',
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    metadata JSONB,
+                    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    PRIMARY KEY (id, created_at)
+                ) PARTITION BY RANGE (created_at)
+            """)
+            # Catches rows outside the pre-created days if the beat schedule stalls
+            cur.execute("CREATE TABLE processing_jobs_default PARTITION OF processing_jobs DEFAULT")
+
+            today = datetime.now(timezone.utc).date()
+            created = ensure_partitions(
+                cur, first_day or today, today + timedelta(days=PARTITION_PRECREATE_DAYS)
+            )
+
+            cur.execute("""
+                INSERT INTO processing_jobs (id, layer_id, status, progress, metadata, created_at, updated_at)
+                SELECT id, layer_id, status, progress, metadata, COALESCE(created_at, updated_at, NOW()), updated_at
+                FROM processing_jobs_legacy
+            """)
+            copied = cur.rowcount
+
+            cur.execute("DROP TABLE processing_jobs_legacy")
+            cur.execute("CREATE INDEX idx_processing_jobs_status_created_at ON processing_jobs(status, created_at)")
+            cur.execute("CREATE INDEX idx_processing_jobs_created_at ON processing_jobs(created_at)")
+            cur.execute("CREATE INDEX idx_processing_jobs_layer_id ON processing_jobs(layer_id)")
+            cur.execute("""
+                CREATE INDEX idx_processing_jobs_active ON processing_jobs(created_at)
+                WHERE status IN ('queued', 'processing', 'preview_ready')
+            """)
+            cur.execute("""
+                CREATE INDEX idx_processing_jobs_finished_updated_at ON processing_jobs(updated_at)
+                WHERE status IN ('completed', 'failed', 'cancelled')
+            """)
+
+            # Rollups already cover the copied rows; attach the trigger only now
+            cur.execute("""
+                CREATE TRIGGER processing_jobs_rollup
+                    AFTER INSERT OR UPDATE ON processing_jobs
+                    FOR EACH ROW
+                    EXECUTE FUNCTION processing_jobs_rollup_trigger()
+            """)
+            cur.execute("SELECT to_regproc('update_updated_at_column') IS NOT NULL")
+            if cur.fetchone()[0]:
+                cur.execute("""
+                    CREATE TRIGGER update_processing_jobs_updated_at
+                        BEFORE UPDATE ON processing_jobs
+                        FOR EACH ROW
+                        EXECUTE FUNCTION update_updated_at_column()
+                """)
+        conn.commit()
+
+    logger.info(f"Partitioned processing_jobs: {copied} rows, {len(created)} partitions")
+    return {'converted': True, 'copied_rows': copied, 'created_partitions': created}
+
+if __name__ == '__main__':
+    commands = {'partition': convert_to_partitioned, 'cleanup': run_retention}
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        print("Usage: python retention.py <partition|cleanup>")
+        sys.exit(1)
+    print(commands[sys.argv[1]](os.getenv('DATABASE_URL')))
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Local Pipeline Runner for Phase 1 Processing Pipeline
+تشغيل خط المعالجة محلياً داخل عملية واحدة
+
+Runs tasks.process_geotiff / tasks.process_zip_archive eagerly in this
+process (Task.apply: same code path, signals and error handling as a worker,
+without the broker). Job state goes to the in-memory job store and outputs
+to local files, so no Redis, Postgres or MinIO is needed:
+
+    python run_local.py ortho.zip --output-dir /tmp/run --folded run.folded --cprofile run.prof
+
+    flamegraph.pl run.folded > run.svg       (or load run.folded in speedscope)
+    python run_local.py ortho.tif --trace run.traces.jsonl && python tracing.py run.traces.jsonl
+    py-spy record -o run.svg -- python run_local.py ortho.zip
+
+The summary on stdout includes the time between the job's status updates,
+which is where each pipeline stage's wall time shows up.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+# Local backends unless the caller chose otherwise; set before tasks is imported
+LOCAL_ENV = {
+    'JOB_STORE': 'memory',
+    'STORAGE_BACKEND': 'local',
+    'CELERY_BROKER_URL': 'memory://',
+    'CELERY_RESULT_BACKEND': 'cache+memory://',
+}
+
+def stage_timings(history):
+    """Seconds spent between consecutive status updates"""
+    stages = []
+    for (start, status, progress), (end, _, _) in zip(history, history[1:]):
+        stages.append({'status': status, 'progress': progress, 'seconds': round(end - start, 3)})
+    return stages
+
+def run(tasks, input_path: Path, output_dir: Path, layer_id: str, task_name: str, memory_profile: bool = False):
+    job_id = str(uuid.uuid4())
+    task = tasks.process_zip_archive if task_name == 'zip' else tasks.process_geotiff
+    tasks.job_store.create_job(job_id, layer_id, input_path.name, {'original_filename': input_path.name})
+
+    start = time.monotonic()
+    result = task.apply(
+        args=[job_id, str(input_path), layer_id, input_path.name],
+        task_id=job_id,
+        headers={'enqueued_at': time.time(), 'memory_profile': memory_profile},
+    )
+    finished = time.monotonic()
+
+    history = getattr(tasks.job_store, 'history', {}).get(job_id, [])
+    job = tasks.job_store.get_job(job_id) or {}
+    return {
+        'job_id': job_id,
+        'layer_id': layer_id,
+        'task': task.name,
+        'status': job.get('status'),
+        'succeeded': result.successful(),
+        'error': None if result.successful() else repr(result.result),
+        'seconds': round(finished - start, 3),
+        'stages': stage_timings(history + [(finished, 'done', 100)]) if history else [],
+        'output_dir': str(output_dir),
+        'metadata': job.get('metadata'),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', type=Path, help="GeoTIFF or ZIP upload")
+    parser.add_argument('--output-dir', type=Path, default=Path('local_run'), help="Where outputs are stored")
+    parser.add_argument('--layer-id', default=None)
+    parser.add_argument('--task', choices=('auto', 'geotiff', 'zip'), default='auto')
+    parser.add_argument('--cprofile', type=Path, help="Write cProfile stats (snakeviz, pstats)")
+    parser.add_argument('--folded', type=Path, help="Write folded stacks for a flame graph")
+    parser.add_argument('--interval', type=float, default=0.005, help="Stack sampling interval (seconds)")
+    parser.add_argument('--top', type=int, default=0, help="Print the top N cProfile entries to stderr")
+    parser.add_argument('--memory-profile', action='store_true', help="Profile memory (report in the layer outputs)")
+    parser.add_argument('--trace', type=Path, help="Append the job's trace spans to this JSON lines file")
+    args = parser.parse_args()
+
+    if not args.input.exists():
+        parser.error(f"Input not found: {args.input}")
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    for key, value in LOCAL_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ.setdefault('LOCAL_STORAGE_DIR', str(args.output_dir))
+    if args.trace:
+        os.environ['TRACING_EXPORTER'] = 'file'
+        os.environ['TRACING_FILE'] = str(args.trace)
+
+    task_name = args.task
+    if task_name == 'auto':
+        task_name = 'zip' if args.input.suffix.lower() == '.zip' else 'geotiff'
+    layer_id = args.layer_id or f"local_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+
+    # Imported outside the profile so start-up cost does not show up in it
+    import tasks
+    from profiling import profiled
+
+    with profiled(args.cprofile, args.folded, args.interval, args.top) as profile:
+        summary = run(tasks, args.input.resolve(), args.output_dir.resolve(), layer_id, task_name, args.memory_profile)
+    summary['profile'] = {
+        **profile,
+        'cprofile': str(args.cprofile) if args.cprofile else None,
+        'folded': str(args.folded) if args.folded else None,
+    }
+
+    print(json.dumps(summary, indent=2, ensure_ascii=False, default=str))
+    if not summary['succeeded']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Celery App and Task Signatures for Phase 1 Processing Pipeline
+تطبيق Celery وتواقيع المهام لخط معالجة المرحلة الأولى
+
+The task names, their arguments and the Celery app, without the task
+implementations. The dispatcher enqueues through these signatures by name,
+so it never imports tasks.py and the raster stack (rasterio, NumPy, PIL,
+pyproj) behind it; the same goes for `celery -A signatures inspect ping`
+and Flower. tasks.py registers the implementations on this app under the
+same names.
+"""
+
+from pathlib import Path
+from typing import Optional
+
+from celery import Celery, Signature
+
+import celeryconfig
+
+app = Celery('binaa_processing')
+app.config_from_object(celeryconfig)
+
+PROCESS_GEOTIFF = 'tasks.process_geotiff'
+PROCESS_ZIP_ARCHIVE = 'tasks.process_zip_archive'
+CLEANUP_OLD_JOBS = 'tasks.cleanup_old_jobs'
+UPDATE_PROCESSING_STATISTICS = 'tasks.update_processing_statistics'
+
+# Upload extension -> processing task
+PROCESSING_TASKS = {
+    '.tif': PROCESS_GEOTIFF,
+    '.tiff': PROCESS_GEOTIFF,
+    '.zip': PROCESS_ZIP_ARCHIVE,
+}
+
+def processing_task_name(filename: str) -> Optional[str]:
+    """Task that processes an upload, or None for unsupported file types"""
+    return PROCESSING_TASKS.get(Path(filename).suffix.lower())
+
+def process_upload(task_name: str, job_id: str, input_file_path: str, layer_id: str, original_filename: str) -> Signature:
+    """
+    Signature of a processing task; both take (job_id, input_file_path, layer_id,
+    original_filename). input_file_path is a shared path or a staged input reference.
+    """
+    return app.signature(task_name, args=(job_id, input_file_path, layer_id, original_filename))
@@ -0,0 +1,220 @@
+"""
+Layer Storage for Phase 1 Processing Pipeline
+تخزين مخرجات الطبقات لخط معالجة المرحلة الأولى
+
+Processed outputs (COG, previews, thumbnails, metadata.json) are uploaded
+through a Storage. STORAGE_BACKEND selects it: 'minio' (default) uploads to
+the MinIO bucket; 'local' copies into LOCAL_STORAGE_DIR, for running the
+pipeline in-process without any services (see run_local.py).
+
+The same Storage can stage job inputs (INPUT_STAGING=storage): the dispatcher
+stores the upload under STAGING_PREFIX and enqueues its reference, an
+s3://bucket/key URI for MinIO or a file:// URI for local storage, which
+workers on any node open through inputs.py.
+"""
+
+import os
+import shutil
+from abc import ABC, abstractmethod
+import threading
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+from typing import Dict, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+MINIO_ENDPOINT = os.getenv('MINIO_ENDPOINT', 'localhost:9000')
+MINIO_ACCESS_KEY = os.getenv('MINIO_ACCESS_KEY', 'minioadmin')
+MINIO_SECRET_KEY = os.getenv('MINIO_SECRET_KEY', 'minioadmin123')
+BUCKET_NAME = os.getenv('MINIO_BUCKET', 'binaa-layers')
+STAGING_PREFIX = os.getenv('STAGING_PREFIX', 'staging').strip('/')
+
+def parse_s3_uri(uri: str) -> Tuple[str, str]:
+    """(bucket, key) of an s3://bucket/key reference"""
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    return bucket, key
+
+class Storage(ABC):
+    @abstractmethod
+    def upload(self, local_path: str, object_name: str, content_type: str = 'application/octet-stream') -> str:
+        """Store local_path as object_name and return its URL"""
+
+    @abstractmethod
+    def stage(self, local_path: str, object_name: str) -> str:
+        """Store a job input; returns the reference the task receives"""
+
+    @abstractmethod
+    def fetch(self, reference: str, local_path: str):
+        """Download a staged input"""
+
+    @abstractmethod
+    def gdal_path(self, reference: str) -> str:
+        """Path GDAL reads a staged input from without downloading it"""
+
+    def gdal_config(self) -> Dict[str, str]:
+        """GDAL configuration needed to read gdal_path()"""
+        return {}
+
+    @abstractmethod
+    def remove(self, reference: str):
+        """Delete a staged input"""
+
+    @abstractmethod
+    def remove_staged(self, before: datetime) -> int:
+        """Delete staged inputs stored before `before` (timezone-aware); returns how many"""
+
+class MinioStorage(Storage):
+    def __init__(self, endpoint: str = MINIO_ENDPOINT, bucket: str = BUCKET_NAME):
+        self.endpoint = endpoint
+        self.bucket = bucket
+        self._client = None
+        self._bucket_checked = False
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Created on first upload; building it needs no connection but the import is not free
+        with self._lock:
+            if self._client is None:
+                from minio import Minio
+                self._client = Minio(
+                    self.endpoint,
+                    access_key=MINIO_ACCESS_KEY,
+                    secret_key=MINIO_SECRET_KEY,
+                    secure=False  # Development only
+                )
+            return self._client
+
+    def ensure_bucket(self):
+        """Ensure the MinIO bucket exists"""
+        from minio.error import S3Error
+        try:
+            if not self.client.bucket_exists(self.bucket):
+                self.client.make_bucket(self.bucket)
+                logger.info(f"Created bucket: {self.bucket}")
+        except S3Error as e:
+            logger.error(f"Error creating bucket: {e}")
+            raise
+
+    def upload(self, local_path: str, object_name: str, content_type: str = 'application/octet-stream') -> str:
+        from minio.error import S3Error
+        try:
+            if not self._bucket_checked:
+                self.ensure_bucket()
+                self._bucket_checked = True
+            self.client.fput_object(self.bucket, object_name, local_path, content_type=content_type)
+            # Generate public URL (development)
+            url = f"http://{self.endpoint}/{self.bucket}/{object_name}"
+            logger.info(f"Uploaded {local_path} to {url}")
+            return url
+        except S3Error as e:
+            logger.error(f"MinIO upload failed: {e}")
+            raise
+
+    def stage(self, local_path: str, object_name: str) -> str:
+        if not self._bucket_checked:
+            self.ensure_bucket()
+            self._bucket_checked = True
+        self.client.fput_object(self.bucket, object_name, local_path)
+        return f"s3://{self.bucket}/{object_name}"
+
+    def fetch(self, reference: str, local_path: str):
+        self.client.fget_object(*parse_s3_uri(reference), local_path)
+
+    def gdal_path(self, reference: str) -> str:
+        return '/vsis3/' + reference[len('s3://'):]
+
+    def gdal_config(self) -> Dict[str, str]:
+        return {
+            'AWS_S3_ENDPOINT': self.endpoint,
+            'AWS_ACCESS_KEY_ID': MINIO_ACCESS_KEY,
+            'AWS_SECRET_ACCESS_KEY': MINIO_SECRET_KEY,
+            'AWS_HTTPS': 'NO',  # Development only, as above
+            'AWS_VIRTUAL_HOSTING': 'FALSE',
+        }
+
+    def remove(self, reference: str):
+        self.client.remove_object(*parse_s3_uri(reference))
+
+    def remove_staged(self, before: datetime) -> int:
+        from minio.deleteobjects import DeleteObject
+        if not self.client.bucket_exists(self.bucket):
+            return 0
+        expired = [
+            DeleteObject(item.object_name)
+            for item in self.client.list_objects(self.bucket, prefix=f"{STAGING_PREFIX}/", recursive=True)
+            if item.last_modified < before
+        ]
+        # remove_objects is lazy: the deletes happen as its errors are read
+        errors = list(self.client.remove_objects(self.bucket, expired))
+        for error in errors:
+            logger.warning(f"Failed to remove staged input {error.name}: {error.message}")
+        return len(expired) - len(errors)
+
+class LocalStorage(Storage):
+    """Objects as files under root; URLs are file:// paths unless base_url is given"""
+
+    def __init__(self, root, base_url: Optional[str] = None):
+        self.root = Path(root).resolve()
+        self.base_url = base_url.rstrip('/') if base_url else None
+
+    def upload(self, local_path: str, object_name: str, content_type: str = 'application/octet-stream') -> str:
+        target = self.root / object_name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(local_path, target)
+        url = f"{self.base_url}/{object_name}" if self.base_url else target.as_uri()
+        logger.info(f"Stored {local_path} at {url}")
+        return url
+
+    def stage(self, local_path: str, object_name: str) -> str:
+        target = self.root / object_name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(local_path, target)
+        return target.as_uri()
+
+    def fetch(self, reference: str, local_path: str):
+        shutil.copyfile(self.gdal_path(reference), local_path)
+
+    def gdal_path(self, reference: str) -> str:
+        return url2pathname(urlparse(reference).path)
+
+    def remove(self, reference: str):
+        Path(self.gdal_path(reference)).unlink(missing_ok=True)
+
+    def remove_staged(self, before: datetime) -> int:
+        staging = self.root / STAGING_PREFIX
+        if not staging.is_dir():
+            return 0
+        cutoff = before.timestamp()
+        removed = 0
+        # Ages are read up front: deleting a file touches its directory's mtime.
+        # Deepest paths first, so a job's directory is empty by the time it is reached
+        entries = [(path, path.stat().st_mtime) for path in sorted(staging.rglob('*'), reverse=True)]
+        for path, mtime in entries:
+            if mtime >= cutoff:
+                continue
+            if path.is_dir():
+                if not any(path.iterdir()):
+                    path.rmdir()
+            else:
+                path.unlink()
+                removed += 1
+        return removed
+
+_storage: Optional[Storage] = None
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        backend = os.getenv('STORAGE_BACKEND', 'minio').lower()
+        if backend == 'local':
+            _storage = LocalStorage(os.getenv('LOCAL_STORAGE_DIR', './storage'), os.getenv('LOCAL_STORAGE_URL'))
+        elif backend == 'minio':
+            _storage = MinioStorage()
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    return _storage
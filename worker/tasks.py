@@ -7,300 +7,360 @@ import os
 import json
 import tempfile
 import shutil
+from contextlib import contextmanager
 from pathlib import Path
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, Optional
 
-import rasterio
-import numpy as np
-from rasterio.warp import transform_bounds, calculate_default_transform
-from rasterio.enums import Resampling
-from PIL import Image
-import pyproj
-from minio import Minio
-from minio.error import S3Error
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import structlog
 
-from celery import Celery
+from celery import signals
 from celery.exceptions import Retry
-import celeryconfig
-
-# Initialize Celery
-app = Celery('binaa_processing')
-app.config_from_object(celeryconfig)
+import inputs
+import jobstore
+import metrics
+from metrics import request_header
+import retention
+import signatures
+import tracing
+from signatures import app
+from storage import get_storage
+from raster_engine import events, scratch
+from raster_engine.archive import choose_geotiff, extract_geotiff, vsizip_path
+from raster_engine.cog import DEFAULT_SETTINGS as DEFAULT_COG_SETTINGS, write_cog
+from raster_engine.cog_tuning import cog_settings
+from raster_engine.engine import ProcessOptions, process_raster
+from raster_engine.memprofile import ENABLED as MEMPROFILE_ALL_JOBS, MemoryProfile, memory_profile
+from raster_engine.quicklook import quicklook_options
+from raster_engine.thumbnails import SIZES as THUMBNAIL_SIZES, make_thumbnails
 
 # Setup structured logging
 logger = structlog.get_logger()
 
+# Queue wait, duration, failure and in-flight metrics for every task
+metrics.connect_worker_signals()
+
+# Continue the dispatcher's trace (TRACING_EXPORTER); engine stages become spans
+tracing.set_service_name('binaa-worker')
+tracing.connect_worker_signals()
+events.add_stage_hook(lambda stage: tracing.span(f"raster.{stage}"))
+
+# Memory profiles of running jobs, rewritten every few seconds; a worker process
+# killed mid-job (out of memory) leaves its profile here for the next one to publish
+MEMPROFILE_DIR = Path(os.getenv('RASTER_MEMPROFILE_DIR') or Path(tempfile.gettempdir()) / 'raster_memprofile')
+
+@signals.worker_process_init.connect
+def remove_stale_scratch(**_):
+    """Scratch files of a child killed mid-job (e.g. a cancelled task) outlive it; drop them"""
+    removed = scratch.sweep()
+    if removed:
+        logger.info(f"Removed {removed} stale scratch files")
+
 # Configuration from environment
 DATABASE_URL = os.getenv('DATABASE_URL')
-MINIO_ENDPOINT = os.getenv('MINIO_ENDPOINT', 'localhost:9000')
-MINIO_ACCESS_KEY = os.getenv('MINIO_ACCESS_KEY', 'minioadmin')
-MINIO_SECRET_KEY = os.getenv('MINIO_SECRET_KEY', 'minioadmin123')
-BUCKET_NAME = os.getenv('MINIO_BUCKET', 'binaa-layers')
 
-# Initialize MinIO client
-minio_client = Minio(
-    MINIO_ENDPOINT,
-    access_key=MINIO_ACCESS_KEY,
-    secret_key=MINIO_SECRET_KEY,
-    secure=False  # Development only
-)
-
-def ensure_bucket_exists():
-    """Ensure the MinIO bucket exists"""
-    try:
-        if not minio_client.bucket_exists(BUCKET_NAME):
-            minio_client.make_bucket(BUCKET_NAME)
-            logger.info(f"Created bucket: {BUCKET_NAME}")
-    except S3Error as e:
-        logger.error(f"Error creating bucket: {e}")
-        raise
+# Job state (JOB_STORE) and output storage (STORAGE_BACKEND); both default to Postgres/MinIO
+job_store = jobstore.from_env(DATABASE_URL)
 
 def update_job_status(job_id: str, status: str, progress: int = 0, metadata: Optional[Dict] = None):
     """Update job status in database"""
     try:
-        with psycopg2.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO processing_jobs (id, status, progress, metadata, updated_at)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (id) DO UPDATE SET
-                        status = EXCLUDED.status,
-                        progress = EXCLUDED.progress,
-                        metadata = EXCLUDED.metadata,
-                        updated_at = EXCLUDED.updated_at
-                """, (job_id, status, progress, json.dumps(metadata or {}), datetime.now(timezone.utc)))
-                conn.commit()
+        job_store.update_job(job_id, status, progress, metadata or {})
     except Exception as e:
         logger.error(f"Failed to update job status: {e}")
 
-def upload_to_minio(local_path: str, object_name: str) -> str:
-    """Upload file to MinIO and return URL"""
+def upload_to_minio(local_path: str, object_name: str, content_type: str = 'application/octet-stream') -> str:
+    """Upload file to the layer storage (MinIO unless STORAGE_BACKEND says otherwise) and return URL"""
+    with tracing.span('storage.upload', kind='client', object=object_name, bytes=os.path.getsize(local_path)):
+        return get_storage().upload(local_path, object_name, content_type)
+
+def publish_memory_profile(report: Optional[Dict[str, Any]], layer_id: str) -> Dict[str, Any]:
+    """Upload a memory profile next to the layer outputs; returns the job metadata entries for it"""
+    if not report:
+        return {}
     try:
-        ensure_bucket_exists()
-        minio_client.fput_object(BUCKET_NAME, object_name, local_path)
-        # Generate public URL (development)
-        url = f"http://{MINIO_ENDPOINT}/{BUCKET_NAME}/{object_name}"
-        logger.info(f"Uploaded {local_path} to {url}")
-        return url
-    except S3Error as e:
-        logger.error(f"MinIO upload failed: {e}")
-        raise
+        with tempfile.TemporaryDirectory() as temp_dir:
+            report_path = Path(temp_dir) / 'memory_profile.json'
+            report_path.write_text(json.dumps(report, indent=2))
+            url = upload_to_minio(str(report_path), f"layers/{layer_id}/memory_profile.json", 'application/json')
+    except Exception as e:
+        logger.warning(f"Memory profile upload failed for layer {layer_id}: {e}")
+        return {}
+    return {'memory_profile_url': url, 'peak_rss_mb': report['peak_rss_mb']}
+
+@contextmanager
+def job_memory_profile(task, job_id: str, layer_id: str):
+    """
+    Memory profile of a task when RASTER_MEMPROFILE is set or the job was enqueued
+    with memory_profile; yields the running MemoryProfile or None
+    """
+    if not (MEMPROFILE_ALL_JOBS or request_header(task, 'memory_profile')):
+        yield None
+        return
+    MEMPROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    spool_path = MEMPROFILE_DIR / f"{os.getpid()}_{job_id}.json"
+    info = {'job_id': job_id, 'layer_id': layer_id, 'task': task.name}
+    try:
+        with memory_profile(True, spool_path=str(spool_path), info=info) as profile:
+            yield profile
+    finally:
+        spool_path.unlink(missing_ok=True)
+
+@signals.worker_process_init.connect
+def recover_memory_profiles(**_):
+    """Publish the profiles of jobs whose worker process died, and link them from the job"""
+    for path in MEMPROFILE_DIR.glob('*.json'):
+        pid = path.name.split('_', 1)[0]
+        if not pid.isdigit() or scratch.process_alive(int(pid)):
+            continue
+        # Sibling processes start together; the rename decides which one publishes it
+        claimed = path.with_name(f"{path.name}.{os.getpid()}")
+        try:
+            path.rename(claimed)
+            report = json.loads(claimed.read_text())
+        except (OSError, ValueError):
+            continue
+        finally:
+            claimed.unlink(missing_ok=True)
+        
+        job_id = report.get('job_id')
+        entries = publish_memory_profile(report, report.get('layer_id'))
+        job = job_store.get_job(job_id) if entries else None
+        if job:
+            update_job_status(job_id, job['status'], job['progress'], {**(job.get('metadata') or {}), **entries})
+        logger.warning(
+            f"Worker process {pid} died during job {job_id} (RSS {report.get('end_rss_mb')} MB at the last sample); "
+            f"memory profile: {entries.get('memory_profile_url')}"
+        )
 
-@app.task(bind=True, name='tasks.process_geotiff')
+# Preview: reprojected to WGS84 so it overlays the map at bounds_wgs84
+PREVIEW_OPTIONS = ProcessOptions(target_crs='EPSG:4326', stretch='minmax', ignore_zero=False, color_mode='auto', max_size=2048)
+
+def publish_quicklook(job_id: str, input_path: str, layer_id: str) -> Dict[str, Any]:
+    """
+    Render a small WGS84 quick-look from overviews/decimated reads, upload it and
+    mark the job preview_ready; returns the published metadata ({} on failure)
+    """
+    try:
+        with tracing.span('quicklook'), tempfile.TemporaryDirectory() as temp_dir:
+            quicklook_raster, quicklook = process_raster(
+                input_path, temp_dir, f"{layer_id}_quicklook", quicklook_options(PREVIEW_OPTIONS)
+            )
+            quicklook_url = upload_to_minio(
+                quicklook['path'], f"layers/{layer_id}/{quicklook['filename']}", quicklook['mime_type']
+            )
+    except Exception as e:
+        # The full pipeline still runs; the user just waits for it
+        logger.warning(f"Quick-look failed for job {job_id}: {e}")
+        return {}
+    
+    metadata = {
+        'quicklook_url': quicklook_url,
+        'bounds_wgs84': quicklook_raster.leaflet_bounds,  # Leaflet format
+        'width': quicklook_raster.source['width'],
+        'height': quicklook_raster.source['height'],
+        'crs': quicklook_raster.source['crs'],
+    }
+    update_job_status(job_id, 'preview_ready', 20, metadata)
+    logger.info(f"Quick-look published for job {job_id}")
+    return metadata
+
+def run_geotiff_pipeline(
+    job_id: str,
+    input_file_path: str,
+    layer_id: str,
+    original_filename: str,
+    quicklook: Optional[Dict[str, Any]] = None,
+    memory: Optional[MemoryProfile] = None,
+) -> Dict[str, Any]:
+    """COG, preview, upload and metadata for one raster; shared by both processing tasks"""
+    # Progress updates keep a published quick-look visible until the full outputs replace it
+    status = 'preview_ready' if quicklook else 'processing'
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        
+        # Step 1: Convert to COG format
+        # Compression/predictor/block size tuned on sample windows when RASTER_COG_TUNING is set
+        cog_path = temp_path / f"{layer_id}.tif"
+        try:
+            with tracing.span('cog.tune'):
+                settings, cog_encoding = cog_settings(input_file_path)
+        except Exception as e:
+            logger.warning(f"COG tuning failed for job {job_id}, using defaults: {e}")
+            settings, cog_encoding = DEFAULT_COG_SETTINGS, {**DEFAULT_COG_SETTINGS.as_dict(), 'tuned': False}
+        with tracing.span('cog.write', compress=settings.compress, blocksize=settings.blocksize):
+            write_cog(input_file_path, str(cog_path), settings)
+        
+        update_job_status(job_id, status, 50, quicklook)
+        
+        # Step 2: Create preview image and WGS84 bounds
+        with tracing.span('preview'):
+            preview_raster, preview = process_raster(input_file_path, temp_dir, layer_id, PREVIEW_OPTIONS)
+        source = preview_raster.source
+        logger.info(f"Input raster: {source}")
+        
+        update_job_status(job_id, status, 75, quicklook)
+        
+        # Step 3: Upload COG, preview and thumbnails to MinIO
+        cog_url = upload_to_minio(str(cog_path), f"layers/{layer_id}/{layer_id}.tif")
+        png_url = upload_to_minio(
+            preview['path'], f"layers/{layer_id}/{preview['filename']}", preview['mime_type']
+        )
+        thumbnails = [
+            {
+                'size': level['size'],
+                'width': level['width'],
+                'height': level['height'],
+                'url': upload_to_minio(level['path'], f"layers/{layer_id}/thumbnails/{level['filename']}", level['mime_type']),
+            }
+            for level in make_thumbnails(preview_raster.image, temp_dir, layer_id)
+        ]
+        # Sizes the preview already satisfies point at the preview itself
+        thumbnails += [
+            {'size': size, 'width': preview_raster.width, 'height': preview_raster.height, 'url': png_url}
+            for size in THUMBNAIL_SIZES
+            if size >= max(preview_raster.width, preview_raster.height)
+        ]
+        thumbnails.sort(key=lambda level: level['size'])
+        
+        # Step 4: Create metadata
+        metadata = {
+            'success': True,
+            'layer_id': layer_id,
+            'original_filename': original_filename,
+            'cog_url': cog_url,
+            'cog_encoding': cog_encoding,
+            'png_url': png_url,
+            'image_format': preview['format'],
+            'image_mime_type': preview['mime_type'],
+            'image_encoding': {key: preview[key] for key in ('lossless', 'quality', 'png_compress_level', 'bytes', 'encode_seconds')},
+            'thumbnails': thumbnails,  # smallest first
+            'quicklook_url': (quicklook or {}).get('quicklook_url'),
+            'bounds_wgs84': preview_raster.leaflet_bounds,  # Leaflet format
+            'width': source['width'],
+            'height': source['height'],
+            'crs': source['crs'],
+            'processed_at': datetime.now(timezone.utc).isoformat(),
+            'job_id': job_id,
+            'trace_id': tracing.current_trace_id(),
+            # The heavy steps are done; the profile keeps running until the task ends
+            **publish_memory_profile(memory and memory.report(), layer_id),
+        }
+        
+        # Step 5: Upload metadata
+        metadata_path = temp_path / 'metadata.json'
+        with open(metadata_path, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        
+        metadata_url = upload_to_minio(str(metadata_path), f"layers/{layer_id}/metadata.json", 'application/json')
+        metadata['metadata_url'] = metadata_url
+        
+        update_job_status(job_id, 'completed', 100, metadata)
+        return metadata
+
+@app.task(bind=True, name=signatures.PROCESS_GEOTIFF)
 def process_geotiff(self, job_id: str, input_file_path: str, layer_id: str, original_filename: str):
     """
     Process GeoTIFF file to COG format with PNG preview
     معالجة ملف GeoTIFF إلى تنسيق COG مع معاينة PNG
     """
-    try:
-        logger.info(f"Starting GeoTIFF processing for job {job_id}")
-        update_job_status(job_id, 'processing', 10)
+    with job_memory_profile(self, job_id, layer_id) as memory:
+        try:
+            logger.info(f"Starting GeoTIFF processing for job {job_id}")
+            update_job_status(job_id, 'processing', 10)
+        
+            # Local upload, or a staged input streamed from the storage (or its node cache)
+            with inputs.open_input(input_file_path) as input_path:
+                quicklook = publish_quicklook(job_id, input_path, layer_id)
+                metadata = run_geotiff_pipeline(job_id, input_path, layer_id, original_filename, quicklook, memory)
+            inputs.discard(input_file_path)
         
-        # Create temporary working directory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            
-            # Step 1: Validate input file
-            with rasterio.open(input_file_path) as src:
-                logger.info(f"Input raster: {src.profile}")
-                bounds = src.bounds
-                crs = src.crs
-                width = src.width
-                height = src.height
-                
-            update_job_status(job_id, 'processing', 25)
-            
-            # Step 2: Convert to COG format
-            cog_path = temp_path / f"{layer_id}.tif"
-            self.create_cog(input_file_path, str(cog_path))
-            
-            update_job_status(job_id, 'processing', 50)
-            
-            # Step 3: Create PNG preview
-            png_path = temp_path / f"{layer_id}.png"
-            self.create_png_preview(input_file_path, str(png_path))
-            
-            update_job_status(job_id, 'processing', 75)
-            
-            # Step 4: Calculate WGS84 bounds
-            if crs != 'EPSG:4326':
-                transformer = pyproj.Transformer.from_crs(crs, 'EPSG:4326', always_xy=True)
-                west, south = transformer.transform(bounds.left, bounds.bottom)
-                east, north = transformer.transform(bounds.right, bounds.top)
-                wgs84_bounds = [[south, west], [north, east]]  # Leaflet format
-            else:
-                wgs84_bounds = [[bounds.bottom, bounds.left], [bounds.top, bounds.right]]
-            
-            # Step 5: Upload to MinIO
-            cog_url = upload_to_minio(str(cog_path), f"layers/{layer_id}/{layer_id}.tif")
-            png_url = upload_to_minio(str(png_path), f"layers/{layer_id}/{layer_id}.png")
-            
-            # Step 6: Create metadata
-            metadata = {
-                'success': True,
-                'layer_id': layer_id,
-                'original_filename': original_filename,
-                'cog_url': cog_url,
-                'png_url': png_url,
-                'bounds_wgs84': wgs84_bounds,
-                'width': width,
-                'height': height,
-                'crs': str(crs),
-                'processed_at': datetime.now(timezone.utc).isoformat(),
-                'job_id': job_id
-            }
-            
-            # Step 7: Upload metadata
-            metadata_path = temp_path / 'metadata.json'
-            with open(metadata_path, 'w') as f:
-                json.dump(metadata, f, indent=2)
-            
-            metadata_url = upload_to_minio(str(metadata_path), f"layers/{layer_id}/metadata.json")
-            metadata['metadata_url'] = metadata_url
-            
-            update_job_status(job_id, 'completed', 100, metadata)
-            
             logger.info(f"GeoTIFF processing completed for job {job_id}")
             return metadata
             
-    except Exception as e:
-        logger.error(f"GeoTIFF processing failed for job {job_id}: {e}")
-        update_job_status(job_id, 'failed', 0, {'error': str(e)})
-        raise
-
-    def create_cog(self, input_path: str, output_path: str):
-        """Create Cloud Optimized GeoTIFF"""
-        with rasterio.open(input_path) as src:
-            profile = src.profile.copy()
-            
-            # COG optimization settings
-            profile.update({
-                'driver': 'GTiff',
-                'compress': 'deflate',
-                'tiled': True,
-                'blockxsize': 512,
-                'blockysize': 512,
-                'BIGTIFF': 'IF_SAFER'
-            })
-            
-            with rasterio.open(output_path, 'w', **profile) as dst:
-                for i in range(1, src.count + 1):
-                    dst.write(src.read(i), i)
-                    
-                # Add overviews
-                factors = [2, 4, 8, 16]
-                dst.build_overviews(factors, Resampling.average)
-                dst.update_tags(ns='rio_overview', resampling='average')
-
-    def create_png_preview(self, input_path: str, output_path: str):
-        """Create PNG preview image"""
-        with rasterio.open(input_path) as src:
-            # Read and scale data
-            data = src.read()
-            
-            # Handle different band configurations
-            if data.shape[0] == 1:  # Single band
-                img_data = data[0]
-                # Normalize to 0-255
-                img_data = ((img_data - img_data.min()) / (img_data.max() - img_data.min()) * 255).astype(np.uint8)
-                img = Image.fromarray(img_data, mode='L')
-            elif data.shape[0] >= 3:  # RGB or more
-                # Take first 3 bands as RGB
-                rgb_data = data[:3].transpose(1, 2, 0)
-                # Normalize each band
-                for i in range(3):
-                    band = rgb_data[:, :, i]
-                    rgb_data[:, :, i] = ((band - band.min()) / (band.max() - band.min()) * 255).astype(np.uint8)
-                img = Image.fromarray(rgb_data.astype(np.uint8), mode='RGB')
-            
-            # Resize if too large (max 2048px)
-            if max(img.size) > 2048:
-                img.thumbnail((2048, 2048), Image.Resampling.LANCZOS)
-            
-            img.save(output_path, 'PNG', optimize=True)
+        except Exception as e:
+            logger.error(f"GeoTIFF processing failed for job {job_id}: {e}")
+            update_job_status(job_id, 'failed', 0, {'error': str(e), **publish_memory_profile(memory and memory.report(), layer_id)})
+            # The failure is final (no retries), so the staged input is not needed again
+            inputs.discard(input_file_path)
+            raise
 
-@app.task(bind=True, name='tasks.process_zip_archive')
+@app.task(bind=True, name=signatures.PROCESS_ZIP_ARCHIVE)
 def process_zip_archive(self, job_id: str, input_file_path: str, layer_id: str, original_filename: str):
     """
     Process ZIP archive containing geospatial files
     معالجة أرشيف ZIP يحتوي على ملفات جغرافية مكانية
     """
-    try:
-        logger.info(f"Starting ZIP processing for job {job_id}")
-        update_job_status(job_id, 'processing', 10)
+    with job_memory_profile(self, job_id, layer_id) as memory:
+        try:
+            logger.info(f"Starting ZIP processing for job {job_id}")
+            update_job_status(job_id, 'processing', 10)
         
-        # Extract and find GeoTIFF files
-        import zipfile
-        with tempfile.TemporaryDirectory() as extract_dir:
-            with zipfile.ZipFile(input_file_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
-            
-            # Find the main GeoTIFF file
-            geotiff_files = list(Path(extract_dir).rglob('*.tif')) + list(Path(extract_dir).rglob('*.tiff'))
+            # zipfile needs a local file, so staged archives are downloaded
+            with inputs.open_input(input_file_path, local=True) as archive_path:
+                # Quick-look straight from the archive, before the slow extraction
+                member = choose_geotiff(archive_path, largest=True).filename
+                quicklook = publish_quicklook(job_id, vsizip_path(archive_path, member), layer_id)
             
-            if not geotiff_files:
-                raise ValueError("No GeoTIFF files found in archive")
-            
-            # Process the first (or largest) GeoTIFF
-            main_tiff = max(geotiff_files, key=lambda x: x.stat().st_size)
-            
-            update_job_status(job_id, 'processing', 30)
-            
-            # Delegate to GeoTIFF processor
-            return process_geotiff.apply_async(
-                args=[job_id, str(main_tiff), layer_id, original_filename],
-                task_id=f"{job_id}_geotiff"
-            ).get()
+                # Extract only the largest GeoTIFF (and its sidecar files)
+                with extract_geotiff(archive_path, member=member) as main_tiff:
+                    update_job_status(job_id, 'preview_ready' if quicklook else 'processing', 30, quicklook)
+                
+                    # Run the GeoTIFF pipeline in this worker instead of waiting on a second task
+                    metadata = run_geotiff_pipeline(job_id, str(main_tiff), layer_id, original_filename, quicklook, memory)
+            inputs.discard(input_file_path)
+        
+            logger.info(f"ZIP processing completed for job {job_id}")
+            return metadata
             
-    except Exception as e:
-        logger.error(f"ZIP processing failed for job {job_id}: {e}")
-        update_job_status(job_id, 'failed', 0, {'error': str(e)})
-        raise
+        except Exception as e:
+            logger.error(f"ZIP processing failed for job {job_id}: {e}")
+            update_job_status(job_id, 'failed', 0, {'error': str(e), **publish_memory_profile(memory and memory.report(), layer_id)})
+            # The failure is final (no retries), so the staged input is not needed again
+            inputs.discard(input_file_path)
+            raise
 
-@app.task(name='tasks.cleanup_old_jobs')
+@app.task(name=signatures.CLEANUP_OLD_JOBS)
 def cleanup_old_jobs():
-    """Clean up old completed jobs"""
+    """
+    Apply job retention: drop expired partitions, or delete finished jobs in
+    batches; then delete staged inputs older than the retention window
+    """
     try:
-        with psycopg2.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                # Delete jobs older than 7 days
-                cur.execute("""
-                    DELETE FROM processing_jobs 
-                    WHERE status IN ('completed', 'failed') 
-                    AND updated_at < NOW() - INTERVAL '7 days'
-                """)
-                deleted_count = cur.rowcount
-                conn.commit()
-                
-        logger.info(f"Cleaned up {deleted_count} old jobs")
-        return {"deleted_jobs": deleted_count}
+        result = retention.run_retention(DATABASE_URL)
+        # Staged inputs of jobs cancelled mid-run or lost with their worker
+        result['staged_inputs_removed'] = inputs.remove_expired(timedelta(days=retention.RETENTION_DAYS))
+        logger.info(f"Job retention ({result['mode']}): {result}")
+        return result
         
     except Exception as e:
         logger.error(f"Job cleanup failed: {e}")
         raise
 
-@app.task(name='tasks.update_processing_statistics')
+@app.task(name=signatures.UPDATE_PROCESSING_STATISTICS)
 def update_processing_statistics():
     """Update processing statistics for monitoring"""
     try:
         with psycopg2.connect(DATABASE_URL) as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                # Per-minute rollups maintained by trigger (migrations/002)
                 cur.execute("""
                     SELECT 
                         status,
-                        COUNT(*) as count,
-                        AVG(EXTRACT(EPOCH FROM (updated_at - created_at))) as avg_duration
-                    FROM processing_jobs 
-                    WHERE created_at > NOW() - INTERVAL '24 hours'
+                        SUM(job_count) as count,
+                        SUM(total_duration_seconds) / NULLIF(SUM(job_count), 0) as avg_duration
+                    FROM processing_job_rollups 
+                    WHERE bucket > NOW() - INTERVAL '24 hours'
                     GROUP BY status
+                    HAVING SUM(job_count) > 0
                 """)
                 stats = cur.fetchall()
                 
         result = {row['status']: {'count': row['count'], 'avg_duration': row['avg_duration']} for row in stats}
+        metrics.record_job_counts(result)
         logger.info(f"Processing stats: {result}")
         return result
         
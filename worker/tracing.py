@@ -0,0 +1,386 @@
+"""
+Distributed Tracing for Phase 1 Processing Pipeline
+التتبع الموزع لخط معالجة المرحلة الأولى
+
+A job's trace starts in the dispatcher's /enqueue and follows it through the
+broker: the W3C `traceparent` of the publish span travels in the Celery
+message headers next to `enqueued_at`, and the worker continues the trace
+with a `celery.queue_wait` span (enqueue to start) and a `celery.task` span
+(execution). Pipeline stages, storage uploads and job store (Postgres) calls
+become child spans of whatever span is current.
+
+TRACING_EXPORTER selects where finished spans go:
+- 'none' (default): spans are not created at all
+- 'file': one JSON object per line appended to TRACING_FILE
+- 'otlp': batched OTLP/HTTP JSON POSTs to OTEL_EXPORTER_OTLP_ENDPOINT
+  (/v1/traces; Jaeger, Tempo or an OpenTelemetry Collector)
+
+No OpenTelemetry packages are needed. Per-job summaries of a trace file:
+
+    python tracing.py traces.jsonl
+"""
+
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+TRACEPARENT_HEADER = 'traceparent'
+SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'binaa-processing')
+
+class SpanContext(NamedTuple):
+    """Trace and span ids of a span in another process (from a traceparent)"""
+    trace_id: str
+    span_id: str
+
+class Span:
+    def __init__(self, name: str, parent=None, kind: str = 'internal',
+                 start_ns: Optional[int] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.error: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, exc: BaseException):
+        self.error = f"{type(exc).__name__}: {exc}"
+
+    def end(self, end_ns: Optional[int] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        exporter = get_exporter()
+        if exporter:
+            exporter.export(self)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'service': SERVICE_NAME,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'duration_ms': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+class _NoopSpan:
+    """Stands in for a span when tracing is off or there is no trace to join"""
+    traceparent = None
+    trace_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_error(self, exc: BaseException):
+        pass
+
+    def end(self, end_ns: Optional[int] = None):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+# Exporters
+
+class FileExporter:
+    """Appends spans as JSON lines; each worker process opens the file itself"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+
+    def export(self, span: Span):
+        line = json.dumps(span.as_dict(), ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            if self._pid != os.getpid():
+                self._file = open(self.path, 'a', buffering=1, encoding='utf-8')
+                self._pid = os.getpid()
+            self._file.write(line)
+
+    def flush(self):
+        pass
+
+_OTLP_KINDS = {'internal': 1, 'server': 2, 'client': 3, 'producer': 4, 'consumer': 5}
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+def _otlp_span(span: Span) -> Dict[str, Any]:
+    otlp = {
+        'traceId': span.trace_id,
+        'spanId': span.span_id,
+        'name': span.name,
+        'kind': _OTLP_KINDS.get(span.kind, 1),
+        'startTimeUnixNano': str(span.start_ns),
+        'endTimeUnixNano': str(span.end_ns),
+        'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in span.attributes.items()],
+        'status': {'code': 2, 'message': span.error} if span.error else {'code': 0},
+    }
+    if span.parent_id:
+        otlp['parentSpanId'] = span.parent_id
+    return otlp
+
+class OtlpExporter:
+    """Batches spans and POSTs them to an OTLP/HTTP collector from a background thread"""
+
+    def __init__(self, endpoint: str, batch_size: int = 256, interval: float = 5.0):
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: 'queue.Queue[Span]' = queue.Queue(maxsize=batch_size * 16)
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def export(self, span: Span):
+        # The sender thread does not survive a fork; start one per process
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._run, name='trace-exporter', daemon=True).start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass  # Collector unreachable or too slow; drop rather than block the job
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        spans: List[Span] = []
+        while True:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for i in range(0, len(spans), self.batch_size):
+            self._send(spans[i:i + self.batch_size])
+
+    def _send(self, spans: List[Span]):
+        body = {
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': _otlp_value(SERVICE_NAME)}]},
+                'scopeSpans': [{'scope': {'name': 'binaa-processing'}, 'spans': [_otlp_span(s) for s in spans]}],
+            }]
+        }
+        request = urllib.request.Request(
+            self.url, data=json.dumps(body).encode(), headers={'Content-Type': 'application/json'}
+        )
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except Exception as e:
+            logger.warning(f"Trace export to {self.url} failed ({len(spans)} spans dropped): {e}")
+
+_exporter = None
+_configured = False
+
+def get_exporter():
+    """The configured exporter, or None when tracing is off"""
+    global _exporter, _configured
+    if not _configured:
+        kind = os.getenv('TRACING_EXPORTER', 'none').lower()
+        if kind == 'file':
+            _exporter = FileExporter(os.getenv('TRACING_FILE', 'traces.jsonl'))
+        elif kind == 'otlp':
+            _exporter = OtlpExporter(os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', 'http://localhost:4318'))
+            atexit.register(_exporter.flush)
+        elif kind != 'none':
+            raise ValueError(f"Unknown TRACING_EXPORTER: {kind}")
+        _configured = True
+    return _exporter
+
+def set_service_name(name: str):
+    """Name the spans of this process, unless OTEL_SERVICE_NAME already does"""
+    global SERVICE_NAME
+    SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', name)
+
+def flush():
+    exporter = get_exporter()
+    if exporter:
+        exporter.flush()
+
+# Context
+
+_current: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+def current_trace_id() -> Optional[str]:
+    span = _current.get()
+    return span.trace_id if span else None
+
+def start_span(name: str, parent=None, kind: str = 'internal', start_ns: Optional[int] = None, **attributes):
+    """A span that is not made current; the caller ends it (NOOP_SPAN when tracing is off)"""
+    if not get_exporter():
+        return NOOP_SPAN
+    return Span(name, parent, kind, start_ns, attributes)
+
+def activate(span):
+    """Make span the parent of spans started in this context; returns a token for deactivate"""
+    return _current.set(span if isinstance(span, Span) else None)
+
+def deactivate(token):
+    try:
+        _current.reset(token)
+    except ValueError:
+        # Token from another context (signal handlers on a different thread)
+        _current.set(None)
+
+@contextmanager
+def span(name: str, kind: str = 'internal', root: bool = False, **attributes) -> Iterator[Any]:
+    """
+    Child span of the current span around a block. Without a current span the
+    block is not traced unless root=True starts a new trace.
+    """
+    parent = _current.get()
+    if not get_exporter() or (parent is None and not root):
+        yield NOOP_SPAN
+        return
+    current = Span(name, parent, kind, attributes=attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+def inject(headers: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the current span's traceparent to message headers"""
+    span = _current.get()
+    if span:
+        headers[TRACEPARENT_HEADER] = span.traceparent
+    return headers
+
+def extract(traceparent: Optional[str]) -> Optional[SpanContext]:
+    """Parent for spans continuing a trace from a traceparent header (None if absent or malformed)"""
+    if not traceparent:
+        return None
+    parts = traceparent.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return SpanContext(parts[1], parts[2])
+
+# Worker-side instrumentation (Celery signals)
+
+_task_spans: Dict[str, tuple] = {}
+
+def on_task_prerun(task_id=None, task=None, **_):
+    from metrics import request_header
+
+    if not get_exporter():
+        return
+    parent = extract(request_header(task, TRACEPARENT_HEADER))
+    attributes = {'celery.task': task.name, 'celery.task_id': task_id}
+
+    enqueued_at = request_header(task, 'enqueued_at')
+    if enqueued_at:
+        wait = start_span('celery.queue_wait', parent, 'consumer', int(float(enqueued_at) * 1e9), **attributes)
+        wait.end()
+        parent = wait
+        attributes['celery.queue_wait_seconds'] = round(max(0.0, time.time() - float(enqueued_at)), 3)
+
+    task_span = start_span('celery.task', parent, 'consumer', **attributes)
+    _task_spans[task_id] = (task_span, activate(task_span))
+
+def on_task_postrun(task_id=None, state=None, **_):
+    entry = _task_spans.pop(task_id, None)
+    if entry:
+        task_span, token = entry
+        task_span.set_attribute('celery.state', state)
+        deactivate(token)
+        task_span.end()
+        flush()
+
+def on_task_failure(task_id=None, exception=None, **_):
+    entry = _task_spans.get(task_id)
+    if entry and exception is not None:
+        entry[0].record_error(exception)
+
+def connect_worker_signals():
+    """Continue the dispatcher's trace in each task"""
+    from celery import signals
+
+    signals.task_prerun.connect(on_task_prerun, weak=False)
+    signals.task_postrun.connect(on_task_postrun, weak=False)
+    signals.task_failure.connect(on_task_failure, weak=False)
+    signals.worker_process_shutdown.connect(lambda **_: flush(), weak=False)
+
+# Trace file summary
+
+def summarize(path: str) -> List[Dict[str, Any]]:
+    """Per trace: job id, queue wait, task execution and the slowest child spans"""
+    traces: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                traces[record['trace_id']].append(record)
+
+    summaries = []
+    for trace_id, spans in traces.items():
+        by_name = {s['name']: s for s in spans}
+        task = by_name.get('celery.task', {})
+        wait = by_name.get('celery.queue_wait', {})
+        children = sorted(
+            (s for s in spans if s['name'] not in ('celery.task', 'celery.queue_wait') and s['parent_id']),
+            key=lambda s: s['start_ns'],
+        )
+        summaries.append({
+            'trace_id': trace_id,
+            'job_id': task.get('attributes', {}).get('celery.task_id'),
+            'queue_wait_ms': wait.get('duration_ms'),
+            'execution_ms': task.get('duration_ms'),
+            'error': next((s['error'] for s in spans if s.get('error')), None),
+            'spans': [
+                {'name': s['name'], 'service': s['service'], 'duration_ms': s['duration_ms']}
+                for s in children
+            ],
+        })
+    return summaries
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit(f"usage: {sys.argv[0]} TRACE_FILE")
+    for summary in summarize(sys.argv[1]):
+        print(json.dumps(summary, ensure_ascii=False))